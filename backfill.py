@@ -0,0 +1,82 @@
+# backfill.py
+
+"""
+Relleno de urls.target_host / target_host_rev en filas anteriores a esas columnas.
+
+No se hace al importar main: cada worker escanearía la tabla al arrancar.
+- A mano, una vez:  python -m backfill
+- En background desde el lifespan: solo el worker que consigue el lease
+  "backfill_target_hosts" (tabla leases) recorre la tabla; el resto no hace nada.
+
+Las filas sin host válido se guardan con "" (no NULL): no se vuelven a leer.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Optional
+
+import crud
+from database import SessionLocal
+from logger import log_event, logger
+
+LEASE_NAME = "backfill_target_hosts"
+LEASE_SECONDS = 300
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def run() -> Optional[int]:
+    """Rellena las filas pendientes. None si otro proceso tiene el lease."""
+    owner = crud.worker_id()
+    with SessionLocal() as db:
+        if not crud.acquire_lease(db, LEASE_NAME, owner, LEASE_SECONDS):
+            return None
+        completed = False
+        try:
+            total = crud.backfill_target_hosts(
+                db,
+                on_batch=lambda: not _stop.is_set() and crud.renew_lease(db, LEASE_NAME, owner, LEASE_SECONDS),
+            )
+            completed = not _stop.is_set()
+        finally:
+            crud.release_lease(db, LEASE_NAME, owner, completed=completed)
+    if total:
+        log_event("target_hosts_backfill", rows=total, completed=completed)
+    return total
+
+
+def _run_background() -> None:
+    try:
+        run()
+    except Exception:
+        logger.exception("target_host backfill failed")
+
+
+def start_backfill() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run_background, name="target-hosts-backfill", daemon=True)
+    _thread.start()
+
+
+def stop_backfill(timeout: float = 5.0) -> None:
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
+        _thread = None
+
+
+if __name__ == "__main__":
+    import models
+    from database import engine, ensure_sqlite_schema
+
+    models.Base.metadata.create_all(bind=engine)
+    ensure_sqlite_schema(engine)
+    rows = run()
+    print("another process holds the backfill lease" if rows is None else f"{rows} rows backfilled")
+    raise SystemExit(0 if rows is not None else 1)
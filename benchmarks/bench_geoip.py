@@ -0,0 +1,101 @@
+# benchmarks/bench_geoip.py
+
+"""
+Microbenchmark: consultas GeoIP por segundo.
+
+Sobre un flujo de IPs de visitantes con sesgo (pocas redes muy activas y una
+cola larga de IPs únicas) compara:
+
+  reader       : cada consulta va al .mmdb (MODE_MMAP), sin caché
+  lru-ip       : LRU acotada por IP
+  lru-prefix   : LRU acotada por prefijo /24 (IPv4) / /48 (IPv6)
+
+Necesita geoip2 y un GeoLite2-Country.mmdb (GEOIP_MMDB_PATH o --mmdb).
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_geoip [--mmdb PATH] [--lookups N] [--cache-size N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from caches import MISSING, LRUCache
+from config import settings
+from geoip_service import cache_key
+from policy_lists import ip_to_int
+
+
+def _visitor_ips(n: int, seed: int = 7) -> list[str]:
+    rnd = random.Random(seed)
+    hot_nets = [(rnd.randrange(1, 223), rnd.randrange(256), rnd.randrange(256)) for _ in range(2000)]
+    ips = []
+    for _ in range(n):
+        if rnd.random() < 0.7:
+            # redes activas (ISPs / NAT de operadores): distribución sesgada
+            a, b, c = hot_nets[min(int(rnd.paretovariate(1.2)) - 1, len(hot_nets) - 1)]
+            ips.append(f"{a}.{b}.{c}.{rnd.randrange(256)}")
+        else:
+            ips.append(f"{rnd.randrange(1, 223)}.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(256)}")
+    return ips
+
+
+def _open_reader(path: str):
+    import geoip2.database
+    import maxminddb
+
+    return geoip2.database.Reader(path, mode=maxminddb.MODE_MMAP)
+
+
+def _lookup(reader, ip: str):
+    try:
+        return reader.country(ip).country.iso_code
+    except Exception:
+        return None
+
+
+def _run(ips: list[str], reader, cache: LRUCache | None, by_prefix: bool) -> float:
+    t0 = time.perf_counter()
+    for ip in ips:
+        if cache is None:
+            _lookup(reader, ip)
+            continue
+        key = cache_key(ip_to_int(ip), by_prefix)
+        if cache.get(key, MISSING) is MISSING:
+            cache.set(key, _lookup(reader, ip))
+    return len(ips) / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="GeoIP lookup microbenchmark")
+    parser.add_argument("--mmdb", default=settings.geoip_mmdb_path)
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--cache-size", type=int, default=settings.geoip_cache_size)
+    args = parser.parse_args()
+
+    try:
+        reader = _open_reader(args.mmdb)
+    except ImportError:
+        raise SystemExit("geoip2 no está instalado")
+    except FileNotFoundError:
+        raise SystemExit(f"no existe {args.mmdb} (usa --mmdb o GEOIP_MMDB_PATH)")
+
+    ips = _visitor_ips(args.lookups)
+    print(f"{'':12} {'lookups/s':>12} {'hit ratio':>10} {'entries':>8}")
+    for name, cache, by_prefix in (
+        ("reader", None, False),
+        ("lru-ip", LRUCache(args.cache_size), False),
+        ("lru-prefix", LRUCache(args.cache_size), True),
+    ):
+        rate = _run(ips, reader, cache, by_prefix)
+        if cache is None:
+            print(f"{name:12} {rate:12.0f} {'-':>10} {'-':>8}")
+        else:
+            s = cache.stats()
+            print(f"{name:12} {rate:12.0f} {s['hit_ratio']:10.3f} {s['size']:8d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# benchmarks/bench_ip_pipeline.py
+
+"""
+Microbenchmark: IPs en el pipeline de validación de target_url.
+
+Compara, para un host ya cacheado en dns_cache con varias IPs:
+
+  legacy : str -> ipaddress (get_cached) -> str -> ipaddress (decide_by_policy)
+           + seis propiedades is_* por IP
+  packed : (version, int) de extremo a extremo + tabla de rangos precompilada
+
+Mide tiempo por validación, objetos ipaddress creados y pico de memoria
+transitoria (tracemalloc) por validación.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_ip_pipeline [--iterations N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import ipaddress
+import time
+import tracemalloc
+
+import dns_cache
+import target_validation
+from config import settings
+from policy_lists import _lists_mgr, ip_to_int
+
+
+HOST = "bench.example.org"
+IPS = ["93.184.216.34", "151.101.1.69", "2606:2800:220:1:248:1893:25c8:1946", "2a04:4e42::81"]
+
+
+def _legacy_networks(path: str) -> list:
+    # las listas tal y como se guardaban antes: lista de objetos ip_network
+    compiled = _lists_mgr.load(path)
+    nets = []
+    for version, ranges in ((4, compiled.ipv4), (6, compiled.ipv6)):
+        for start, end in zip(ranges.starts, ranges.ends):
+            nets.extend(ipaddress.summarize_address_range(
+                ipaddress.ip_address(start) if version == 4 else ipaddress.IPv6Address(start),
+                ipaddress.ip_address(end) if version == 4 else ipaddress.IPv6Address(end),
+            ))
+    return nets
+
+
+def _make_legacy():
+    cache_entry = list(IPS)
+    allow_nets = _legacy_networks(settings.target_allowlist_path)
+    deny_nets = _legacy_networks(settings.target_denylist_path)
+    deny_policy = (settings.default_target_policy or "allow").lower() == "deny"
+
+    def decide(ip_str: str) -> bool:
+        ip_obj = ipaddress.ip_address(ip_str)
+        if deny_policy:
+            return any(ip_obj in n for n in allow_nets)
+        return not any(ip_obj in n for n in deny_nets)
+
+    def is_blocked(ip) -> bool:
+        return bool(
+            ip.is_private
+            or ip.is_loopback
+            or ip.is_link_local
+            or ip.is_reserved
+            or ip.is_multicast
+            or ip.is_unspecified
+        )
+
+    def validate() -> None:
+        ips = [ipaddress.ip_address(x) for x in cache_entry]
+        for ip in ips:
+            if not decide(str(ip)) or is_blocked(ip):
+                raise RuntimeError("blocked")
+
+    return validate
+
+
+def _make_packed():
+    dns_cache.set_cached(HOST, [ip_to_int(x) for x in IPS], 3600)
+
+    def validate() -> None:
+        ips = dns_cache.get_cached(HOST)
+        for ip in ips:
+            if not target_validation._allowed_ip_by_policy(ip) or target_validation._is_blocked_ip(ip):
+                raise RuntimeError("blocked")
+
+    return validate
+
+
+def _count_ipaddress_objects(fn) -> int:
+    created = 0
+    classes = (ipaddress.IPv4Address, ipaddress.IPv6Address)
+    originals = {cls: cls.__init__ for cls in classes}
+
+    def wrap(orig):
+        def init(self, *args, **kwargs):
+            nonlocal created
+            created += 1
+            orig(self, *args, **kwargs)
+        return init
+
+    for cls in classes:
+        cls.__init__ = wrap(originals[cls])
+    try:
+        fn()
+    finally:
+        for cls in classes:
+            cls.__init__ = originals[cls]
+    return created
+
+
+def _peak_bytes(fn) -> int:
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - base
+
+
+def run(iterations: int) -> dict[str, dict[str, float]]:
+    results = {}
+    for name, fn in (("legacy", _make_legacy()), ("packed", _make_packed())):
+        fn()  # warm-up (carga de listas, cachés)
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - t0
+        results[name] = {
+            "us_per_validation": elapsed / iterations * 1e6,
+            "ipaddress_objects": _count_ipaddress_objects(fn),
+            "peak_transient_bytes": _peak_bytes(fn),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IP pipeline microbenchmark")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    print(f"{'':8} {'us/validation':>14} {'ipaddress objs':>15} {'peak bytes':>11}")
+    for name, r in results.items():
+        print(
+            f"{name:8} {r['us_per_validation']:14.2f} {r['ipaddress_objects']:15d} "
+            f"{r['peak_transient_bytes']:11d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
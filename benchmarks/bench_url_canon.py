@@ -0,0 +1,141 @@
+# benchmarks/bench_url_canon.py
+
+"""
+Microbenchmark: parseo de target_url al crear un link y al validar en el redirect.
+
+  legacy : AnyUrl (schemas) -> str() -> urlsplit + IDNA en target_validation,
+           sin caché (como antes de url_canon)
+  canon  : url_canon.canonicalize, una pasada + LRU (URL e IDNA del host)
+
+Ambos caminos comparten lo que no es parseo (políticas, rangos bloqueados y
+caché DNS, precargada para no depender de la red).
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_url_canon [--iterations N] [--urls N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from urllib.parse import urlsplit
+
+from pydantic import AnyUrl, BaseModel
+
+import dns_cache
+import schemas
+import target_validation
+from config import settings
+from policy_lists import decide_by_policy, ip_to_int
+
+
+HOSTS = ["example.org", "www.Example.COM", "bücher.example", "sub.domain.example.net", "93.184.216.34"]
+IPS = [ip_to_int("93.184.216.34"), ip_to_int("2606:2800:220:1:248:1893:25c8:1946")]
+
+
+class _LegacyURLBase(BaseModel):
+    target_url: AnyUrl
+
+
+def _legacy_normalize_host(host: str) -> str:
+    h = host.strip().strip(".").lower()
+    try:
+        return h.encode("idna").decode("ascii")
+    except Exception:
+        return h
+
+
+def _legacy_check(raw_url: str) -> str:
+    # parseo tal y como lo hacía target_validation antes de url_canon
+    s = str(raw_url).strip()
+    if not s or len(s) > settings.max_target_url_length or any(c in s for c in [" ", "\t", "\n", "\r"]):
+        raise ValueError("bad url")
+    parts = urlsplit(s)
+    if parts.scheme not in {"http", "https"} or not parts.hostname:
+        raise ValueError("bad url")
+    if parts.username is not None or parts.password is not None:
+        raise ValueError("bad url")
+    host_ascii = _legacy_normalize_host(parts.hostname)
+    _check_policy(host_ascii, ip_to_int(host_ascii))
+    return s
+
+
+def _canon_check(raw_url: str) -> str:
+    return target_validation.validate_target_url(raw_url)
+
+
+def _check_policy(host_ascii: str, ip_lit) -> None:
+    # parte común (no es parseo): mismas llamadas en ambos caminos
+    decide_by_policy(
+        default_policy=settings.default_target_policy,
+        allow_path=settings.target_allowlist_path,
+        deny_path=settings.target_denylist_path,
+        host=host_ascii,
+    )
+    for ip in (ip_lit,) if ip_lit is not None else dns_cache.get_cached(host_ascii) or ():
+        target_validation._allowed_ip_by_policy(ip)
+        target_validation._is_blocked_ip(ip)
+
+
+def _urls(n: int) -> list[str]:
+    return [f"https://{HOSTS[i % len(HOSTS)]}/path/{i}?q={i}" for i in range(n)]
+
+
+def _seed_dns() -> None:
+    for host in HOSTS:
+        ascii_host = _legacy_normalize_host(host)
+        if ip_to_int(ascii_host) is None:
+            dns_cache.set_cached(ascii_host, IPS, 3600)
+
+
+def _bench(fn, urls: list[str], iterations: int) -> float:
+    for u in urls:
+        fn(u)  # warm-up
+    t0 = time.perf_counter()
+    done = 0
+    while done < iterations:
+        for u in urls:
+            fn(u)
+        done += len(urls)
+    return done / (time.perf_counter() - t0)
+
+
+def run(iterations: int, n_urls: int) -> dict[str, dict[str, float]]:
+    _seed_dns()
+    urls = _urls(n_urls)
+
+    def legacy_create(u: str) -> None:
+        _legacy_check(str(_LegacyURLBase(target_url=u).target_url))
+
+    def canon_create(u: str) -> None:
+        _canon_check(schemas.URLBase(target_url=u).target_url)
+
+    # en el redirect se valida la URL ya guardada
+    stored = [schemas.URLBase(target_url=u).target_url for u in urls]
+
+    return {
+        "create": {
+            "legacy": _bench(legacy_create, urls, iterations),
+            "canon": _bench(canon_create, urls, iterations),
+        },
+        "redirect": {
+            "legacy": _bench(_legacy_check, stored, iterations),
+            "canon": _bench(_canon_check, stored, iterations),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="target_url canonicalizer microbenchmark")
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--urls", type=int, default=1000, help="URLs distintas (working set)")
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.urls)
+    print(f"{'':10} {'legacy ops/s':>14} {'canon ops/s':>14} {'speedup':>8}")
+    for phase, r in results.items():
+        print(f"{phase:10} {r['legacy']:14.0f} {r['canon']:14.0f} {r['canon'] / r['legacy']:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# benchmarks/replay.py
+
+"""
+Reproduce tráfico real a partir de logs de redirect.
+
+Lee las líneas {"event":"redirect",...} de logger (también el formato antiguo,
+con el JSON anidado sin escapar), crea una BD SQLite temporal con links que
+reproducen lo que pasó (las claves con 404 no se crean, las de 410 se crean
+caducadas) y lanza los mismos GET contra la app en proceso (httpx +
+ASGITransport, con el lifespan arrancado), respetando los tiempos del log
+divididos por --speedup (0 = lo más rápido posible).
+
+Informa por endpoint y status: latencia (p50/p90/p99/máx), throughput y
+consultas SQL por request (las de los hilos de fondo van aparte).
+
+Sin logs a mano, --synthetic N genera N redirects con popularidad Zipf, ráfagas
+y un 5% de claves inexistentes.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.replay redirects.log [--speedup 10] [--concurrency 64] [--json]
+    python -m benchmarks.replay --synthetic 20000 --speedup 0
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+
+@dataclass
+class LoggedRedirect:
+    ts: float
+    key: str
+    status: int | None
+    ip: str | None
+    ua: str | None
+
+
+_TIME_FMT = "%Y-%m-%d %H:%M:%S,%f"
+# formato antiguo: {"time":"...","msg":"{"event":"redirect","ip":"..","ua":"..","key":".."}"}
+_LEGACY_RE = re.compile(r'"time":"([^"]+)".*"event":"redirect".*"ip":"([^"]*)".*"ua":"(.*)","key":"([^"]*)"')
+
+
+def _parse_time(value: str) -> float:
+    try:
+        return datetime.strptime(value, _TIME_FMT).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_log(lines) -> list[LoggedRedirect]:
+    out = []
+    for line in lines:
+        if '"redirect"' not in line:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            m = _LEGACY_RE.search(line)
+            if m:
+                out.append(LoggedRedirect(_parse_time(m.group(1)), m.group(4), None, m.group(2), m.group(3)))
+            continue
+        if entry.get("event") != "redirect" or not entry.get("key"):
+            continue
+        out.append(
+            LoggedRedirect(
+                _parse_time(entry.get("time")),
+                entry["key"],
+                entry.get("status"),
+                entry.get("ip"),
+                entry.get("ua"),
+            )
+        )
+    out.sort(key=lambda r: r.ts)
+    return out
+
+
+def synthetic_log(n: int, *, links: int = 5000, seed: int = 11) -> list[LoggedRedirect]:
+    """Zipf (s≈1.1) sobre `links` claves, ráfagas sobre un link y 5% de claves malas."""
+    rnd = random.Random(seed)
+    weights = [1 / (i + 1) ** 1.1 for i in range(links)]
+    keys = [f"K{i:07d}" for i in range(links)]
+    uas = ["Mozilla/5.0 (Windows NT 10.0) Chrome/120", "Mozilla/5.0 (iPhone) Mobile Safari", "Slackbot-LinkExpanding 1.0"]
+    out, ts = [], 1_700_000_000.0
+    while len(out) < n:
+        if rnd.random() < 0.01:
+            # ráfaga: un link se comparte y recibe cientos de clicks en segundos
+            key = rnd.choice(keys)
+            for _ in range(min(rnd.randrange(50, 400), n - len(out))):
+                ts += rnd.expovariate(200)
+                out.append(LoggedRedirect(ts, key, 307, f"10.{rnd.randrange(256)}.{rnd.randrange(256)}.1", rnd.choice(uas)))
+            continue
+        ts += rnd.expovariate(50)
+        if rnd.random() < 0.05:
+            out.append(LoggedRedirect(ts, f"BAD{rnd.randrange(10**6)}", 404, "10.0.0.1", uas[0]))
+        else:
+            key = rnd.choices(keys, weights)[0]
+            status = 410 if key.endswith("7") and rnd.random() < 0.5 else 307
+            out.append(LoggedRedirect(ts, key, status, f"10.{rnd.randrange(256)}.{rnd.randrange(256)}.1", rnd.choice(uas)))
+    return out
+
+
+def _prepare_env(db_path: str) -> None:
+    # antes de importar la app: engine, rate limit, DNS y GeoIP de la réplica
+    os.environ["DB_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("RESOLVE_DNS", "false")
+    os.environ.setdefault("RATE_LIMIT_MAX_REQUESTS", str(10**9))
+    os.environ.setdefault("LOG_SAMPLE_RATES", "redirect=0")
+
+
+def seed_links(records: list[LoggedRedirect]) -> int:
+    """Crea un link por clave vista (salvo 404); caducado si el log dio 410."""
+    from sqlalchemy import insert
+
+    import models
+    from database import SessionLocal
+
+    statuses: dict[str, set] = defaultdict(set)
+    for r in records:
+        statuses[r.key].add(r.status)
+    now = datetime.utcnow()
+    rows = []
+    for i, (key, seen) in enumerate(statuses.items()):
+        if seen == {404}:
+            continue
+        expired = 410 in seen and not seen & {301, 302, 307, 308}
+        rows.append(
+            {
+                "key": key,
+                "secret_key": f"replay-secret-{i}",
+                "target_url": f"https://example.com/{key}",
+                "target_host": "example.com",
+                "target_host_rev": "com.example",
+                "is_active": True,
+                "clicks": 0,
+                "expires_at": now - timedelta(days=1) if expired else now + timedelta(days=365),
+                "created_at": now,
+            }
+        )
+    with SessionLocal() as db:
+        for start in range(0, len(rows), 5000):
+            db.execute(insert(models.URL), rows[start : start + 5000])
+        db.commit()
+    return len(rows)
+
+
+# contador de consultas del request en curso (el contexto se copia al
+# threadpool de los endpoints sync, así que ven la misma lista)
+_current = contextvars.ContextVar("replay_queries", default=None)
+
+
+def _count_queries(engine, background: list[int]) -> None:
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        (_current.get() or background)[0] += 1
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+async def replay(records: list[LoggedRedirect], *, speedup: float, concurrency: int) -> dict:
+    import httpx
+
+    import main
+    from database import engine
+
+    background = [0]
+    _count_queries(engine, background)
+    latencies: dict[str, list[float]] = defaultdict(list)
+    queries: Counter = Counter()
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(client, rec: LoggedRedirect) -> None:
+        headers = {"user-agent": rec.ua or ""}
+        if rec.ip:
+            headers["x-forwarded-for"] = rec.ip
+        async with sem:
+            t0 = time.perf_counter()
+            counter = [0]
+            token = _current.set(counter)
+            try:
+                resp = await client.get(f"/{rec.key}", headers=headers, follow_redirects=False)
+                status = resp.status_code
+            except Exception:
+                status = 599
+            finally:
+                _current.reset(token)
+            name = f"GET /{{url_key}} {status}"
+            latencies[name].append((time.perf_counter() - t0) * 1000)
+            queries[name] += counter[0]
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+            start = time.perf_counter()
+            t_first = records[0].ts if records else 0.0
+            tasks = []
+            for rec in records:
+                if speedup > 0:
+                    delay = (rec.ts - t_first) / speedup - (time.perf_counter() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(one(client, rec)))
+            await asyncio.gather(*tasks)
+            wall = time.perf_counter() - start
+
+    by_endpoint: dict[str, dict] = {}
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        by_endpoint[name] = {
+            "requests": len(values),
+            "p50_ms": round(_percentile(values, 0.50), 3),
+            "p90_ms": round(_percentile(values, 0.90), 3),
+            "p99_ms": round(_percentile(values, 0.99), 3),
+            "max_ms": round(values[-1], 3),
+            "queries_per_request": round(queries[name] / len(values), 2),
+        }
+    return {
+        "requests": len(records),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(records) / wall, 1) if wall else 0.0,
+        "speedup": speedup,
+        "endpoints": by_endpoint,
+        "background_queries": background[0],
+    }
+
+
+def _print_report(report: dict) -> None:
+    print(
+        f"{report['requests']} requests en {report['wall_seconds']} s "
+        f"({report['throughput_rps']} req/s, speedup {report['speedup']})"
+    )
+    print(f"{'endpoint':28} {'n':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'q/req':>6}")
+    for name, row in report["endpoints"].items():
+        print(
+            f"{name:28} {row['requests']:7d} {row['p50_ms']:8.2f} {row['p90_ms']:8.2f} "
+            f"{row['p99_ms']:8.2f} {row['max_ms']:8.2f} {row['queries_per_request']:6.2f}"
+        )
+    print(f"consultas en hilos de fondo: {report['background_queries']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay de logs de redirect contra la app en proceso")
+    parser.add_argument("log", nargs="?", help="fichero de log (por defecto stdin)")
+    parser.add_argument("--synthetic", type=int, default=0, help="generar N redirects en vez de leer un log")
+    parser.add_argument("--speedup", type=float, default=10.0, help="factor sobre los tiempos del log (0 = sin esperas)")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--limit", type=int, default=0, help="solo los N primeros redirects")
+    parser.add_argument("--db", help="ruta del SQLite de la réplica (por defecto, uno temporal)")
+    parser.add_argument("--json", action="store_true", help="informe en JSON")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        records = synthetic_log(args.synthetic)
+    elif args.log:
+        with open(args.log, encoding="utf-8", errors="replace") as fh:
+            records = parse_log(fh)
+    else:
+        records = parse_log(sys.stdin)
+    if args.limit:
+        records = records[: args.limit]
+    if not records:
+        raise SystemExit("no hay redirects que reproducir")
+
+    tmpdir = None
+    db_path = args.db
+    if not db_path:
+        tmpdir = tempfile.TemporaryDirectory(prefix="replay-")
+        db_path = os.path.join(tmpdir.name, "replay.db")
+    _prepare_env(db_path)
+
+    import main as app_main  # noqa: F401  (crea el esquema)
+
+    seeded = seed_links(records)
+    print(f"{seeded} links creados en {db_path}", file=sys.stderr)
+
+    report = asyncio.run(replay(records, speedup=args.speedup, concurrency=args.concurrency))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
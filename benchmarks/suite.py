@@ -0,0 +1,355 @@
+# benchmarks/suite.py
+
+"""
+Suite de benchmarks de los caminos calientes, con baseline y comparación.
+
+Corre en proceso contra una BD SQLite temporal, con DNS y GeoIP simulados
+(resolve_host devuelve IPs fijas; GeoIP devuelve siempre "ES"):
+
+  redirect.verdict_hit   link activo, veredicto del destino guardado en la fila
+  redirect.verdict_miss  link activo, veredicto caducado (se reevalúa, DNS en caché)
+  redirect.not_found     404
+  redirect.expired       410
+  create.custom_key      POST /url con alias
+  create.generated_key   POST /url con clave generada
+  api.get_url            GET /api/urls/{key} con X-API-Key
+  api.create_url         POST /api/urls con X-API-Key
+  policy.decide_{N}      policy_lists.decide_by_policy con listas de N entradas
+  dns_cache.hit          dns_cache.get_cached_entry con entrada vigente
+  dns_cache.evaluate_hit target_validation.evaluate_target_url con DNS en caché
+
+Cada benchmark se calienta y se mide en --rounds rondas de --min-time segundos;
+se guarda la mediana del tiempo por operación.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.suite [--only redirect] [--quick] [--save benchmarks/baseline.json]
+    python -m benchmarks.suite --compare benchmarks/baseline.json [--threshold 0.10]
+
+--compare sale con código 1 si algún benchmark es más lento que la baseline en
+más de --threshold (10% por defecto).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+
+STUB_IPS = ("93.184.216.34", "2606:2800:220:1:248:1893:25c8:1946")
+
+
+class Bench:
+    """op() se cronometra; before() (opcional) prepara cada operación sin contar."""
+
+    def __init__(self, name: str, op: Callable[[], object], before: Optional[Callable[[], object]] = None):
+        self.name = name
+        self.op = op
+        self.before = before
+
+
+def _measure(bench: Bench, *, min_time: float, rounds: int) -> dict:
+    op, before = bench.op, bench.before
+    perf = time.perf_counter
+
+    def one_round(budget: float) -> tuple[float, int]:
+        spent, n = 0.0, 0
+        while spent < budget:
+            if before is not None:
+                before()
+            t0 = perf()
+            op()
+            spent += perf() - t0
+            n += 1
+        return spent, n
+
+    one_round(min(0.2, min_time))  # calentamiento (cachés, imports perezosos)
+    per_op = []
+    total = 0
+    for _ in range(rounds):
+        spent, n = one_round(min_time)
+        per_op.append(spent / n)
+        total += n
+    median = statistics.median(per_op)
+    return {
+        "us_per_op": round(median * 1e6, 3),
+        "ops_per_sec": round(1 / median, 1),
+        "iterations": total,
+    }
+
+
+# -------------------------
+# Entorno
+# -------------------------
+
+def _prepare_env(db_path: str) -> None:
+    # antes de importar la app
+    os.environ["DB_URL"] = f"sqlite:///{db_path}"
+    os.environ["RESOLVE_DNS"] = "true"
+    os.environ["GEOIP_ENABLED"] = "false"
+    os.environ.setdefault("RATE_LIMIT_MAX_REQUESTS", str(10**9))
+    os.environ.setdefault("LOG_SAMPLE_RATES", "redirect=0")
+    os.environ.setdefault("ROOT_ADMIN_KEY", "bench-root-key")
+
+
+def _stub_dns_and_geoip() -> None:
+    import main
+    import target_validation
+    from policy_lists import ip_to_int
+
+    ips = [ip_to_int(ip) for ip in STUB_IPS]
+
+    def resolve_host(host_ascii: str):
+        return list(ips), 300
+
+    target_validation.resolve_host = resolve_host
+    main.country_code_for_ip = lambda ip: "ES"
+
+
+# -------------------------
+# Benchmarks de la app
+# -------------------------
+
+def _app_benches(stack: ExitStack) -> list[Bench]:
+    from fastapi.testclient import TestClient
+    from sqlalchemy import update
+
+    import main
+    import models
+    from database import SessionLocal
+
+    # un solo cliente abierto para toda la ejecución: un portal (event loop)
+    # y el lifespan (escritor de clicks, persister HLL...) como en producción,
+    # en vez de un portal nuevo por request
+    client = stack.enter_context(TestClient(main.app))
+    ua = {"user-agent": "Mozilla/5.0 (Windows NT 10.0) Chrome/120"}
+
+    def create(target: str, **extra) -> dict:
+        resp = client.post("/url", json={"target_url": target, **extra})
+        resp.raise_for_status()
+        return resp.json()
+
+    hot = create("https://example.com/hot")["url"].rsplit("/", 1)[1]
+    miss = create("https://example.org/miss")["url"].rsplit("/", 1)[1]
+    expired = create("https://example.net/expired")["url"].rsplit("/", 1)[1]
+    with SessionLocal() as db:
+        db.execute(
+            update(models.URL)
+            .where(models.URL.key == expired)
+            .values(expires_at=datetime.now(timezone.utc) - timedelta(days=1))
+        )
+        db.commit()
+
+    def invalidate_verdict() -> None:
+        with SessionLocal() as db:
+            db.execute(update(models.URL).where(models.URL.key == miss).values(verdict_generation=None))
+            db.commit()
+
+    def redirect(key: str, expected: int) -> Callable[[], None]:
+        def op() -> None:
+            resp = client.get(f"/{key}", headers=ua, follow_redirects=False)
+            if resp.status_code != expected:
+                raise RuntimeError(f"/{key}: {resp.status_code} != {expected}")
+        return op
+
+    counter = iter(range(10**9))
+
+    def create_custom() -> None:
+        create("https://example.com/custom", custom_key=f"bench{next(counter)}")
+
+    def create_generated() -> None:
+        create("https://example.com/generated")
+
+    boot = client.post(
+        "/api/bootstrap",
+        json={"name": f"bench-{os.getpid()}"},
+        headers={"X-Root-Key": os.environ["ROOT_ADMIN_KEY"]},
+    )
+    boot.raise_for_status()
+    api_headers = {"X-API-Key": boot.json()["api_key"]}
+    owned = client.post("/api/urls", json={"target_url": "https://example.com/owned"}, headers=api_headers)
+    owned.raise_for_status()
+    owned_key = owned.json()["url"].rsplit("/", 1)[1]
+
+    def api_get() -> None:
+        client.get(f"/api/urls/{owned_key}", headers=api_headers).raise_for_status()
+
+    def api_create() -> None:
+        client.post("/api/urls", json={"target_url": "https://example.com/api"}, headers=api_headers).raise_for_status()
+
+    return [
+        Bench("redirect.verdict_hit", redirect(hot, 307)),
+        Bench("redirect.verdict_miss", redirect(miss, 307), before=invalidate_verdict),
+        Bench("redirect.not_found", redirect("doesnotexist", 404)),
+        Bench("redirect.expired", redirect(expired, 410)),
+        Bench("create.custom_key", create_custom),
+        Bench("create.generated_key", create_generated),
+        Bench("api.get_url", api_get),
+        Bench("api.create_url", api_create),
+    ]
+
+
+# -------------------------
+# Listas y DNS
+# -------------------------
+
+def _write_list(path: str, n: int) -> None:
+    # mezcla realista: dominios exactos, comodines y redes IPv4
+    with open(path, "w", encoding="utf-8") as fh:
+        for i in range(n):
+            kind = i % 4
+            if kind == 0:
+                fh.write(f"*.zone{i}.example\n")
+            elif kind == 1:
+                fh.write(f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}/32\n")
+            else:
+                fh.write(f"host{i}.blocked.example\n")
+
+
+def _policy_benches(sizes: list[int], workdir: str) -> list[Bench]:
+    from policy_lists import _lists_mgr, decide_by_policy, ip_to_int
+
+    benches = []
+    allow_path = os.path.join(workdir, "allow-empty.txt")
+    open(allow_path, "w").close()
+    probe_ip = ip_to_int("93.184.216.34")
+    for n in sizes:
+        deny_path = os.path.join(workdir, f"deny-{n}.txt")
+        _write_list(deny_path, n)
+        _lists_mgr.load(deny_path)  # compilación fuera de la medida
+
+        def op(deny_path=deny_path) -> None:
+            decide_by_policy(
+                default_policy="allow",
+                allow_path=allow_path,
+                deny_path=deny_path,
+                host="www.sub.zone3.example.com",
+                ip_num=probe_ip,
+            )
+
+        benches.append(Bench(f"policy.decide_{_size_label(n)}", op))
+    return benches
+
+
+def _size_label(n: int) -> str:
+    if n >= 1_000_000 and n % 1_000_000 == 0:
+        return f"{n // 1_000_000}m"
+    if n >= 1000 and n % 1000 == 0:
+        return f"{n // 1000}k"
+    return str(n)
+
+
+def _dns_benches() -> list[Bench]:
+    import dns_cache
+    import target_validation
+    from policy_lists import ip_to_int
+
+    host = "bench-dns.example.com"
+    dns_cache.set_cached(host, [ip_to_int(ip) for ip in STUB_IPS], 3600)
+    target_validation.evaluate_target_url(f"https://{host}/path")  # llena la caché
+
+    return [
+        Bench("dns_cache.hit", lambda: dns_cache.get_cached_entry(host)),
+        Bench("dns_cache.evaluate_hit", lambda: target_validation.evaluate_target_url(f"https://{host}/path")),
+    ]
+
+
+# -------------------------
+# Baseline / comparación
+# -------------------------
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Imprime la comparación y devuelve los benchmarks que empeoran más del umbral."""
+    regressions = []
+    print(f"{'benchmark':26} {'base us':>10} {'now us':>10} {'cambio':>8}")
+    for name, now in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:26} {'-':>10} {now['us_per_op']:10.2f} {'nuevo':>8}")
+            continue
+        change = now["us_per_op"] / base["us_per_op"] - 1 if base["us_per_op"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESIÓN"
+        print(f"{name:26} {base['us_per_op']:10.2f} {now['us_per_op']:10.2f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks de los caminos calientes")
+    parser.add_argument("--only", help="solo benchmarks cuyo nombre contenga este texto")
+    parser.add_argument("--quick", action="store_true", help="rondas cortas y sin la lista de 1M")
+    parser.add_argument("--min-time", type=float, default=0.5, help="segundos por ronda")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--save", help="escribir los resultados (JSON) en esta ruta")
+    parser.add_argument("--compare", help="baseline JSON contra la que comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="empeoramiento tolerado (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.min_time = min(args.min_time, 0.2)
+        args.rounds = min(args.rounds, 3)
+    sizes = [1000, 100_000] if args.quick else [1000, 100_000, 1_000_000]
+
+    workdir = tempfile.TemporaryDirectory(prefix="bench-")
+    _prepare_env(os.path.join(workdir.name, "bench.db"))
+    _stub_dns_and_geoip()
+
+    results = {}
+    with ExitStack() as stack:
+        benches: list[Bench] = []
+        for prefixes, factory in (
+            (("redirect.", "create.", "api."), lambda: _app_benches(stack)),
+            (("policy.",), lambda: _policy_benches(sizes, workdir.name)),
+            (("dns_cache.",), _dns_benches),
+        ):
+            # no preparar grupos que --only va a descartar (la lista de 1M tarda)
+            if args.only and not any(args.only in p or p in args.only for p in prefixes):
+                continue
+            benches.extend(factory())
+        if args.only:
+            benches = [b for b in benches if args.only in b.name]
+
+        for bench in benches:
+            results[bench.name] = _measure(bench, min_time=args.min_time, rounds=args.rounds)
+            r = results[bench.name]
+            print(f"{bench.name:26} {r['us_per_op']:12.2f} us/op {r['ops_per_sec']:12.1f} ops/s", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "min_time": args.min_time,
+            "rounds": args.rounds,
+        },
+        "results": results,
+    }
+    workdir.cleanup()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regresión(es) por encima del {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    elif not args.save:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
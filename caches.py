@@ -0,0 +1,325 @@
+# caches.py
+
+"""
+Cachés en memoria acotadas (LRU + TTL opcional) con estadísticas.
+
+Sustituye a los dicts sin límite que crecían con cada IP/host distinto.
+Thread-safe (un lock por caché): los endpoints sync de FastAPI corren en el
+threadpool.
+
+Registro común (GET /admin/caches): cada módulo registra sus estructuras en
+memoria con register(...) usando un adaptador (LRUHandle, FunctionCacheHandle,
+DictHandle o una subclase de CacheHandle), y el admin puede verlas, vaciarlas,
+redimensionarlas o invalidar una clave sin reiniciar el worker.
+"""
+
+from __future__ import annotations
+
+import abc
+import itertools
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+
+# centinela para distinguir "no está" de un None cacheado
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int, *, ttl_seconds: Optional[float] = None):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, MISSING)
+            if item is MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else 0.0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._data)
+            self._data.clear()
+            return n
+
+    def resize(self, maxsize: int) -> None:
+        with self._lock:
+            self.maxsize = max(1, int(maxsize))
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def sample(self, n: int) -> tuple[int, list]:
+        """(entradas, primeras n (clave, valor)) para estimar memoria."""
+        with self._lock:
+            return len(self._data), [(k, v) for k, (_, v) in itertools.islice(self._data.items(), n)]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else None,
+        }
+
+
+# -------------------------
+# Registro de cachés
+# -------------------------
+
+class CacheOperationError(ValueError):
+    """Operación que esta caché no admite (p.ej. invalidar una clave en un lru_cache)."""
+
+
+_SAMPLE = 64
+
+
+def _sizeof(obj: Any, depth: int = 2) -> int:
+    """getsizeof con un par de niveles de contenedores/slots (estimación, no exacto)."""
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+    if isinstance(obj, dict):
+        items = list(itertools.islice(obj.items(), _SAMPLE))
+        if items:
+            sampled = sum(_sizeof(k, depth - 1) + _sizeof(v, depth - 1) for k, v in items)
+            size += sampled * len(obj) // len(items)
+    elif isinstance(obj, (tuple, list, set, frozenset, deque)):
+        items = list(itertools.islice(obj, _SAMPLE))
+        if items:
+            size += sum(_sizeof(x, depth - 1) for x in items) * len(obj) // len(items)
+    else:
+        for slot in getattr(type(obj), "__slots__", ()):
+            size += _sizeof(getattr(obj, slot, None), depth - 1)
+        attrs = getattr(obj, "__dict__", None)
+        if attrs:
+            size += sum(_sizeof(v, depth - 1) for v in attrs.values())
+    return size
+
+
+def estimate_bytes(container: Any, count: int, sample: list) -> int:
+    """Memoria aproximada: el contenedor + la media de una muestra de entradas * count."""
+    total = sys.getsizeof(container)
+    if sample:
+        total += sum(_sizeof(k) + _sizeof(v) for k, v in sample) * count // len(sample)
+    return total
+
+
+class CacheHandle(abc.ABC):
+    """
+    Interfaz común del registro. info() y purge() son obligatorios (un handle
+    incompleto falla al crearlo, no en GET /admin/caches); resize() e
+    invalidate() son opcionales.
+    """
+
+    kind = "custom"
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+
+    @abc.abstractmethod
+    def info(self) -> dict:
+        """entries, maxsize, estimated_bytes, hits, misses, evictions (None si no aplica)."""
+
+    @abc.abstractmethod
+    def purge(self) -> int:
+        """Vacía la caché. Devuelve cuántas entradas había."""
+
+    def resize(self, maxsize: int) -> None:
+        raise CacheOperationError(f"cache '{self.name}' cannot be resized")
+
+    def invalidate(self, key: str) -> bool:
+        raise CacheOperationError(f"cache '{self.name}' does not support invalidating single keys")
+
+    @property
+    def resizable(self) -> bool:
+        return type(self).resize is not CacheHandle.resize
+
+    @property
+    def invalidatable(self) -> bool:
+        return type(self).invalidate is not CacheHandle.invalidate
+
+    def describe(self) -> dict:
+        info = self.info()
+        hits, misses = info.get("hits"), info.get("misses")
+        lookups = (hits or 0) + (misses or 0)
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "description": self.description,
+            "entries": info.get("entries", 0),
+            "maxsize": info.get("maxsize"),
+            "estimated_bytes": info.get("estimated_bytes"),
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": (hits / lookups) if hits is not None and lookups else None,
+            "evictions": info.get("evictions"),
+            "resizable": self.resizable,
+            "invalidatable": self.invalidatable,
+        }
+
+
+class LRUHandle(CacheHandle):
+    kind = "lru"
+
+    def __init__(
+        self,
+        name: str,
+        cache: LRUCache,
+        description: str = "",
+        *,
+        key_from_str: Callable[[str], Hashable] = str,
+    ):
+        super().__init__(name, description)
+        self.cache = cache
+        self.key_from_str = key_from_str
+
+    def info(self) -> dict:
+        count, sample = self.cache.sample(_SAMPLE)
+        return {
+            "entries": count,
+            "maxsize": self.cache.maxsize,
+            "estimated_bytes": estimate_bytes(self.cache._data, count, sample),
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "evictions": self.cache.evictions,
+        }
+
+    def purge(self) -> int:
+        return self.cache.clear()
+
+    def resize(self, maxsize: int) -> None:
+        self.cache.resize(maxsize)
+
+    def invalidate(self, key: str) -> bool:
+        try:
+            k = self.key_from_str(key)
+        except (TypeError, ValueError):
+            raise CacheOperationError(f"invalid key for cache '{self.name}'")
+        with self.cache._lock:
+            return self.cache._data.pop(k, MISSING) is not MISSING
+
+
+class FunctionCacheHandle(CacheHandle):
+    """functools.lru_cache: contadores de cache_info(); el tamaño es fijo al decorar."""
+
+    kind = "functools"
+
+    def __init__(self, name: str, fn, description: str = ""):
+        super().__init__(name, description)
+        self.fn = fn
+
+    def info(self) -> dict:
+        ci = self.fn.cache_info()
+        return {
+            "entries": ci.currsize,
+            "maxsize": ci.maxsize,
+            # lru_cache no expone sus entradas: sin estimación
+            "estimated_bytes": None,
+            "hits": ci.hits,
+            "misses": ci.misses,
+            # aprox.: los fallos que lanzan excepción no llegan a guardarse
+            "evictions": max(0, ci.misses - ci.currsize) if ci.maxsize else 0,
+        }
+
+    def purge(self) -> int:
+        n = self.fn.cache_info().currsize
+        self.fn.cache_clear()
+        return n
+
+
+class DictHandle(CacheHandle):
+    """Dict sin contadores propios (estado en memoria: rate limiter, listas...)."""
+
+    kind = "dict"
+
+    def __init__(
+        self,
+        name: str,
+        data: dict,
+        description: str = "",
+        *,
+        linked: Iterable[dict] = (),
+        key_from_str: Callable[[str], Hashable] = str,
+    ):
+        super().__init__(name, description)
+        self.data = data
+        # dicts auxiliares con las mismas claves (p.ej. mtimes) que se vacían a la vez
+        self.linked = tuple(linked)
+        self.key_from_str = key_from_str
+
+    def info(self) -> dict:
+        # list(...) es una copia atómica bajo el GIL aunque otro hilo escriba
+        items = list(self.data.items())
+        return {
+            "entries": len(items),
+            "estimated_bytes": estimate_bytes(self.data, len(items), items[:_SAMPLE]),
+        }
+
+    def purge(self) -> int:
+        n = len(self.data)
+        self.data.clear()
+        for d in self.linked:
+            d.clear()
+        return n
+
+    def invalidate(self, key: str) -> bool:
+        k = self.key_from_str(key)
+        found = self.data.pop(k, MISSING) is not MISSING
+        for d in self.linked:
+            d.pop(k, None)
+        return found
+
+
+_registry: dict[str, CacheHandle] = {}
+
+
+def register(handle: CacheHandle) -> CacheHandle:
+    _registry[handle.name] = handle
+    return handle
+
+
+def registered() -> list[CacheHandle]:
+    return [_registry[name] for name in sorted(_registry)]
+
+
+def get_handle(name: str) -> Optional[CacheHandle]:
+    return _registry.get(name)
@@ -0,0 +1,154 @@
+# click_dedup.py
+
+"""
+Deduplicación de clicks: dentro de la ventana de un link (urls.dedup_window_seconds)
+una recarga del mismo visitante (hash de IP + user-agent) no vuelve a contar.
+
+Memoria fija, sin un dict que crezca con cada visitante: un anillo de
+CLICK_DEDUP_BUCKETS filtros de Bloom, uno por intervalo de
+CLICK_DEDUP_BUCKET_SECONDS. Cada click se inserta en el filtro del intervalo
+actual y es repetido si ya aparece en alguno de los intervalos que cubren la
+ventana; los filtros viejos se reutilizan (se vacían) al rotar.
+
+- Memoria: CLICK_DEDUP_BUCKETS * CLICK_DEDUP_BLOOM_BITS / 8 bytes.
+- Ventana máxima: (CLICK_DEDUP_BUCKETS - 1) * CLICK_DEDUP_BUCKET_SECONDS. La
+  ventana efectiva se redondea hacia arriba al intervalo.
+- Error: solo falsos positivos (un click nuevo tomado por repetido, es decir,
+  clicks de menos), con probabilidad ~ llenado^k por filtro consultado. stats()
+  da la estimación actual; si sube, más bits por filtro.
+
+Es por worker: el mismo visitante servido por dos workers cuenta en ambos.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import threading
+import time
+from typing import Optional
+
+from config import settings
+
+
+_KEY = (settings.hmac_secret_key or "").encode("utf-8")[:64]
+
+
+class BloomFilter:
+    __slots__ = ("m", "k", "bits", "count")
+
+    def __init__(self, m_bits: int, k: int):
+        self.m = max(64, int(m_bits))
+        self.k = max(1, int(k))
+        self.bits = bytearray((self.m + 7) // 8)
+        self.count = 0
+
+    def _positions(self, h1: int, h2: int):
+        # doble hashing (Kirsch-Mitzenmacher): k posiciones de dos hashes
+        m = self.m
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    def contains(self, positions) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def add(self, positions) -> None:
+        bits = self.bits
+        for p in positions:
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def clear(self) -> None:
+        self.bits[:] = bytes(len(self.bits))
+        self.count = 0
+
+    def fill_ratio(self) -> float:
+        return int.from_bytes(self.bits, "little").bit_count() / self.m
+
+
+class ClickDeduper:
+    def __init__(self, *, bucket_seconds: int, buckets: int, bloom_bits: int, hashes: int):
+        self.bucket_seconds = max(1, int(bucket_seconds))
+        self.buckets = max(2, int(buckets))
+        self._filters = [BloomFilter(bloom_bits, hashes) for _ in range(self.buckets)]
+        self._epochs = [-1] * self.buckets  # intervalo que guarda cada filtro
+        self._lock = threading.Lock()
+        self.repeats = 0
+        self.checked = 0
+
+    @property
+    def max_window_seconds(self) -> int:
+        return (self.buckets - 1) * self.bucket_seconds
+
+    def seen(self, url_id: int, visitor: str, window_seconds: int, now: Optional[float] = None) -> bool:
+        """True si (link, visitante) ya hizo click en la ventana. Registra el click."""
+        # hash con clave: el filtro no permite comprobar si una IP concreta pasó
+        digest = hashlib.blake2b(f"{url_id}\x00{visitor}".encode("utf-8", "replace"), digest_size=16, key=_KEY).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        positions = self._filters[0]._positions(h1, h2)
+
+        now = time.time() if now is None else now
+        cur = int(now // self.bucket_seconds)
+        span = min(math.ceil(window_seconds / self.bucket_seconds), self.buckets - 1)
+        with self._lock:
+            self.checked += 1
+            for epoch in range(cur - span, cur + 1):
+                pos = epoch % self.buckets
+                if self._epochs[pos] == epoch and self._filters[pos].contains(positions):
+                    self.repeats += 1
+                    return True
+            pos = cur % self.buckets
+            if self._epochs[pos] != cur:
+                self._filters[pos].clear()
+                self._epochs[pos] = cur
+            self._filters[pos].add(positions)
+            return False
+
+    def stats(self, now: Optional[float] = None) -> dict:
+        now = time.time() if now is None else now
+        cur = int(now // self.bucket_seconds)
+        with self._lock:
+            live = [
+                f for f, epoch in zip(self._filters, self._epochs) if cur - self.buckets < epoch <= cur
+            ]
+            fills = [f.fill_ratio() for f in live]
+            inserted = sum(f.count for f in live)
+            k = self._filters[0].k
+            m = self._filters[0].m
+            checked, repeats = self.checked, self.repeats
+        # probabilidad de falso positivo consultando todos los filtros vivos
+        fp = 1.0 - math.prod(1.0 - fill ** k for fill in fills) if fills else 0.0
+        return {
+            "enabled": settings.click_dedup_enabled,
+            "bucket_seconds": self.bucket_seconds,
+            "buckets": self.buckets,
+            "max_window_seconds": self.max_window_seconds,
+            "bits_per_filter": m,
+            "hashes": k,
+            "memory_bytes": self.buckets * len(self._filters[0].bits),
+            "inserted": inserted,
+            "checked": checked,
+            "repeats": repeats,
+            "max_fill_ratio": round(max(fills, default=0.0), 4),
+            "est_false_positive_rate": round(fp, 6),
+        }
+
+
+deduper = ClickDeduper(
+    bucket_seconds=settings.click_dedup_bucket_seconds,
+    buckets=settings.click_dedup_buckets,
+    bloom_bits=settings.click_dedup_bloom_bits,
+    hashes=settings.click_dedup_hashes,
+)
+
+
+def is_repeat(url_id: int, window_seconds: Optional[int], ip: str, ua: str) -> bool:
+    """¿Es una recarga del mismo visitante (IP + user-agent) dentro de la ventana?"""
+    if not settings.click_dedup_enabled or not window_seconds or window_seconds <= 0:
+        return False
+    return deduper.seen(url_id, f"{ip}\x00{ua}", window_seconds)
+
+
+def stats() -> dict:
+    return deduper.stats()
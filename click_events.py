@@ -0,0 +1,233 @@
+# click_events.py
+
+"""
+Pipeline de eventos de click.
+
+El redirect solo empuja una tupla compacta a un buffer en memoria acotado; un
+hilo de fondo lo vacía a la tabla click_events con inserts por lotes. Nunca se
+bloquea el redirect esperando a la BD:
+
+- Buffer con capacidad fija (CLICK_BUFFER_SIZE).
+- Por encima del 75% de ocupación, con CLICK_OVERFLOW_POLICY=sample se guarda
+  1 de cada CLICK_SAMPLE_RATE eventos con weight=N (las agregaciones siguen
+  saliendo insesgadas); con "drop" se siguen aceptando hasta llenarse.
+- Lleno: el evento se descarta (se cuenta en stats.dropped).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import urlsplit
+
+from sqlalchemy import insert
+
+import click_stats
+import models
+import ua_classifier
+from config import settings
+from database import SessionLocal
+from logger import logger
+
+
+# (url_id, ts epoch, country, ua_class, referrer_host, weight)
+Event = tuple[int, float, Optional[str], Optional[str], Optional[str], int]
+
+def referrer_host(referer: Optional[str]) -> Optional[str]:
+    if not referer:
+        return None
+    try:
+        host = urlsplit(referer).hostname
+    except ValueError:
+        return None
+    return host[:253] if host else None
+
+
+@dataclass
+class ClickStats:
+    pushed: int = 0
+    sampled_out: int = 0
+    dropped: int = 0
+    written: int = 0
+    batches: int = 0
+    write_errors: int = 0
+    last_flush_ms: float = 0.0
+
+
+class ClickBuffer:
+    """Buffer acotado multi-productor / un consumidor."""
+
+    def __init__(self, capacity: int, *, overflow_policy: str = "sample", sample_rate: int = 10):
+        self.capacity = max(1, int(capacity))
+        self.soft_limit = max(1, self.capacity * 3 // 4)
+        self.sample = (overflow_policy or "sample").strip().lower() == "sample"
+        self.sample_rate = max(1, int(sample_rate))
+        self.stats = ClickStats()
+        self._items: deque[Event] = deque()
+        self._lock = threading.Lock()
+        self._sample_counter = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def push(self, url_id: int, country, ua_cls, ref_host, ts: Optional[float] = None) -> bool:
+        """Encola un click. False si se descartó (lleno o muestreado)."""
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            n = len(self._items)
+            if n >= self.capacity:
+                self.stats.dropped += 1
+                return False
+            weight = 1
+            if self.sample and n >= self.soft_limit:
+                self._sample_counter += 1
+                if self._sample_counter % self.sample_rate:
+                    self.stats.sampled_out += 1
+                    return False
+                weight = self.sample_rate
+            self._items.append((url_id, ts, country, ua_cls, ref_host, weight))
+            self.stats.pushed += 1
+            return True
+
+    def drain(self, max_items: int) -> list[Event]:
+        with self._lock:
+            n = min(max_items, len(self._items))
+            return [self._items.popleft() for _ in range(n)]
+
+
+def _event_rows(events: list[Event]) -> list[dict]:
+    return [
+        {
+            "url_id": url_id,
+            "ts": datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None),
+            "country": country,
+            "ua_class": ua_cls,
+            "referrer_host": ref_host,
+            "weight": weight,
+        }
+        for url_id, ts, country, ua_cls, ref_host, weight in events
+    ]
+
+
+def write_batch(db, events: list[Event]) -> None:
+    """Inserta un lote de eventos (un executemany) y lo suma a los rollups, sin commit."""
+    db.execute(insert(models.ClickEvent), _event_rows(events))
+    click_stats.apply_batch(db, events)
+
+
+class ClickEventWriter:
+    def __init__(
+        self,
+        buffer: ClickBuffer,
+        *,
+        session_factory=SessionLocal,
+        batch_size: int = settings.click_batch_size,
+        flush_interval_ms: int = settings.click_flush_interval_ms,
+    ):
+        self.buffer = buffer
+        self.session_factory = session_factory
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(10, int(flush_interval_ms)) / 1000
+        self.prune_interval = max(1, int(settings.stats_prune_interval_seconds))
+        self._last_prune = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="click-event-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()  # lo que quede en el buffer
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            # lote lleno => sin esperar; si no, cada flush_interval
+            if len(self.buffer) < self.batch_size:
+                self._stop.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("click event flush failed")
+            if time.monotonic() - self._last_prune >= self.prune_interval:
+                self._last_prune = time.monotonic()
+                self._prune()
+
+    def _prune(self) -> None:
+        # downsampling: fuera de retención solo quedan los buckets más gruesos
+        db = self.session_factory()
+        try:
+            click_stats.prune(db)
+        except Exception:
+            db.rollback()
+            logger.exception("click rollup/event prune failed")
+        finally:
+            db.close()
+
+    def flush(self) -> int:
+        """Vacía el buffer a la BD en lotes de batch_size. Devuelve eventos escritos."""
+        stats = self.buffer.stats
+        total = 0
+        while True:
+            events = self.buffer.drain(self.batch_size)
+            if not events:
+                return total
+            t0 = time.perf_counter()
+            db = self.session_factory()
+            try:
+                write_batch(db, events)
+                db.commit()
+            except Exception:
+                db.rollback()
+                stats.write_errors += 1
+                logger.exception(f"click event batch lost ({len(events)} events)")
+                continue
+            finally:
+                db.close()
+            stats.written += len(events)
+            stats.batches += 1
+            stats.last_flush_ms = (time.perf_counter() - t0) * 1000
+            total += len(events)
+
+
+buffer = ClickBuffer(
+    settings.click_buffer_size,
+    overflow_policy=settings.click_overflow_policy,
+    sample_rate=settings.click_sample_rate,
+)
+writer = ClickEventWriter(buffer)
+
+
+def record_click(url_id: int, *, country: Optional[str], ua_cls: Optional[str], referer: Optional[str]) -> None:
+    """Hot path del redirect: solo encola. ua_cls: ua_classifier.UAInfo.label"""
+    if settings.click_events_enabled:
+        buffer.push(url_id, country, ua_cls, referrer_host(referer))
+
+
+def start_writer() -> None:
+    if settings.click_events_enabled:
+        writer.start()
+
+
+def stop_writer() -> None:
+    writer.stop()
+
+
+def stats() -> dict:
+    return {
+        "enabled": settings.click_events_enabled,
+        "buffered": len(buffer),
+        **asdict(buffer.stats),
+        "user_agents": ua_classifier.stats(),
+    }
@@ -0,0 +1,170 @@
+# click_stats.py
+
+"""
+Estadísticas pre-agregadas de clicks.
+
+Los rollups se actualizan de forma incremental al volcar cada lote de
+click_events (mismo commit): un upsert por (link, bucket) en vez de recalcular.
+Las consultas de /stats solo leen rollups, nunca click_events.
+
+- click_rollups     : clicks por minuto / hora / día
+- click_rollup_dims : clicks por día y país / host de referrer
+
+Downsampling: los buckets de hora y día se mantienen directamente desde los
+eventos, así que los de minuto (y luego los de hora) más antiguos que su
+retención se pueden borrar sin perder totales (prune()). Por lo mismo, los
+click_events crudos se borran pasados CLICK_EVENT_RETENTION_DAYS.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+
+
+GRANULARITIES = {"minute": ("m", 60), "hour": ("h", 3600), "day": ("d", 86400)}
+# rango por defecto de cada granularidad si no se pide uno
+DEFAULT_SPAN = {"minute": timedelta(hours=1), "hour": timedelta(hours=48), "day": timedelta(days=30)}
+DIMENSIONS = ("country", "referrer")
+
+
+def _bucket(ts: float, seconds: int) -> datetime:
+    return datetime.fromtimestamp(ts - ts % seconds, timezone.utc).replace(tzinfo=None)
+
+
+def _upsert_add(db: Session, table, keys: tuple[str, ...], rows: list[dict]) -> None:
+    """INSERT ... ON CONFLICT DO UPDATE clicks = clicks + excluded.clicks."""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        raise RuntimeError(f"click rollups: unsupported database dialect {dialect!r}")
+
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={"clicks": table.c.clicks + stmt.excluded.clicks},
+    )
+    db.execute(stmt, rows)
+
+
+def apply_batch(db: Session, events) -> None:
+    """
+    Suma un lote de click_events.Event a los rollups (sin commit: va en la
+    misma transacción que el insert de los eventos).
+    """
+    times: Counter = Counter()
+    dims: Counter = Counter()
+    for url_id, ts, country, _ua_cls, ref_host, weight in events:
+        for code, seconds in GRANULARITIES.values():
+            times[(url_id, code, _bucket(ts, seconds))] += weight
+        day = _bucket(ts, 86400)
+        dims[(url_id, "country", day, country or "")] += weight
+        dims[(url_id, "referrer", day, ref_host or "")] += weight
+
+    _upsert_add(
+        db,
+        models.ClickRollup.__table__,
+        ("url_id", "granularity", "bucket"),
+        [{"url_id": u, "granularity": g, "bucket": b, "clicks": c} for (u, g, b), c in times.items()],
+    )
+    _upsert_add(
+        db,
+        models.ClickRollupDim.__table__,
+        ("url_id", "dim", "day", "value"),
+        [{"url_id": u, "dim": d, "day": day, "value": v, "clicks": c} for (u, d, day, v), c in dims.items()],
+    )
+
+
+def prune(db: Session, now: Optional[datetime] = None) -> int:
+    """Borra buckets de minuto/hora y click_events fuera de retención. Devuelve filas borradas."""
+    now = now or datetime.utcnow()
+    R = models.ClickRollup
+    deleted = 0
+    for code, keep in (
+        ("m", timedelta(hours=max(1, settings.stats_minute_retention_hours))),
+        ("h", timedelta(days=max(1, settings.stats_hour_retention_days))),
+    ):
+        result = db.execute(delete(R).where(R.granularity == code, R.bucket < now - keep))
+        deleted += result.rowcount or 0
+    if settings.click_event_retention_days > 0:
+        E = models.ClickEvent
+        cutoff = now - timedelta(days=settings.click_event_retention_days)
+        deleted += db.execute(delete(E).where(E.ts < cutoff)).rowcount or 0
+    db.commit()
+    return deleted
+
+
+def get_stats(
+    db: Session,
+    url_id: int,
+    *,
+    granularity: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    top: int = 20,
+) -> dict:
+    """
+    Serie temporal de un link en [start, end) + top países/referrers. Los
+    desgloses solo existen por día: cubren los días completos que tocan el
+    rango, [breakdown_start, breakdown_end), que se devuelven aparte.
+    """
+    code, seconds = GRANULARITIES[granularity]
+    end = _naive_utc(end) if end else datetime.utcnow()
+    start = _naive_utc(start) if start else end - DEFAULT_SPAN[granularity]
+
+    R = models.ClickRollup
+    series = db.execute(
+        select(R.bucket, R.clicks)
+        .where(R.url_id == url_id, R.granularity == code, R.bucket >= _floor(start, seconds), R.bucket < end)
+        .order_by(R.bucket)
+    ).all()
+
+    D = models.ClickRollupDim
+    day_start = _floor(start, 86400)
+    day_end = _floor(end, 86400)
+    if day_end < end:
+        day_end += timedelta(days=1)
+    breakdown: dict[str, list[dict]] = {}
+    for dim in DIMENSIONS:
+        total = func.sum(D.clicks).label("clicks")
+        rows = db.execute(
+            select(D.value, total)
+            .where(D.url_id == url_id, D.dim == dim, D.day >= day_start, D.day < day_end)
+            .group_by(D.value)
+            .order_by(total.desc())
+            .limit(top)
+        ).all()
+        breakdown[dim] = [{"value": value or None, "clicks": int(clicks)} for value, clicks in rows]
+
+    return {
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "total": sum(int(c) for _, c in series),
+        "series": [{"bucket": b, "clicks": int(c)} for b, c in series],
+        "breakdown_start": day_start,
+        "breakdown_end": day_end,
+        "countries": breakdown["country"],
+        "referrers": breakdown["referrer"],
+    }
+
+
+def _naive_utc(dt: datetime) -> datetime:
+    # las columnas guardan UTC sin tzinfo
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def _floor(dt: datetime, seconds: int) -> datetime:
+    return _bucket(dt.replace(tzinfo=timezone.utc).timestamp(), seconds)
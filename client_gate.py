@@ -0,0 +1,67 @@
+# client_gate.py
+
+"""
+Middleware ASGI que filtra clientes por IP contra app_allowlist/app_denylist
+ANTES de routing, rate limit, BD o logging.
+
+- Misma semántica que get_client_ip_from_request (X-Forwarded-For solo desde
+  proxies de confianza, ya pre-parseados en target_validation).
+- Matching por entero (policy_lists.decide_ip_by_policy): sin objetos ipaddress.
+- Rechazo con una respuesta 403 de bytes precalculados.
+"""
+
+from __future__ import annotations
+
+from config import settings
+from policy_lists import decide_ip_by_policy, ip_to_int
+from target_validation import client_ip_from
+
+
+_FORBIDDEN_BODY = b'{"detail":"Forbidden"}'
+_FORBIDDEN_HEADERS = (
+    (b"content-type", b"application/json"),
+    (b"content-length", str(len(_FORBIDDEN_BODY)).encode("ascii")),
+)
+
+
+def is_client_ip_allowed(ip: str) -> bool:
+    return decide_ip_by_policy(
+        default_policy=settings.default_app_policy,
+        allow_path=settings.app_allowlist_path,
+        deny_path=settings.app_denylist_path,
+        ip_num=ip_to_int(ip),
+    )
+
+
+class ClientIPGateMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.enabled = settings.app_gate_enabled
+        self.read_xff = settings.trust_x_forwarded_for
+
+    async def __call__(self, scope, receive, send):
+        scope_type = scope["type"]
+        if not self.enabled or (scope_type != "http" and scope_type != "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        remote = client[0] if client else None
+
+        xff = None
+        if self.read_xff:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    xff = value.decode("latin-1")
+                    break
+
+        if is_client_ip_allowed(client_ip_from(remote, xff)):
+            await self.app(scope, receive, send)
+            return
+
+        if scope_type == "websocket":
+            await send({"type": "websocket.close", "code": 1008})
+            return
+
+        await send({"type": "http.response.start", "status": 403, "headers": list(_FORBIDDEN_HEADERS)})
+        await send({"type": "http.response.body", "body": _FORBIDDEN_BODY})
@@ -8,6 +8,7 @@ from dotenv import load_dotenv
 
 
 ENV_PATH = Path(__file__).with_name(".env")
+LIST_DIR = Path(__file__).with_name("list")
 load_dotenv(dotenv_path=ENV_PATH)
 
 def _get_str(name: str, default: str | None = None) -> str | None:
@@ -23,6 +24,11 @@ def _get_int(name: str, default: int) -> int:
     return default if v is None or v.strip() == "" else int(v)
 
 
+def _get_float(name: str, default: float) -> float:
+    v = os.getenv(name)
+    return default if v is None or v.strip() == "" else float(v)
+
+
 def _get_bool(name: str, default: bool) -> bool:
     v = os.getenv(name)
     if v is None or v.strip() == "":
@@ -30,6 +36,13 @@ def _get_bool(name: str, default: bool) -> bool:
     return v.strip().lower() in ("1", "true", "yes", "y", "on")
 
 
+def _get_list(name: str, default: tuple[str, ...] = ()) -> tuple[str, ...]:
+    v = os.getenv(name)
+    if v is None or v.strip() == "":
+        return default
+    return tuple(x.strip() for x in v.split(",") if x.strip())
+
+
 def _require(name: str) -> str:
     v = _get_str(name)
     if not v:
@@ -60,10 +73,121 @@ class Settings:
     resolve_dns: bool = _get_bool("RESOLVE_DNS", True)
     validate_target_on_redirect: bool = _get_bool("VALIDATE_TARGET_ON_REDIRECT", True)
 
+    # Caché DNS (dns_cache.py)
+    dns_cache_mode: str = _get_str("DNS_CACHE_MODE", "fixed")  # fixed | dns
+    dns_cache_ttl_seconds: int = _get_int("DNS_CACHE_TTL_SECONDS", 300)
+    dns_cache_ttl_min_seconds: int = _get_int("DNS_CACHE_TTL_MIN_SECONDS", 30)
+    dns_cache_ttl_max_seconds: int = _get_int("DNS_CACHE_TTL_MAX_SECONDS", 3600)
+    dns_local_cache_size: int = _get_int("DNS_LOCAL_CACHE_SIZE", 65536)  # hosts en memoria por worker
+    dns_cache_use_redis: bool = _get_bool("DNS_CACHE_USE_REDIS", False)
+    redis_url: str | None = _get_str("REDIS_URL", None)
+
+    # Motor de políticas (allow/deny)
+    default_app_policy: str = _get_str("DEFAULT_APP_POLICY", "allow")
+    default_target_policy: str = _get_str("DEFAULT_TARGET_POLICY", "allow")
+    app_allowlist_path: str = _get_str("APP_ALLOWLIST_PATH", str(LIST_DIR / "app_allowlist.txt"))
+    app_denylist_path: str = _get_str("APP_DENYLIST_PATH", str(LIST_DIR / "app_denylist.txt"))
+    target_allowlist_path: str = _get_str("TARGET_ALLOWLIST_PATH", str(LIST_DIR / "target_allowlist.txt"))
+    target_denylist_path: str = _get_str("TARGET_DENYLIST_PATH", str(LIST_DIR / "target_denylist.txt"))
+    # Cada cuánto mira el redirect si cambiaron las listas target_* en disco
+    policy_reload_check_seconds: int = _get_int("POLICY_RELOAD_CHECK_SECONDS", 2)
+
+    # Snapshot binario compartido entre workers (python -m policy_snapshot build)
+    policy_snapshot_path: str | None = _get_str("POLICY_SNAPSHOT_PATH", None)
+
+    # IP real del cliente / filtrado temprano por app allow/deny lists
+    trust_x_forwarded_for: bool = _get_bool("TRUST_X_FORWARDED_FOR", False)
+    trusted_proxy_cidrs: tuple[str, ...] = _get_list("TRUSTED_PROXY_CIDRS")  # "10.0.0.0/8,127.0.0.1"
+    app_gate_enabled: bool = _get_bool("APP_GATE_ENABLED", True)
+
+    # Revalidación en background de los destinos guardados (revalidation.py)
+    revalidation_enabled: bool = _get_bool("REVALIDATION_ENABLED", False)
+    revalidation_interval_seconds: int = _get_int("REVALIDATION_INTERVAL_SECONDS", 3600)
+    revalidation_batch_size: int = _get_int("REVALIDATION_BATCH_SIZE", 500)
+    revalidation_max_rows_per_second: int = _get_int("REVALIDATION_MAX_ROWS_PER_SECOND", 200)
+    revalidation_dns_concurrency: int = _get_int("REVALIDATION_DNS_CONCURRENCY", 16)
+    # un solo worker barre a la vez (tabla leases); se renueva en cada lote
+    revalidation_lease_seconds: int = _get_int("REVALIDATION_LEASE_SECONDS", 120)
+
+    # GeoIP (geoip_service.py, MaxMind GeoLite2 Country)
+    geoip_enabled: bool = _get_bool("GEOIP_ENABLED", False)
+    geoip_mmdb_path: str = _get_str("GEOIP_MMDB_PATH", "GeoLite2-Country.mmdb")
+    geoip_cache_ttl_seconds: int = _get_int("GEOIP_CACHE_TTL_SECONDS", 86400)
+    geoip_cache_size: int = _get_int("GEOIP_CACHE_SIZE", 65536)
+    # Cachear por prefijo (/24 IPv4, /48 IPv6) en vez de por IP: más aciertos
+    geoip_cache_by_prefix: bool = _get_bool("GEOIP_CACHE_BY_PREFIX", False)
+
+    # Eventos de click (click_events.py): buffer en memoria + escritor por lotes
+    click_events_enabled: bool = _get_bool("CLICK_EVENTS_ENABLED", True)
+    click_buffer_size: int = _get_int("CLICK_BUFFER_SIZE", 65536)
+    click_batch_size: int = _get_int("CLICK_BATCH_SIZE", 1000)
+    click_flush_interval_ms: int = _get_int("CLICK_FLUSH_INTERVAL_MS", 1000)
+    # Con el buffer casi lleno: "sample" (1 de cada N, con peso N) o "drop"
+    click_overflow_policy: str = _get_str("CLICK_OVERFLOW_POLICY", "sample")
+    click_sample_rate: int = _get_int("CLICK_SAMPLE_RATE", 10)
+
+    # Rollups de estadísticas (click_stats.py): retención de los buckets finos
+    stats_minute_retention_hours: int = _get_int("STATS_MINUTE_RETENTION_HOURS", 48)
+    stats_hour_retention_days: int = _get_int("STATS_HOUR_RETENTION_DAYS", 90)
+    stats_prune_interval_seconds: int = _get_int("STATS_PRUNE_INTERVAL_SECONDS", 600)
+    # click_events crudos (los rollups ya los contienen); 0 = no se borran
+    click_event_retention_days: int = _get_int("CLICK_EVENT_RETENTION_DAYS", 30)
+
+    # Visitantes únicos (hll.py)
+    hll_enabled: bool = _get_bool("HLL_ENABLED", True)
+    hll_persist_interval_seconds: int = _get_int("HLL_PERSIST_INTERVAL_SECONDS", 30)
+    hll_day_retention_days: int = _get_int("HLL_DAY_RETENTION_DAYS", 90)
+    # tope de sketches pendientes de volcar por worker (4 KiB cada uno)
+    hll_max_pending: int = _get_int("HLL_MAX_PENDING", 16384)
+
+    # Clasificación de user-agents (ua_classifier.py)
+    ua_cache_size: int = _get_int("UA_CACHE_SIZE", 10000)
+    # Cache-Control de los redirects servidos a bots / previews (0 = sin cabecera)
+    bot_redirect_max_age: int = _get_int("BOT_REDIRECT_MAX_AGE", 60)
+
+    # Deduplicación de clicks (click_dedup.py): anillo de filtros de Bloom.
+    # Memoria = buckets * bloom_bits / 8; ventana máxima = (buckets - 1) * bucket_seconds
+    click_dedup_enabled: bool = _get_bool("CLICK_DEDUP_ENABLED", True)
+    click_dedup_bucket_seconds: int = _get_int("CLICK_DEDUP_BUCKET_SECONDS", 10)
+    click_dedup_buckets: int = _get_int("CLICK_DEDUP_BUCKETS", 13)
+    click_dedup_bloom_bits: int = _get_int("CLICK_DEDUP_BLOOM_BITS", 1 << 20)
+    click_dedup_hashes: int = _get_int("CLICK_DEDUP_HASHES", 4)
+
+    # Logging (logger.py): cola + hilo escritor, muestreo por evento ("redirect=0.1")
+    log_async: bool = _get_bool("LOG_ASYNC", True)
+    log_queue_size: int = _get_int("LOG_QUEUE_SIZE", 10000)
+    log_sample_rates: tuple[str, ...] = _get_list("LOG_SAMPLE_RATES")
+
+    # Métricas Prometheus (metrics.py, GET /metrics)
+    metrics_enabled: bool = _get_bool("METRICS_ENABLED", True)
+    metrics_token: str | None = _get_str("METRICS_TOKEN")
+
+    # Trazas por request (tracing.py): Server-Timing + evento "trace"
+    trace_header: str = _get_str("TRACE_HEADER", "X-Trace-Token")
+    trace_token: str | None = _get_str("TRACE_TOKEN")
+    trace_sample_rate: float = _get_float("TRACE_SAMPLE_RATE", 0.0)
+
+    # Consultas SQL por request (query_stats.py)
+    query_n_plus_one_threshold: int = _get_int("QUERY_N_PLUS_ONE_THRESHOLD", 5)  # 0 = no buscar N+1
+    query_budget_strict: bool = _get_bool("QUERY_BUDGET_STRICT", False)  # tests: fallar si se pasa
+
+    # Profiler por muestreo bajo demanda (profiler.py, POST /admin/profile)
+    profiler_max_seconds: int = _get_int("PROFILER_MAX_SECONDS", 60)
+    profiler_max_stacks: int = _get_int("PROFILER_MAX_STACKS", 5000)
+    profiler_max_depth: int = _get_int("PROFILER_MAX_DEPTH", 96)
+
+    # Links en tendencia (trending.py): contadores por bucket, global y por tenant
+    trending_enabled: bool = _get_bool("TRENDING_ENABLED", True)
+    trending_capacity: int = _get_int("TRENDING_CAPACITY", 512)
+    trending_tenant_capacity: int = _get_int("TRENDING_TENANT_CAPACITY", 64)
+    trending_max_tenants: int = _get_int("TRENDING_MAX_TENANTS", 1024)
+
     # Secretos (NO defaults en prod; en dev puedes ponerlos en .env)
     # Si quieres permitir arrancar en dev sin .env, pon default "dev-..." pero NO en prod.
     hmac_secret_key: str = _require("HMAC_SECRET_KEY")
     api_key_hmac_secret: str = _require("API_KEY_HMAC_SECRET")
+    # last_used_at de las API keys: como mucho una escritura por key en este intervalo
+    api_key_touch_interval_seconds: int = _get_int("API_KEY_TOUCH_INTERVAL_SECONDS", 60)
 
     # Bootstrap / admin
     root_admin_key: str | None = _get_str("ROOT_ADMIN_KEY", None)
@@ -3,15 +3,19 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta, timezone  # <-- CAMBIO: usamos datetime.now(timezone.utc) para disabled_at y expires_at
+import os
 import secrets  # <-- CAMBIO
+import socket
 
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from sqlalchemy import update
+from sqlalchemy import delete, func, insert, or_, select, update
 
 from config import settings
 from security import hash_api_key  # <-- CAMBIO: hashing API keys
-import keygen, models, schemas
+from policy_lists import int_to_ip, normalize_host
+from url_canon import host_of
+import click_dedup, geo_rules, keygen, models, schemas
 
 
 
@@ -19,6 +23,20 @@ import keygen, models, schemas
 # URLs
 # -------------------------
 
+def _reverse_host(host: str) -> str:
+    return ".".join(reversed(host.split(".")))
+
+
+def _target_host_values(target_url: str) -> dict:
+    # "" (no NULL) si no hay host: así el backfill no vuelve a visitar la fila
+    try:
+        host = host_of(target_url) or ""
+    except Exception:
+        # fila antigua que ni siquiera se puede canonicalizar: también se marca
+        host = ""
+    return {"target_host": host, "target_host_rev": _reverse_host(host)}
+
+
 def create_db_url(
     db: Session, url: schemas.URLBase, key: str | None = None, *, tenant_id: int | None = None  # <-- CAMBIO
 ) -> models.URL:
@@ -26,7 +44,7 @@ def create_db_url(
     Crea una URL acortada:
       - key: custom_key o generada de forma única (según settings)
       - secret_key: siempre generada con settings (length + alphabet)
-      - expires_at: now + expires_in_days (request) o settings.days_mantain
+      - expires_at: now + expires_in_days (request) o settings.days_maintain
       - tenant_id: ownership (si viene autenticado)
     """
     try:
@@ -38,15 +56,19 @@ def create_db_url(
         expires_days = (
             int(url.expires_in_days)
             if getattr(url, "expires_in_days", None) is not None
-            else int(settings.days_mantain)
+            else int(settings.days_maintain)
         )  # <-- CAMBIO
 
+        target_url = str(url.target_url)
         db_url = models.URL(
-            target_url=str(url.target_url),
+            target_url=target_url,
+            **_target_host_values(target_url),
             key=key,
             secret_key=secret_key,
             expires_at=datetime.now(timezone.utc) + timedelta(days=expires_days),
             tenant_id=tenant_id,  # <-- CAMBIO
+            count_bot_clicks=bool(getattr(url, "count_bot_clicks", False)),
+            dedup_window_seconds=getattr(url, "dedup_window_seconds", None),
         )
 
         db.add(db_url)
@@ -99,14 +121,251 @@ def list_urls_for_tenant(db: Session, tenant_id: int, limit: int = 100, offset:
     )
 
 
-def update_db_clicks(db: Session, db_url: models.URL) -> None:
-    """Contador atómico de clicks."""
+def update_db_clicks(db: Session, db_url: models.URL, *, ip: str | None = None, ua: str = "") -> bool:
+    """
+    Contador atómico de clicks. Con ip y una ventana de deduplicación en el link
+    (dedup_window_seconds), las recargas del mismo visitante no cuentan.
+    Devuelve si el click contó.
+    """
+    if ip is not None and click_dedup.is_repeat(db_url.id, db_url.dedup_window_seconds, ip, ua):
+        return False
     db.execute(
         update(models.URL)
         .where(models.URL.id == db_url.id)
         .values(clicks=models.URL.clicks + 1)
     )
     db.commit()
+    return True
+
+
+def _verdict_values(verdict, blocked_at: datetime | None) -> dict:
+    """Columnas verdict_* + blocked_at para un target_validation.TargetVerdict."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    expires_at = (
+        datetime.fromtimestamp(verdict.expires_at, timezone.utc).replace(tzinfo=None)
+        if verdict.expires_at is not None
+        else None
+    )
+    return {
+        "verdict_ok": verdict.ok,
+        "verdict_reason": verdict.reason,
+        "verdict_generation": verdict.generation,
+        "verdict_expires_at": expires_at,
+        # IPs evaluadas, en texto ("1.2.3.4 2001:db8::1"): análisis offline (policy_impact.py)
+        "target_ips": " ".join(int_to_ip(ip) for ip in verdict.ips) or None,
+        # blocked_at conserva la fecha del PRIMER veredicto negativo
+        "blocked_at": None if verdict.ok else (blocked_at or now),
+    }
+
+
+def store_target_verdict(db: Session, db_url: models.URL, verdict) -> None:
+    """Persiste un target_validation.TargetVerdict en la fila de la URL."""
+    db.execute(
+        update(models.URL)
+        .where(models.URL.id == db_url.id)
+        .values(**_verdict_values(verdict, db_url.blocked_at))
+    )
+    db.commit()
+
+
+def store_target_verdicts(
+    db: Session, items: list[tuple[int, datetime | None, object]], model=models.URL
+) -> None:
+    """
+    Versión en bloque: [(id, blocked_at_actual, verdict), ...] en un solo
+    executemany. `model`: models.URL o models.GeoTarget.
+    """
+    if not items:
+        return
+    db.execute(
+        update(model),
+        [{"id": url_id, **_verdict_values(verdict, blocked_at)} for url_id, blocked_at, verdict in items],
+    )
+    db.commit()
+
+
+def iter_active_url_batches(db: Session, batch_size: int, after_id: int = 0):
+    """
+    Recorre urls activas en lotes por keyset (id > último id), sin OFFSET.
+    Cada lote: [(id, target_url, blocked_at), ...]
+    """
+    last_id = after_id
+    while True:
+        rows = (
+            db.query(models.URL.id, models.URL.target_url, models.URL.blocked_at)
+            .filter(models.URL.is_active == True, models.URL.id > last_id)
+            .order_by(models.URL.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield rows
+
+
+def count_active_urls(db: Session) -> int:
+    return db.query(func.count(models.URL.id)).filter(models.URL.is_active == True).scalar() or 0
+
+
+def iter_active_geo_target_batches(db: Session, batch_size: int, after_id: int = 0):
+    """Como iter_active_url_batches, para los destinos por país de urls activas."""
+    G = models.GeoTarget
+    last_id = after_id
+    while True:
+        rows = (
+            db.query(G.id, G.target_url, G.blocked_at)
+            .join(models.URL, models.URL.id == G.url_id)
+            .filter(models.URL.is_active == True, G.id > last_id)
+            .order_by(G.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield rows
+
+
+def count_active_geo_targets(db: Session) -> int:
+    return (
+        db.query(func.count(models.GeoTarget.id))
+        .join(models.URL, models.URL.id == models.GeoTarget.url_id)
+        .filter(models.URL.is_active == True)
+        .scalar()
+        or 0
+    )
+
+
+def get_geo_target(db: Session, url_id: int, country: str) -> models.GeoTarget | None:
+    return (
+        db.query(models.GeoTarget)
+        .filter(models.GeoTarget.url_id == url_id, models.GeoTarget.country == country)
+        .first()
+    )
+
+
+def store_geo_target_verdict(db: Session, url_id: int, country: str, target_url: str, verdict) -> None:
+    """Veredicto de un destino por país; crea la fila si falta (reglas anteriores a la tabla)."""
+    row = get_geo_target(db, url_id, country)
+    if row is None or row.target_url != target_url:
+        if row is not None:
+            db.delete(row)
+            db.flush()
+        row = models.GeoTarget(url_id=url_id, country=country, target_url=target_url, **_target_host_values(target_url))
+        db.add(row)
+        db.flush()
+    db.execute(
+        update(models.GeoTarget)
+        .where(models.GeoTarget.id == row.id)
+        .values(**_verdict_values(verdict, row.blocked_at))
+    )
+    db.commit()
+
+
+def set_geo_rules_for_tenant(
+    db: Session, tenant_id: int, rules_by_key: dict[str, str | None], verdicts: dict | None = None
+) -> list[str]:
+    """
+    Reglas por país para muchos links a la vez (una SELECT + executemany) y sus
+    filas de url_geo_targets, con el veredicto de cada destino si viene en
+    `verdicts` (target_url -> TargetVerdict).
+    Devuelve las keys que no existen o no son del tenant.
+    """
+    rows = (
+        db.query(models.URL.id, models.URL.key)
+        .filter(models.URL.tenant_id == tenant_id, models.URL.key.in_(list(rules_by_key)))
+        .all()
+    )
+    if rows:
+        db.execute(update(models.URL), [{"id": url_id, "geo_rules": rules_by_key[key]} for url_id, key in rows])
+        db.execute(delete(models.GeoTarget).where(models.GeoTarget.url_id.in_([url_id for url_id, _ in rows])))
+        targets = []
+        for url_id, key in rows:
+            for cc, target_url in ((geo_rules.load_rules(rules_by_key[key]) or {}).get("targets") or {}).items():
+                values = {"url_id": url_id, "country": cc, "target_url": target_url, **_target_host_values(target_url)}
+                verdict = (verdicts or {}).get(target_url)
+                if verdict is not None:
+                    values.update(_verdict_values(verdict, None))
+                targets.append(values)
+        if targets:
+            db.execute(insert(models.GeoTarget), targets)
+        db.commit()
+    found = {key for _, key in rows}
+    return [key for key in rules_by_key if key not in found]
+
+
+def backfill_target_hosts(db: Session, batch_size: int = 1000, on_batch=None) -> int:
+    """
+    Rellena target_host/target_host_rev en filas antiguas (NULL). Devuelve cuántas.
+    `on_batch()` se llama tras cada lote; si devuelve False se para. backfill.py
+    """
+    total = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(models.URL.id, models.URL.target_url)
+            .filter(models.URL.target_host.is_(None), models.URL.id > last_id)
+            .order_by(models.URL.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return total
+        last_id = rows[-1].id
+        db.execute(
+            update(models.URL),
+            [{"id": url_id, **_target_host_values(target_url or "")} for url_id, target_url in rows],
+        )
+        db.commit()
+        total += len(rows)
+        if on_batch is not None and not on_batch():
+            return total
+
+
+def _host_filter(host: str, include_subdomains: bool, model=models.URL):
+    """
+    WHERE para un host (y opcionalmente sus subdominios). Los subdominios son
+    el rango [rev + ".", rev + "/") de target_host_rev ("/" sigue a "." en ASCII).
+    """
+    host = normalize_host(host.strip("[]"))
+    if not include_subdomains:
+        return model.target_host == host
+    rev = _reverse_host(host)
+    return (model.target_host_rev == rev) | (
+        (model.target_host_rev >= rev + ".") & (model.target_host_rev < rev + "/")
+    )
+
+
+def _links_to_host(host: str, include_subdomains: bool):
+    # el destino principal o cualquiera de los destinos por país
+    geo = select(models.GeoTarget.url_id).where(_host_filter(host, include_subdomains, models.GeoTarget))
+    return _host_filter(host, include_subdomains) | models.URL.id.in_(geo)
+
+
+def list_urls_by_host(
+    db: Session, host: str, *, include_subdomains: bool = False, after_id: int = 0, limit: int = 100
+) -> list[models.URL]:
+    """Urls que apuntan a host (o *.host), también por un destino por país; keyset (id > after_id)."""
+    return (
+        db.query(models.URL)
+        .filter(_links_to_host(host, include_subdomains), models.URL.id > after_id)
+        .order_by(models.URL.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def deactivate_urls_by_host(db: Session, host: str, *, include_subdomains: bool = False) -> int:
+    """Desactiva en un solo UPDATE todas las urls activas de host (o *.host), destinos por país incluidos."""
+    result = db.execute(
+        update(models.URL)
+        .where(_links_to_host(host, include_subdomains), models.URL.is_active == True)
+        .values(is_active=False, disabled_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount or 0
 
 
 def deactivate_db_url_by_secret_key(db: Session, secret_key: str) -> models.URL | None:
@@ -192,6 +451,96 @@ def update_expiry_for_tenant(db: Session, url_key: str, tenant_id: int, expires_
     return db_url
 
 
+def set_count_bot_clicks_for_tenant(db: Session, url_key: str, tenant_id: int, enabled: bool) -> models.URL | None:
+    db_url = get_db_url_by_key_for_tenant(db, url_key, tenant_id)
+    if not db_url:
+        return None
+    db_url.count_bot_clicks = enabled
+    db.commit()
+    db.refresh(db_url)
+    return db_url
+
+
+def set_dedup_window_for_tenant(db: Session, url_key: str, tenant_id: int, seconds: int | None) -> models.URL | None:
+    db_url = get_db_url_by_key_for_tenant(db, url_key, tenant_id)
+    if not db_url:
+        return None
+    db_url.dedup_window_seconds = seconds
+    db.commit()
+    db.refresh(db_url)
+    return db_url
+
+
+# -------------------------
+# Leases (una sola instancia ejecuta cada tarea de fondo)
+# -------------------------
+
+def worker_id() -> str:
+    # se calcula en cada llamada: tras un fork el pid cambia
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def acquire_lease(db: Session, name: str, owner: str, ttl_seconds: int, *, min_interval_seconds: int = 0) -> bool:
+    """
+    Toma el lease `name` si está libre (caducado) y su última ejecución completa
+    terminó hace al menos `min_interval_seconds`. Atómico: un UPDATE condicional
+    (o el INSERT de la primera vez, que choca con la PK si otro se adelanta).
+    """
+    now = _utcnow()
+    until = now + timedelta(seconds=ttl_seconds)
+    result = db.execute(
+        update(models.Lease)
+        .where(
+            models.Lease.name == name,
+            models.Lease.expires_at < now,
+            or_(
+                models.Lease.completed_at.is_(None),
+                models.Lease.completed_at <= now - timedelta(seconds=min_interval_seconds),
+            ),
+        )
+        .values(owner=owner, expires_at=until)
+    )
+    if result.rowcount:
+        db.commit()
+        return True
+    db.rollback()
+    if db.get(models.Lease, name) is not None:
+        return False
+    db.add(models.Lease(name=name, owner=owner, expires_at=until))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return True
+
+
+def renew_lease(db: Session, name: str, owner: str, ttl_seconds: int) -> bool:
+    """Alarga el lease si sigue siendo de `owner`. False => se ha perdido."""
+    result = db.execute(
+        update(models.Lease)
+        .where(models.Lease.name == name, models.Lease.owner == owner)
+        .values(expires_at=_utcnow() + timedelta(seconds=ttl_seconds))
+    )
+    db.commit()
+    return bool(result.rowcount)
+
+
+def release_lease(db: Session, name: str, owner: str, *, completed: bool = False) -> None:
+    now = _utcnow()
+    values = {"expires_at": now}
+    if completed:
+        values["completed_at"] = now
+    db.execute(
+        update(models.Lease).where(models.Lease.name == name, models.Lease.owner == owner).values(**values)
+    )
+    db.commit()
+
+
 # -------------------------
 # Tenants + API keys
 # -------------------------
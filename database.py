@@ -46,3 +46,32 @@ def ensure_sqlite_schema(engine) -> None:
 
         if "tenant_id" not in cols:
             conn.execute(text("ALTER TABLE urls ADD COLUMN tenant_id INTEGER"))  # <-- CAMBIO: ownership multitenant
+
+        # Veredicto persistido de validación del destino
+        if "verdict_ok" not in cols:
+            conn.execute(text("ALTER TABLE urls ADD COLUMN verdict_ok BOOLEAN"))
+        if "verdict_reason" not in cols:
+            conn.execute(text("ALTER TABLE urls ADD COLUMN verdict_reason VARCHAR"))
+        if "verdict_generation" not in cols:
+            conn.execute(text("ALTER TABLE urls ADD COLUMN verdict_generation BIGINT"))
+        if "verdict_expires_at" not in cols:
+            conn.execute(text("ALTER TABLE urls ADD COLUMN verdict_expires_at DATETIME"))
+        if "blocked_at" not in cols:
+            conn.execute(text("ALTER TABLE urls ADD COLUMN blocked_at DATETIME"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_urls_blocked_at ON urls (blocked_at)"))
+        if "target_ips" not in cols:
+            conn.execute(text("ALTER TABLE urls ADD COLUMN target_ips VARCHAR"))
+
+        # Host del destino (las filas existentes se rellenan con backfill.py)
+        if "target_host" not in cols:
+            conn.execute(text("ALTER TABLE urls ADD COLUMN target_host VARCHAR"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_urls_target_host ON urls (target_host)"))
+        if "target_host_rev" not in cols:
+            conn.execute(text("ALTER TABLE urls ADD COLUMN target_host_rev VARCHAR"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_urls_target_host_rev ON urls (target_host_rev)"))
+        if "geo_rules" not in cols:
+            conn.execute(text("ALTER TABLE urls ADD COLUMN geo_rules TEXT"))
+        if "count_bot_clicks" not in cols:
+            conn.execute(text("ALTER TABLE urls ADD COLUMN count_bot_clicks BOOLEAN NOT NULL DEFAULT 0"))
+        if "dedup_window_seconds" not in cols:
+            conn.execute(text("ALTER TABLE urls ADD COLUMN dedup_window_seconds INTEGER"))
@@ -5,12 +5,20 @@ from __future__ import annotations
 import json
 import socket
 import time
-import ipaddress
-from typing import Optional, Tuple, List
+from typing import Optional, Sequence, Tuple, List
 
 from fastapi import HTTPException
 
+import metrics
+import tracing
+from caches import LRUCache, LRUHandle, register
 from config import settings
+from policy_lists import int_to_ip, ip_to_int, normalize_host
+
+
+# IP empaquetada: (version, entero). Es lo que circula por todo el pipeline
+# de validación; solo se convierte a texto para Redis.
+IPNum = Tuple[int, int]
 
 
 try:
@@ -39,8 +47,24 @@ def _get_redis():
     return _redis_client
 
 
-# cache local: host -> (expires_at_epoch, [ips])
-_local: dict[str, tuple[float, list[str]]] = {}
+class DNSUnavailable(HTTPException):
+    """
+    Fallo transitorio del resolver (timeout, SERVFAIL, EAI_AGAIN): no dice nada
+    del destino, así que no debe acabar en un veredicto negativo persistido.
+    """
+
+    def __init__(self, detail: str = "target_url DNS resolution failed"):
+        super().__init__(status_code=503, detail=detail)
+
+
+DNS_LOOKUPS = metrics.counter(
+    "dns_cache_lookups_total", "Consultas a la caché DNS (hit, redis_hit, stale, miss)", ("result",)
+)
+
+# cache local: host -> (expires_at_epoch, ((version, int), ...)); la caducidad
+# la decide get_cached_entry (las entradas vencidas cuentan como "stale")
+_local = LRUCache(settings.dns_local_cache_size)
+register(LRUHandle("dns", _local, "host -> IPs resueltas (solo este worker, no Redis)", key_from_str=normalize_host))
 
 
 def _clamp_ttl(ttl: int) -> int:
@@ -49,11 +73,21 @@ def _clamp_ttl(ttl: int) -> int:
     return max(mn, min(mx, ttl))
 
 
-def resolve_host(host_ascii: str) -> Tuple[List[ipaddress._BaseAddress], int]:
+def _append_ip(ips: list[IPNum], ip_str: str) -> None:
+    ip_num = ip_to_int(ip_str)
+    if ip_num is not None and ip_num not in ips:
+        ips.append(ip_num)
+
+
+@tracing.traced("dns")
+def resolve_host(host_ascii: str) -> Tuple[List[IPNum], int]:
     """
     Devuelve (ips, ttl_seconds_efectivo).
     - modo fixed: ttl=settings.dns_cache_ttl_seconds
     - modo dns: usa TTL del registro (requiere dnspython)
+
+    HTTPException 400 si el host no existe o no tiene direcciones;
+    DNSUnavailable si el resolver no ha podido contestar.
     """
     mode = (settings.dns_cache_mode or "fixed").lower()
 
@@ -63,27 +97,34 @@ def resolve_host(host_ascii: str) -> Tuple[List[ipaddress._BaseAddress], int]:
             mode = "fixed"
         else:
             ttl = None
-            ips: list[ipaddress._BaseAddress] = []
+            ips: list[IPNum] = []
+            transient = False
             r = dns.resolver.Resolver()
             # A
             try:
                 ans = r.resolve(host_ascii, "A")
                 ttl = ans.rrset.ttl
                 for rr in ans:
-                    ips.append(ipaddress.ip_address(rr.address))
-            except Exception:
+                    _append_ip(ips, rr.address)
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
                 pass
+            except Exception:
+                transient = True
             # AAAA
             try:
                 ans6 = r.resolve(host_ascii, "AAAA")
                 ttl6 = ans6.rrset.ttl
                 ttl = ttl6 if ttl is None else min(ttl, ttl6)
                 for rr in ans6:
-                    ips.append(ipaddress.ip_address(rr.address))
-            except Exception:
+                    _append_ip(ips, rr.address)
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
                 pass
+            except Exception:
+                transient = True
 
             if not ips:
+                if transient:
+                    raise DNSUnavailable()
                 raise HTTPException(status_code=400, detail="target_url host does not resolve")
 
             ttl_eff = _clamp_ttl(int(ttl) if ttl is not None else int(settings.dns_cache_ttl_seconds))
@@ -92,18 +133,17 @@ def resolve_host(host_ascii: str) -> Tuple[List[ipaddress._BaseAddress], int]:
     # fixed mode (socket)
     try:
         infos = socket.getaddrinfo(host_ascii, None)
-    except socket.gaierror:
+    except socket.gaierror as e:
+        if e.errno == socket.EAI_AGAIN:
+            raise DNSUnavailable()
         raise HTTPException(status_code=400, detail="target_url host does not resolve")
     except Exception:
-        raise HTTPException(status_code=400, detail="target_url DNS resolution failed")
+        raise DNSUnavailable()
 
-    ips: list[ipaddress._BaseAddress] = []
+    # getaddrinfo repite cada IP por socktype (STREAM/DGRAM/RAW) => dedupe
+    ips: list[IPNum] = []
     for info in infos:
-        ip_str = info[4][0]
-        try:
-            ips.append(ipaddress.ip_address(ip_str))
-        except ValueError:
-            continue
+        _append_ip(ips, info[4][0])
 
     if not ips:
         raise HTTPException(status_code=400, detail="target_url host does not resolve")
@@ -111,7 +151,8 @@ def resolve_host(host_ascii: str) -> Tuple[List[ipaddress._BaseAddress], int]:
     return ips, int(settings.dns_cache_ttl_seconds)
 
 
-def get_cached(host_ascii: str) -> Optional[List[ipaddress._BaseAddress]]:
+def get_cached_entry(host_ascii: str) -> Optional[Tuple[float, Sequence[IPNum]]]:
+    """(expires_at_epoch, ips) si hay entrada vigente; None si no."""
     now = time.time()
 
     r = _get_redis()
@@ -123,26 +164,40 @@ def get_cached(host_ascii: str) -> Optional[List[ipaddress._BaseAddress]]:
                 payload = json.loads(raw)
                 expires_at = float(payload["expires_at"])
                 if now < expires_at:
-                    ips = [ipaddress.ip_address(x) for x in payload["ips"]]
-                    return ips
+                    ips: list[IPNum] = []
+                    for x in payload["ips"]:
+                        _append_ip(ips, x)
+                    metrics.inc(DNS_LOOKUPS, ("redis_hit",))
+                    return expires_at, ips
             except Exception:
                 pass
 
     cached = _local.get(host_ascii)
     if cached and now < cached[0]:
-        return [ipaddress.ip_address(x) for x in cached[1]]
+        metrics.inc(DNS_LOOKUPS, ("hit",))
+        return cached
 
+    metrics.inc(DNS_LOOKUPS, ("stale",) if cached else ("miss",))
     return None
 
 
-def set_cached(host_ascii: str, ips: List[ipaddress._BaseAddress], ttl: int) -> None:
+def get_cached(host_ascii: str) -> Optional[Sequence[IPNum]]:
+    entry = get_cached_entry(host_ascii)
+    return entry[1] if entry is not None else None
+
+
+def set_cached(host_ascii: str, ips: Sequence[IPNum], ttl: int) -> float:
+    """Guarda la resolución y devuelve su expires_at (epoch)."""
     expires_at = time.time() + max(1, int(ttl))
-    ip_strs = [str(ip) for ip in ips]
 
-    _local[host_ascii] = (expires_at, ip_strs)
+    # tupla inmutable: get_cached la devuelve sin copiar
+    _local.set(host_ascii, (expires_at, tuple(ips)))
 
     r = _get_redis()
     if r is not None:
         key = f"dns:{host_ascii}"
+        ip_strs = [int_to_ip(ip) for ip in ips]
         payload = {"expires_at": expires_at, "ips": ip_strs}
         r.setex(key, max(1, int(ttl)), json.dumps(payload))
+
+    return expires_at
@@ -1,9 +1,10 @@
 # enterprise_admin_router.py
 from __future__ import annotations
 
-from typing import Optional
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 
 from database import get_db  # asumo que existe en tu database.py (muy típico). Si no, lo ajustamos en 30s.
@@ -20,8 +21,24 @@ from enterprise_schemas import (
     ApiKeyCreatedOnce,
     ApiKeyUpdate,
     AuditOut,
+    CacheInvalidateResult,
+    CacheOut,
+    CachePurgeResult,
+    CacheResize,
+    HostLinksDisable,
+    HostLinksDisableResult,
+    HostLinksPage,
 )
+import caches
+import click_dedup
+import click_events
+import crud
 import enterprise_crud as ecrud
+import geoip_service
+import logger
+import profiler
+import revalidation
+import trending
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -185,3 +202,190 @@ def list_audit(
     admin: AdminPrincipal = Depends(require_admin),
 ):
     return ecrud.list_audit(db, company_id=company_id, limit=limit)
+
+
+# -------- Revalidación de destinos --------
+
+@router.get("/revalidation")
+def revalidation_status(admin: AdminPrincipal = Depends(require_admin)):
+    return revalidation.sweeper.stats.as_dict()
+
+
+@router.post("/revalidation/run", status_code=202)
+def revalidation_run(admin: AdminPrincipal = Depends(require_admin)):
+    started = revalidation.sweeper.trigger()
+    return {"started": started, **revalidation.sweeper.stats.as_dict()}
+
+
+# -------- Eventos de click --------
+
+@router.get("/clicks")
+def click_events_stats(admin: AdminPrincipal = Depends(require_admin)):
+    return {**click_events.stats(), "dedup": click_dedup.stats()}
+
+
+# -------- Logging --------
+
+@router.get("/logging")
+def logging_stats(admin: AdminPrincipal = Depends(require_admin)):
+    return logger.stats()
+
+
+# -------- GeoIP --------
+
+@router.get("/geoip")
+def geoip_stats(admin: AdminPrincipal = Depends(require_admin)):
+    return geoip_service.stats()
+
+
+# -------- Cachés en memoria --------
+# Todo por worker: cada proceso tiene sus propias cachés.
+
+def _cache_or_404(name: str) -> caches.CacheHandle:
+    handle = caches.get_handle(name)
+    if handle is None:
+        raise HTTPException(status_code=404, detail="Cache not found")
+    return handle
+
+
+def _audit_cache(db: Session, request: Request, admin: AdminPrincipal, action: str, name: str, after: dict) -> None:
+    ecrud.write_audit(
+        db,
+        actor_subject=admin.subject,
+        actor_source=admin.source,
+        action=action,
+        target_type="cache",
+        target_id=name,
+        after=after,
+        ip=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent"),
+    )
+
+
+@router.get("/caches", response_model=list[CacheOut])
+def list_caches(admin: AdminPrincipal = Depends(require_admin)):
+    return [handle.describe() for handle in caches.registered()]
+
+
+@router.post("/caches/{name}/purge", response_model=CachePurgeResult)
+def purge_cache(
+    name: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    admin: AdminPrincipal = Depends(require_admin),
+):
+    purged = _cache_or_404(name).purge()
+    _audit_cache(db, request, admin, "cache.purge", name, {"purged": purged})
+    return CachePurgeResult(name=name, purged=purged)
+
+
+@router.patch("/caches/{name}", response_model=CacheOut)
+def resize_cache(
+    name: str,
+    payload: CacheResize,
+    request: Request,
+    db: Session = Depends(get_db),
+    admin: AdminPrincipal = Depends(require_admin),
+):
+    handle = _cache_or_404(name)
+    before = handle.info().get("maxsize")
+    try:
+        handle.resize(payload.maxsize)
+    except caches.CacheOperationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _audit_cache(db, request, admin, "cache.resize", name, {"maxsize_before": before, "maxsize": payload.maxsize})
+    return handle.describe()
+
+
+@router.delete("/caches/{name}/keys/{key:path}", response_model=CacheInvalidateResult)
+def invalidate_cache_key(
+    name: str,
+    key: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    admin: AdminPrincipal = Depends(require_admin),
+):
+    try:
+        invalidated = _cache_or_404(name).invalidate(key)
+    except caches.CacheOperationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _audit_cache(db, request, admin, "cache.invalidate", name, {"key": key, "invalidated": invalidated})
+    return CacheInvalidateResult(name=name, key=key, invalidated=invalidated)
+
+
+# -------- Profiler --------
+
+@router.post("/profile")
+def profile_worker(
+    request: Request,
+    seconds: float = Query(default=10.0, gt=0),
+    interval_ms: float = Query(default=5.0, ge=1, le=1000),
+    format: Literal["collapsed", "json"] = "collapsed",
+    include_idle: bool = False,
+    admin: AdminPrincipal = Depends(require_admin),
+):
+    # Bloquea este hilo durante la captura (acotada a PROFILER_MAX_SECONDS);
+    # las muestras son del worker que atiende la petición
+    try:
+        capture, elapsed = profiler.profile(
+            request.app.routes, seconds=seconds, interval_ms=interval_ms, include_idle=include_idle
+        )
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "json":
+        return {"seconds": round(elapsed, 3), "interval_ms": interval_ms, **capture.summary()}
+    return PlainTextResponse(capture.collapsed())
+
+
+# -------- Links en tendencia --------
+
+@router.get("/trending")
+def trending_links(
+    window: Literal["1m", "15m", "1h"] = "1m",
+    k: int = Query(default=20, ge=1, le=200),
+    tenant_id: Optional[int] = None,
+    admin: AdminPrincipal = Depends(require_admin),
+):
+    # Por worker: cada proceso ve solo los redirects que ha servido él
+    return {"window": window, "tenant_id": tenant_id, "items": trending.top(window, k, tenant_id=tenant_id)}
+
+
+# -------- Links por host de destino --------
+
+@router.get("/links/by-host", response_model=HostLinksPage)
+def list_links_by_host(
+    host: str,
+    include_subdomains: bool = False,
+    after_id: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    admin: AdminPrincipal = Depends(require_admin),
+):
+    rows = crud.list_urls_by_host(
+        db, host, include_subdomains=include_subdomains, after_id=after_id, limit=limit
+    )
+    return HostLinksPage(items=rows, next_after_id=rows[-1].id if len(rows) == limit else None)
+
+
+@router.post("/links/by-host/disable", response_model=HostLinksDisableResult)
+def disable_links_by_host(
+    payload: HostLinksDisable,
+    request: Request,
+    db: Session = Depends(get_db),
+    admin: AdminPrincipal = Depends(require_admin),
+):
+    disabled = crud.deactivate_urls_by_host(db, payload.host, include_subdomains=payload.include_subdomains)
+    ecrud.write_audit(
+        db,
+        actor_subject=admin.subject,
+        actor_source=admin.source,
+        action="links.disable_by_host",
+        target_type="host",
+        target_id=payload.host,
+        after={"include_subdomains": payload.include_subdomains, "disabled": disabled},
+        ip=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent"),
+    )
+    return HostLinksDisableResult(
+        host=payload.host, include_subdomains=payload.include_subdomains, disabled=disabled
+    )
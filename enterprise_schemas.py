@@ -114,3 +114,66 @@ class AuditOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# ---------- Links por host ----------
+
+class HostLinkOut(BaseModel):
+    id: int
+    key: str
+    target_url: str
+    target_host: Optional[str] = None
+    tenant_id: Optional[int] = None
+    is_active: bool
+    disabled_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class HostLinksPage(BaseModel):
+    items: List[HostLinkOut]
+    # pasar como after_id para la siguiente página (None = no hay más)
+    next_after_id: Optional[int] = None
+
+
+class HostLinksDisable(BaseModel):
+    host: str = Field(..., min_length=1, max_length=253)
+    include_subdomains: bool = False
+
+
+class HostLinksDisableResult(BaseModel):
+    host: str
+    include_subdomains: bool
+    disabled: int
+
+
+class CacheOut(BaseModel):
+    name: str
+    kind: str
+    description: str = ""
+    entries: int
+    maxsize: Optional[int] = None
+    estimated_bytes: Optional[int] = None
+    hits: Optional[int] = None
+    misses: Optional[int] = None
+    hit_ratio: Optional[float] = None
+    evictions: Optional[int] = None
+    resizable: bool
+    invalidatable: bool
+
+
+class CacheResize(BaseModel):
+    maxsize: int = Field(..., ge=1, le=10_000_000)
+
+
+class CachePurgeResult(BaseModel):
+    name: str
+    purged: int
+
+
+class CacheInvalidateResult(BaseModel):
+    name: str
+    key: str
+    invalidated: bool
@@ -0,0 +1,86 @@
+# geo_rules.py
+
+"""
+Reglas por país de cada link (urls.geo_rules, JSON):
+
+    {
+      "block":   ["RU", "KP"],                         # países sin acceso (403)
+      "targets": {"DE": "https://example.de/oferta"}   # destino alternativo por país
+    }
+
+En el redirect solo se paga algo si el link TIENE reglas: una consulta GeoIP
+(cacheada en geoip_service) y un lookup en un dict. Las reglas se compilan una
+vez por worker y se guardan en una LRU por id de link junto con el JSON del que
+salieron; si la fila cambia (otro worker actualizó las reglas), el JSON ya no
+coincide y se recompila.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from typing import Optional
+
+from caches import MISSING, LRUCache, LRUHandle, register
+
+
+# Sin país conocido (GeoIP desactivado / IP privada) se usa el destino por defecto
+_DEFAULT_ACTION = (False, None)
+
+
+@dataclass(frozen=True)
+class GeoRules:
+    # country_code -> (bloqueado, destino alternativo o None)
+    by_country: dict[str, tuple[bool, Optional[str]]] = field(default_factory=dict)
+
+    def action_for(self, country_code: Optional[str]) -> tuple[bool, Optional[str]]:
+        if country_code is None:
+            return _DEFAULT_ACTION
+        return self.by_country.get(country_code, _DEFAULT_ACTION)
+
+
+def normalize_rules(block: list[str] | None, targets: dict[str, str] | None) -> Optional[dict]:
+    """Forma canónica del JSON (códigos ISO en mayúsculas). None si no hay reglas."""
+    block_cc = sorted({cc.strip().upper() for cc in block or () if cc.strip()})
+    target_cc = {cc.strip().upper(): url for cc, url in (targets or {}).items() if cc.strip()}
+    if not block_cc and not target_cc:
+        return None
+    return {"block": block_cc, "targets": dict(sorted(target_cc.items()))}
+
+
+def dump_rules(rules: Optional[dict]) -> Optional[str]:
+    return json.dumps(rules, separators=(",", ":")) if rules else None
+
+
+def load_rules(raw: Optional[str]) -> Optional[dict]:
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+def compile_rules(raw: str) -> GeoRules:
+    rules = load_rules(raw) or {}
+    by_country: dict[str, tuple[bool, Optional[str]]] = {}
+    for cc, url in (rules.get("targets") or {}).items():
+        by_country[cc] = (False, url)
+    # block gana si un país aparece en ambos
+    for cc in rules.get("block") or ():
+        by_country[cc] = (True, None)
+    return GeoRules(by_country)
+
+
+# url_id -> (json, GeoRules)
+_compiled = LRUCache(16384)
+register(LRUHandle("geo_rules", _compiled, "id de link -> reglas por país compiladas", key_from_str=int))
+
+
+def rules_for(url_id: int, raw: str) -> GeoRules:
+    cached = _compiled.get(url_id, MISSING)
+    if cached is not MISSING and cached[0] == raw:
+        return cached[1]
+    compiled = compile_rules(raw)
+    _compiled.set(url_id, (raw, compiled))
+    return compiled
@@ -1,18 +1,30 @@
 # geoip_service.py  (NUEVO)
 
+"""
+IP -> country ISO code (MaxMind GeoLite2 Country).
+
+- Reader en modo MODE_MMAP: los workers forkeados comparten las páginas del
+  .mmdb (page cache del SO) en vez de copiarlo cada uno a su heap.
+- Caché LRU acotada (GEOIP_CACHE_SIZE) con TTL; opcionalmente por prefijo
+  /24 (IPv4) o /48 (IPv6) con GEOIP_CACHE_BY_PREFIX para subir el hit ratio.
+- stats(): hit ratio de la caché y latencia de las consultas al reader.
+"""
+
 from __future__ import annotations
 
+import threading
 import time
-import ipaddress
 from functools import lru_cache
 from typing import Optional
 
-from config import get_settings
-
-settings = get_settings()
+import metrics
+from caches import MISSING, LRUCache, LRUHandle, register
+from config import settings
+from policy_lists import ip_to_int
 
 try:
     import geoip2.database  # type: ignore
+    import maxminddb  # type: ignore
 except Exception:
     geoip2 = None  # <-- CAMBIO: fallback si no está instalado
 
@@ -24,45 +36,99 @@ def _get_reader():
     if geoip2 is None:
         return None
     try:
-        return geoip2.database.Reader(settings.geoip_mmdb_path)
+        return geoip2.database.Reader(settings.geoip_mmdb_path, mode=maxminddb.MODE_MMAP)
     except Exception:
         return None
 
 
-# cache simple: ip -> (ts, country_code)
-_geo_cache: dict[str, tuple[float, Optional[str]]] = {}
+# cache acotada: clave (version, ip o prefijo) -> country_code
+_geo_cache = LRUCache(settings.geoip_cache_size, ttl_seconds=max(1, int(settings.geoip_cache_ttl_seconds)))
+
+# latencia de consultas al reader (solo fallos de caché)
+_stats_lock = threading.Lock()
+_reader_lookups = 0
+_reader_ns = 0
+
+
+def cache_key(ip_num: tuple[int, int], by_prefix: bool) -> tuple[int, int]:
+    version, ip_int = ip_num
+    if not by_prefix:
+        return ip_num
+    # /24 en IPv4, /48 en IPv6
+    return version, (ip_int >> 8) if version == 4 else (ip_int >> 80)
+
+
+def _key_from_ip(ip: str) -> tuple[int, int]:
+    ip_num = ip_to_int(ip)
+    if ip_num is None:
+        raise ValueError("not an IP address")
+    return cache_key(ip_num, settings.geoip_cache_by_prefix)
+
+
+register(LRUHandle("geoip", _geo_cache, "IP (o prefijo) -> país", key_from_str=_key_from_ip))
 
 
 def country_code_for_ip(ip: str) -> Optional[str]:
     """
     Devuelve country ISO code (p.ej. "ES") o None.
-    Cache TTL para no penalizar rendimiento.
+    Cache LRU con TTL para no penalizar rendimiento.
     """
+    global _reader_lookups, _reader_ns
+
     if not settings.geoip_enabled:
         return None
 
-    try:
-        ipaddress.ip_address(ip)
-    except Exception:
+    ip_num = ip_to_int(ip)
+    if ip_num is None:
         return None
 
-    now = time.time()
-    ttl = max(1, int(settings.geoip_cache_ttl_seconds))
-
-    cached = _geo_cache.get(ip)
-    if cached and (now - cached[0]) < ttl:
-        return cached[1]
+    key = cache_key(ip_num, settings.geoip_cache_by_prefix)
+    cached = _geo_cache.get(key, MISSING)
+    if cached is not MISSING:
+        return cached
 
     reader = _get_reader()
     if reader is None:
-        _geo_cache[ip] = (now, None)
+        _geo_cache.set(key, None)
         return None
 
+    t0 = time.perf_counter_ns()
     try:
-        resp = reader.country(ip)
-        code = resp.country.iso_code
+        code = reader.country(ip).country.iso_code
     except Exception:
         code = None
+    elapsed = time.perf_counter_ns() - t0
+
+    with _stats_lock:
+        _reader_lookups += 1
+        _reader_ns += elapsed
 
-    _geo_cache[ip] = (now, code)
+    _geo_cache.set(key, code)
     return code
+
+
+def stats() -> dict:
+    with _stats_lock:
+        lookups, total_ns = _reader_lookups, _reader_ns
+    return {
+        "enabled": settings.geoip_enabled,
+        "reader_loaded": _get_reader() is not None,
+        "cache_by_prefix": settings.geoip_cache_by_prefix,
+        "cache": _geo_cache.stats(),
+        "reader_lookups": lookups,
+        "reader_avg_us": (total_ns / lookups / 1000) if lookups else None,
+    }
+
+
+_GEO_CACHE = metrics.gauge("geoip_cache", "Caché GeoIP: entradas, aciertos, fallos, desalojos", ("stat",))
+_GEO_LOOKUPS = metrics.gauge("geoip_reader_lookups", "Consultas al .mmdb (fallos de caché)")
+
+
+def _collect_metrics():
+    s = stats()
+    cache = s["cache"]
+    yield _GEO_CACHE, {(k,): cache[k] for k in ("size", "maxsize", "hits", "misses", "evictions")}
+    yield _GEO_LOOKUPS, {(): s["reader_lookups"]}
+
+
+metrics.register_collector(_collect_metrics)
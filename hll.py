@@ -0,0 +1,348 @@
+# hll.py
+
+"""
+Visitantes únicos por link con HyperLogLog.
+
+Guardar cada par (link, visitante) no escala; un sketch HLL da una estimación
+con memoria fija por link:
+
+- p = 12 -> 4096 registros de 1 byte = 4 KiB por sketch (link o link-día).
+- Error típico (desviación estándar relativa) 1.04 / sqrt(4096) ≈ 1.6%;
+  ~95% de las estimaciones quedan dentro de ±3.3%.
+- Visitante = hash con clave (blake2b + HMAC_SECRET_KEY) de IP + user-agent:
+  ni la IP ni el UA se guardan ni se pueden recuperar del sketch.
+
+Cada worker acumula en memoria solo los sketches tocados desde el último
+volcado; un hilo de fondo los fusiona (máximo por registro) con los de la BD
+cada HLL_PERSIST_INTERVAL_SECONDS. La fusión es idempotente y conmutativa; la
+escritura es un compare-and-swap sobre los registros leídos (SQLite ignora
+FOR UPDATE), así que si otro worker volcó el mismo sketch entremedias se relee
+y se vuelve a fusionar en vez de pisar sus visitantes.
+
+Los sketches pendientes están acotados (HLL_MAX_PENDING): a la mitad se
+adelanta el volcado y, lleno (p. ej. con la BD caída), las visitas que
+abrirían un sketch nuevo se descartan y se cuentan en hll_dropped_total.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import bindparam, delete, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import metrics
+import models
+from config import settings
+from database import SessionLocal
+from logger import logger
+
+
+P = 12
+M = 1 << P
+_HASH_BITS = 64
+_W_BITS = _HASH_BITS - P
+_W_MASK = (1 << _W_BITS) - 1
+_ALPHA = 0.7213 / (1 + 1.079 / M)
+
+ALL_TIME = "all"
+RELATIVE_ERROR = 1.04 / M ** 0.5
+
+
+def new_registers() -> bytearray:
+    return bytearray(M)
+
+
+def add_hash(registers: bytearray, h: int) -> None:
+    idx = h >> _W_BITS
+    w = h & _W_MASK
+    # posición del primer 1 en los 52 bits restantes (1..53)
+    rank = _W_BITS - w.bit_length() + 1
+    if rank > registers[idx]:
+        registers[idx] = rank
+
+
+def merge_into(dst: bytearray, src: bytes) -> None:
+    for i, r in enumerate(src):
+        if r > dst[i]:
+            dst[i] = r
+
+
+def estimate(registers: bytes) -> int:
+    z = 0.0
+    zeros = 0
+    for r in registers:
+        z += 2.0 ** -r
+        if r == 0:
+            zeros += 1
+    e = _ALPHA * M * M / z
+    # rango pequeño: linear counting
+    if e <= 2.5 * M and zeros:
+        e = M * math.log(M / zeros)
+    return int(round(e))
+
+
+def visitor_hash(ip: str, ua: str) -> int:
+    key = (settings.hmac_secret_key or "").encode("utf-8")[:64]
+    digest = hashlib.blake2b(f"{ip}\x00{ua}".encode("utf-8", "replace"), digest_size=8, key=key).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _day_period(ts: Optional[datetime] = None) -> str:
+    return (ts or datetime.now(timezone.utc)).date().isoformat()
+
+
+DROPPED = metrics.counter(
+    "hll_dropped_total", "Visitas o sketches descartados por el tope de sketches pendientes", ("reason",)
+)
+
+
+class SketchStore:
+    """Sketches pendientes de volcar de ESTE worker: (url_id, periodo) -> registros."""
+
+    def __init__(
+        self, *, session_factory=SessionLocal, persist_interval_seconds: int = 30, max_pending: int = 16384
+    ):
+        self.session_factory = session_factory
+        self.persist_interval = max(1, int(persist_interval_seconds))
+        self.max_pending = max(2, int(max_pending))
+        self._pending: dict[tuple[int, str], bytearray] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flush_now = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+
+    # ---- hot path ----
+
+    def record(self, url_id: int, ip: str, ua: str) -> None:
+        h = visitor_hash(ip, ua)
+        day = _day_period()
+        dropped = 0
+        with self._lock:
+            pending = self._pending
+            for period in (ALL_TIME, day):
+                regs = pending.get((url_id, period))
+                if regs is None:
+                    if len(pending) >= self.max_pending:
+                        dropped += 1
+                        continue
+                    regs = pending[(url_id, period)] = new_registers()
+                add_hash(regs, h)
+            flush_early = len(pending) >= self.max_pending // 2
+        if dropped:
+            metrics.inc(DROPPED, ("full",), dropped)
+        if flush_early:
+            self._flush_now.set()
+
+    # ---- lectura ----
+
+    def estimates(self, db: Session, url_id: int, periods: Iterable[str]) -> dict[str, int]:
+        """Estimación por periodo: BD + lo pendiente de este worker."""
+        return self.estimates_many(db, [url_id], periods)[url_id]
+
+    def estimates_many(
+        self, db: Session, url_ids: Iterable[int], periods: Iterable[str]
+    ) -> dict[int, dict[str, int]]:
+        """Como estimates() para varios links con una sola consulta (listados)."""
+        url_ids, periods = list(url_ids), list(periods)
+        if not url_ids:
+            return {}
+        U = models.UniqueSketch
+        rows = db.execute(
+            select(U.url_id, U.period, U.registers).where(U.url_id.in_(url_ids), U.period.in_(periods))
+        ).all()
+        merged = {(url_id, period): bytearray(regs) for url_id, period, regs in rows}
+        with self._lock:
+            for url_id in url_ids:
+                for period in periods:
+                    pending = self._pending.get((url_id, period))
+                    if pending is not None:
+                        merge_into(merged.setdefault((url_id, period), new_registers()), pending)
+        return {
+            url_id: {
+                period: estimate(merged[(url_id, period)]) if (url_id, period) in merged else 0
+                for period in periods
+            }
+            for url_id in url_ids
+        }
+
+    # ---- volcado ----
+
+    def persist(self, max_attempts: int = 5) -> int:
+        """Fusiona los sketches pendientes con los de la BD. Devuelve cuántos."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        db = self.session_factory()
+        try:
+            for _ in range(max_attempts):
+                if self._write_merged(db, pending):
+                    return len(pending)
+                # otro worker escribió alguno de estos sketches: releer y refusionar
+                db.rollback()
+            raise RuntimeError(f"hll persist: concurrent writers, gave up after {max_attempts} attempts")
+        except Exception:
+            db.rollback()
+            # se vuelve a fusionar en el siguiente intento, sin pasar del tope:
+            # con la BD caída mucho tiempo se pierden sketches, no memoria
+            dropped = 0
+            with self._lock:
+                for key, regs in pending.items():
+                    current = self._pending.get(key)
+                    if current is not None:
+                        merge_into(current, regs)
+                    elif len(self._pending) < self.max_pending:
+                        self._pending[key] = regs
+                    else:
+                        dropped += 1
+            if dropped:
+                metrics.inc(DROPPED, ("persist_failed",), dropped)
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _write_merged(db: Session, pending: dict[tuple[int, str], bytearray]) -> bool:
+        """
+        Un intento de volcado en una transacción: lee, fusiona y escribe solo si
+        la fila sigue como se leyó. False (sin commit) si alguna cambió o si
+        otro worker insertó primero el mismo sketch.
+        """
+        U = models.UniqueSketch
+        existing = {
+            (url_id, period): regs
+            for url_id, period, regs in db.execute(
+                select(U.url_id, U.period, U.registers)
+                .where(tuple_(U.url_id, U.period).in_(list(pending)))
+                .with_for_update()
+            ).all()
+        }
+        now = datetime.utcnow()
+        updates, inserts = [], []
+        for key, regs in pending.items():
+            old = existing.get(key)
+            if old is not None:
+                # max por registro: fusionar de nuevo en un reintento no cambia nada
+                merge_into(regs, old)
+                updates.append(
+                    {"k_url_id": key[0], "k_period": key[1], "k_old": old, "new_regs": bytes(regs), "now": now}
+                )
+            else:
+                inserts.append({"url_id": key[0], "period": key[1], "registers": bytes(regs), "updated_at": now})
+
+        if updates:
+            # sobre la tabla (Core): el bulk update del ORM no admite WHERE extra
+            t = U.__table__
+            cas = (
+                update(t)
+                .where(t.c.url_id == bindparam("k_url_id"), t.c.period == bindparam("k_period"))
+                .where(t.c.registers == bindparam("k_old"))
+                .values(registers=bindparam("new_regs"), updated_at=bindparam("now"))
+            )
+            if db.get_bind().dialect.supports_sane_multi_rowcount:
+                if db.execute(cas, updates).rowcount != len(updates):
+                    return False
+            elif not all(db.execute(cas, row).rowcount == 1 for row in updates):
+                return False
+        if inserts:
+            db.add_all([U(**row) for row in inserts])
+            try:
+                db.flush()
+            except IntegrityError:
+                return False
+        db.commit()
+        return True
+
+    def prune(self, keep_days: int) -> int:
+        """Borra sketches diarios más antiguos que keep_days."""
+        cutoff = (date.today() - timedelta(days=max(1, keep_days))).isoformat()
+        U = models.UniqueSketch
+        db = self.session_factory()
+        try:
+            # los periodos diarios son ISO (YYYY-MM-DD): orden lexicográfico = cronológico
+            result = db.execute(delete(U).where(U.period != ALL_TIME, U.period < cutoff))
+            db.commit()
+            return result.rowcount or 0
+        finally:
+            db.close()
+
+    # ---- ciclo de vida ----
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="hll-persister", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._flush_now.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            self.persist()
+        except Exception:
+            logger.exception("hll persist on shutdown failed")
+
+    def _loop(self) -> None:
+        while True:
+            # cada intervalo, o antes si record() ve media capacidad ocupada
+            self._flush_now.wait(self.persist_interval)
+            self._flush_now.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.persist()
+                if time.monotonic() - self._last_prune >= 3600:
+                    self._last_prune = time.monotonic()
+                    self.prune(settings.hll_day_retention_days)
+            except Exception:
+                logger.exception("hll persist failed")
+                # sin reintentos seguidos contra una BD caída
+                self._stop.wait(self.persist_interval)
+
+
+store = SketchStore(
+    persist_interval_seconds=settings.hll_persist_interval_seconds, max_pending=settings.hll_max_pending
+)
+
+
+def record_visit(url_id: int, ip: str, ua: str) -> None:
+    if settings.hll_enabled:
+        store.record(url_id, ip, ua)
+
+
+def unique_visitors(db: Session, url_id: int) -> tuple[int, int]:
+    """(únicos totales, únicos hoy UTC)."""
+    today = _day_period()
+    est = store.estimates(db, url_id, (ALL_TIME, today))
+    return est[ALL_TIME], est[today]
+
+
+def unique_visitors_many(db: Session, url_ids: Iterable[int]) -> dict[int, tuple[int, int]]:
+    """unique_visitors() de varios links en una consulta: url_id -> (totales, hoy)."""
+    today = _day_period()
+    return {
+        url_id: (est[ALL_TIME], est[today])
+        for url_id, est in store.estimates_many(db, url_ids, (ALL_TIME, today)).items()
+    }
+
+
+def start_persister() -> None:
+    if settings.hll_enabled:
+        store.start()
+
+
+def stop_persister() -> None:
+    store.stop()
@@ -3,6 +3,12 @@ from sqlalchemy.orm import Session
 
 from config import settings
 import crud
+import metrics
+
+
+KEYGEN_RETRIES = metrics.counter(
+    "keygen_retries_total", "Claves generadas de nuevo por colisión", ("reason",)
+)
 
 
 
@@ -21,5 +27,6 @@ def create_secret_key() -> str:
 def create_unique_url_key(db: Session) -> str:
     key = create_url_key()
     while crud.get_db_url_by_key(db, key):
+        metrics.inc(KEYGEN_RETRIES, ("exists",))
         key = create_url_key()
     return key
@@ -1,12 +1,121 @@
+"""
+Logging estructurado (una línea JSON por evento) sin I/O en el request.
+
+- JsonFormatter: serializa con json (escapa comillas, UA raros, etc.).
+- Los handlers de "shortener" solo encolan (QueueHandler con cola acotada de
+  LOG_QUEUE_SIZE); un QueueListener en otro hilo formatea y escribe a stderr.
+  Con la cola llena el registro se descarta y se cuenta (stats()["dropped"]).
+- log_event("redirect", key=..., status=...): eventos con campos, muestreables
+  por tipo con LOG_SAMPLE_RATES="redirect=0.1,..." (la línea lleva sample_rate
+  para poder reescalar).
+
+LOG_ASYNC=false vuelve al StreamHandler síncrono (depuración).
+"""
+
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import random
+from collections import Counter
+
+from config import settings
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        else:
+            entry["msg"] = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que no bloquea: si la cola está llena, descarta y cuenta."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Lo mínimo en el hilo del request: fijar el mensaje y la traza (que no
+        # se pueden serializar más tarde). El JSON lo hace el listener.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_sample_rates(items) -> dict[str, float]:
+    rates = {}
+    for item in items:
+        event, _, rate = item.partition("=")
+        try:
+            rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
 
 logger = logging.getLogger("shortener")
 logger.setLevel(logging.INFO)
 
-handler = logging.StreamHandler()
-formatter = logging.Formatter(
-    '{"time":"%(asctime)s","level":"%(levelname)s","msg":"%(message)s"}'
-)
-handler.setFormatter(formatter)
+_sample_rates = _parse_sample_rates(settings.log_sample_rates)
+_sampled_out: Counter = Counter()
+
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(JsonFormatter())
+
+_queue_handler = None
+_listener = None
 if not logger.handlers:
-    logger.addHandler(handler)
+    if settings.log_async:
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=max(1, settings.log_queue_size)))
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, _stream_handler)
+        _listener.start()
+        atexit.register(_listener.stop)  # vacía la cola al salir
+        logger.addHandler(_queue_handler)
+    else:
+        logger.addHandler(_stream_handler)
+
+
+def log_event(event: str, level: int = logging.INFO, **fields) -> None:
+    """Una línea JSON {"event": ..., **fields}, sujeta a LOG_SAMPLE_RATES."""
+    if not logger.isEnabledFor(level):
+        return
+    rate = _sample_rates.get(event, 1.0)
+    if rate < 1.0:
+        if random.random() >= rate:
+            _sampled_out[event] += 1
+            return
+        fields["sample_rate"] = rate
+    logger.log(level, event, extra={"fields": {"event": event, **fields}})
+
+
+def stats() -> dict:
+    return {
+        "async": _queue_handler is not None,
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+        "sample_rates": _sample_rates,
+        "sampled_out": dict(_sampled_out),
+    }
@@ -1,29 +1,70 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Depends, HTTPException, Request, Header, status
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse
 from pydantic import BaseModel
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, object_session
 from starlette.datastructures import URL
 
+import backfill
 import crud
 import keygen
 import models
 import schemas
 import math
+import revalidation
+import geo_rules
+import click_dedup
+import click_events
+import click_stats
+import hll
+import metrics
+import query_stats
+import trending
+import tracing
+import ua_classifier
 
 from config import settings
 from database import engine, get_db, ensure_sqlite_schema
+from dns_cache import DNSUnavailable
 from key_validators import validate_custom_key
-from logger import logger
+from logger import log_event
 from security import rate_limit, get_current_tenant, require_root_admin  # <-- CAMBIO: auth multitenant
 from url_state import is_expired, get_state
 from datetime import datetime, timezone, timedelta
-from target_validation import validate_target_url, get_client_ip_from_request  # <-- CAMBIO: validación fuerte + IP real
+from target_validation import (  # <-- CAMBIO: validación fuerte + IP real
+    evaluate_target_url,
+    get_client_ip_from_request,
+    stored_target_verdict,
+    validate_target_url,
+)
 
+from enterprise_admin_auth import verify_admin_token
 from enterprise_init import init_enterprise
+from enterprise_security import constant_time_equals
+from client_gate import ClientIPGateMiddleware
+from geoip_service import country_code_for_ip
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tareas en background del worker
+    backfill.start_backfill()
+    revalidation.start_sweeper()
+    click_events.start_writer()
+    hll.start_persister()
+    try:
+        yield
+    finally:
+        backfill.stop_backfill()
+        revalidation.stop_sweeper()
+        click_events.stop_writer()
+        hll.stop_persister()
 
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Short",
     version="1.0.0",
     docs_url="/docs",
@@ -34,6 +75,22 @@ app = FastAPI(
 # 🔐 Inicializa modo enterprise
 init_enterprise(app)
 
+# El último middleware añadido es el más externo: el gate va al final para que
+# un cliente bloqueado no pague trazas, contadores de SQL ni métricas.
+# Server-Timing por etapas en los requests trazados (TRACE_TOKEN / TRACE_SAMPLE_RATE)
+app.add_middleware(tracing.TracingMiddleware)
+# Consultas SQL por request: métricas, etapa "sql" de las trazas, N+1 y presupuestos
+app.add_middleware(query_stats.QueryStatsMiddleware)
+query_stats.instrument(engine)
+# Latencia / status por ruta
+app.add_middleware(metrics.MetricsMiddleware)
+# Filtrado temprano por IP de cliente (app_allowlist / app_denylist): el más externo
+app.add_middleware(ClientIPGateMiddleware)
+
+REDIRECT_CLICKS = metrics.counter(
+    "redirect_clicks_total", "Redirects servidos por resultado del conteo", ("outcome",)
+)
+
 models.Base.metadata.create_all(bind=engine)
 ensure_sqlite_schema(engine)
 
@@ -42,6 +99,12 @@ def raise_bad_request(message: str):
     raise HTTPException(status_code=400, detail=message)
 
 
+def _check_dedup_window(seconds: int | None) -> None:
+    # el anillo de filtros de click_dedup solo cubre una ventana acotada
+    if seconds is not None and seconds > click_dedup.deduper.max_window_seconds:
+        raise_bad_request(f"dedup_window_seconds must be <= {click_dedup.deduper.max_window_seconds}")
+
+
 def raise_not_found(detail: str = "Not found"):
     raise HTTPException(status_code=404, detail=detail)
 
@@ -66,12 +129,21 @@ def _remaining_days(expires_at):
     # Si queda menos de 1 dia pero sigue valida -> devolver 1
     return max(1, math.ceil(delta.total_seconds() / 86400 ))
 
-def get_admin_info(db_url: models.URL) -> schemas.URLInfo:
+def get_admin_info(db_url: models.URL, unique: tuple[int, int] | None = None) -> schemas.URLInfo:
     base_url = URL(settings.base_url)
     admin_endpoint = app.url_path_for("administration info", secret_key=db_url.secret_key)
     
     url = str(base_url.replace(path=f"/{db_url.key}"))
 
+    # visitantes únicos (HyperLogLog): sketch de BD + lo pendiente en este worker;
+    # los listados los pasan ya calculados en lote (`unique`)
+    unique_total = unique_today = None
+    db = object_session(db_url)
+    if unique is not None:
+        unique_total, unique_today = unique
+    elif settings.hll_enabled and db is not None:
+        unique_total, unique_today = hll.unique_visitors(db, db_url.id)
+
     return schemas.URLInfo(
         key=db_url.key,
         secret_key=db_url.secret_key,
@@ -80,6 +152,13 @@ def get_admin_info(db_url: models.URL) -> schemas.URLInfo:
         clicks=db_url.clicks,
         url=url,
         expires_in_days=_remaining_days(db_url.expires_at),
+        blocked_at=db_url.blocked_at,
+        blocked_reason=db_url.verdict_reason if db_url.blocked_at else None,
+        geo_rules=geo_rules.load_rules(db_url.geo_rules),
+        count_bot_clicks=bool(db_url.count_bot_clicks),
+        dedup_window_seconds=db_url.dedup_window_seconds,
+        unique_visitors=unique_total,
+        unique_visitors_today=unique_today,
         # Añade aqui los campos reales que tenga tu URLInfo
         admin_url=str(base_url.replace(path=str(admin_endpoint))),
         state=get_state(db_url),
@@ -91,6 +170,29 @@ def read_root():
     return "Welcome to the URL shortener API :)"
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint(authorization: str | None = Header(default=None)):
+    # antes de /{url_key}. Nunca es público: "Bearer <METRICS_TOKEN>" (scraper)
+    # o "Bearer <token de admin>"
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    if not (settings.metrics_token and constant_time_equals(token, settings.metrics_token)):
+        verify_admin_token(token)  # 401 si tampoco es un token de admin válido
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _new_target_verdict(target_url: str):
+    """
+    validate_target_url para un link nuevo, devolviendo el veredicto: se guarda
+    con el link y el primer redirect no vuelve a resolver el DNS.
+    """
+    verdict = evaluate_target_url(target_url)
+    if not verdict.ok:
+        raise_bad_request(verdict.reason)
+    return verdict
+
+
 # -------------------------
 # Public create (legacy)
 # -------------------------
@@ -99,7 +201,8 @@ def read_root():
 def create_url(url: schemas.URLBase, request: Request, db: Session = Depends(get_db)):
     rate_limit(request)
 
-    validate_target_url(str(url.target_url), for_redirect=False)  # <-- CAMBIO
+    verdict = _new_target_verdict(str(url.target_url))  # <-- CAMBIO
+    _check_dedup_window(url.dedup_window_seconds)
 
     if url.custom_key:
         validate_custom_key(url.custom_key)
@@ -116,10 +219,12 @@ def create_url(url: schemas.URLBase, request: Request, db: Session = Depends(get
                 break
             except IntegrityError:
                 db.rollback()
+                metrics.inc(keygen.KEYGEN_RETRIES, ("integrity_error",))
                 continue
         else:
             raise_bad_request("Could not generate unique key")
 
+    crud.store_target_verdict(db, db_url, verdict)
     return get_admin_info(db_url)
 
 
@@ -138,14 +243,54 @@ def peek_url(key: str, request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/{url_key}", tags=["Short"])
+@query_stats.budget(5)  # URL + click (+ veredicto y refresco si hay que revalidar, + destino por país)
 def forward_to_target_url(url_key: str, request: Request, db: Session = Depends(get_db)):
-    rate_limit(request)
+    with tracing.stage("ratelimit"):
+        rate_limit(request)
 
     ip = get_client_ip_from_request(request)  # <-- CAMBIO
     ua = request.headers.get("user-agent", "")
-    logger.info(f'{{"event":"redirect","ip":"{ip}","ua":"{ua}","key":"{url_key}"}}')
+    ua_info = ua_classifier.classify(ua)
 
-    db_url = crud.get_db_url_by_key(db, url_key)
+    status = 500
+    try:
+        response = _redirect(url_key, request, db, ip, ua, ua_info)
+        status = response.status_code
+        return response
+    except HTTPException as exc:
+        status = exc.status_code
+        raise
+    finally:
+        # una línea por redirect con su resultado (muestreable: LOG_SAMPLE_RATES)
+        log_event("redirect", ip=ip, ua=ua, ua_class=ua_info.label, key=url_key, status=status)
+
+
+def _check_destination(row, target_url: str, store) -> None:
+    """
+    410 si el destino no pasa la política. Usa el veredicto persistido en `row`
+    (urls o url_geo_targets) y solo revalida si cambió la política o caducó el
+    DNS; el veredicto nuevo se guarda con store(verdict).
+    """
+    target_ok = stored_target_verdict(row) if row is not None else None
+    if target_ok is None:
+        with tracing.stage("verdict"):
+            try:
+                verdict = evaluate_target_url(target_url)
+            except DNSUnavailable:
+                # el resolver no contesta: vale el último veredicto, aunque haya caducado
+                if row is None or row.verdict_ok is None:
+                    raise
+                verdict = None
+            else:
+                store(verdict)
+        target_ok = verdict.ok if verdict is not None else bool(row.verdict_ok)
+    if not target_ok:
+        raise HTTPException(status_code=410, detail="Destination blocked")  # <-- CAMBIO
+
+
+def _redirect(url_key: str, request: Request, db: Session, ip: str, ua: str, ua_info) -> RedirectResponse:
+    with tracing.stage("db"):
+        db_url = crud.get_db_url_by_key(db, url_key)
     if not db_url:
         raise_not_found("Not found")
 
@@ -155,14 +300,62 @@ def forward_to_target_url(url_key: str, request: Request, db: Session = Depends(
     if is_expired(db_url):
         raise HTTPException(status_code=410, detail="Link expired")
 
-    if getattr(settings, "validate_target_on_redirect", True):  # <-- CAMBIO
-        try:
-            validate_target_url(str(db_url.target_url), for_redirect=True)  # <-- CAMBIO
-        except HTTPException:
-            raise HTTPException(status_code=410, detail="Destination blocked")  # <-- CAMBIO
+    validate_target = getattr(settings, "validate_target_on_redirect", True)  # <-- CAMBIO
+    if validate_target:
+        _check_destination(
+            db_url, str(db_url.target_url), lambda verdict: crud.store_target_verdict(db, db_url, verdict)
+        )
 
-    crud.update_db_clicks(db, db_url)
-    return RedirectResponse(db_url.target_url)
+    # bots / preview fetchers: no cuentan (salvo que el link lo pida) y van por
+    # el camino barato, sin GeoIP ni escrituras
+    counted = ua_info.is_human or bool(db_url.count_bot_clicks)
+
+    # una consulta GeoIP (cacheada) por click; None si GeoIP está desactivado
+    with tracing.stage("geoip"):
+        country = country_code_for_ip(ip) if counted or db_url.geo_rules else None
+
+    target_url = db_url.target_url
+    if db_url.geo_rules:
+        # reglas por país: un lookup en las reglas compiladas
+        blocked, geo_target = geo_rules.rules_for(db_url.id, db_url.geo_rules).action_for(country)
+        if blocked:
+            raise HTTPException(status_code=403, detail="Not available in your country")
+        if geo_target:
+            if validate_target:
+                # el destino por país tiene su propio veredicto (url_geo_targets)
+                url_id = db_url.id
+                with tracing.stage("db"):
+                    geo_row = crud.get_geo_target(db, url_id, country)
+                if geo_row is not None and geo_row.target_url != geo_target:
+                    geo_row = None  # fila de unas reglas anteriores
+                _check_destination(
+                    geo_row,
+                    geo_target,
+                    lambda verdict: crud.store_geo_target_verdict(db, url_id, country, geo_target, verdict),
+                )
+            target_url = geo_target
+
+    if not counted:
+        metrics.inc(REDIRECT_CLICKS, ("bot",))
+        response = RedirectResponse(target_url)
+        if settings.bot_redirect_max_age > 0 and not db_url.geo_rules:
+            # los previews piden lo mismo una y otra vez: que lo cacheen
+            response.headers["Cache-Control"] = f"public, max-age={settings.bot_redirect_max_age}"
+        return response
+
+    # el commit del contador expira db_url: lo que se usa después se lee antes
+    # (si no, cada click paga un SELECT de refresco)
+    url_id, key, tenant_id = db_url.id, db_url.key, db_url.tenant_id
+    with tracing.stage("clicks"):
+        if not crud.update_db_clicks(db, db_url, ip=ip, ua=ua):
+            # recarga dentro de la ventana de dedup: ni contador ni evento
+            metrics.inc(REDIRECT_CLICKS, ("duplicate",))
+            return RedirectResponse(target_url)
+        click_events.record_click(url_id, country=country, ua_cls=ua_info.label, referer=request.headers.get("referer"))
+        hll.record_visit(url_id, ip, ua)
+        trending.record(key, tenant_id)
+    metrics.inc(REDIRECT_CLICKS, ("counted",))
+    return RedirectResponse(target_url)
 
 
 # -------------------------
@@ -193,11 +386,30 @@ def admin_validate(secret_key: str, request: Request, db: Session = Depends(get_
     if not db_url:
         raise_not_found("Secret key not found")
 
-    try:
-        validate_target_url(str(db_url.target_url), for_redirect=True)
+    verdict = evaluate_target_url(str(db_url.target_url))
+    crud.store_target_verdict(db, db_url, verdict)  # refresca el veredicto persistido
+    if verdict.ok:
         return {"ok": True, "target_url": db_url.target_url, "message": "Destination passes current policy"}
-    except HTTPException as e:
-        return {"ok": False, "target_url": db_url.target_url, "error": e.detail}
+    return {"ok": False, "target_url": db_url.target_url, "error": verdict.reason}
+
+
+@app.get("/admin/{secret_key}/stats", response_model=schemas.URLStatsOut, tags=["Admin"])
+def admin_stats(
+    secret_key: str,
+    request: Request,
+    granularity: schemas.StatsGranularity = "hour",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: Session = Depends(get_db),
+):
+    rate_limit(request)
+
+    db_url = crud.get_db_url_by_secret_key(db, secret_key, include_inactive=True)
+    if not db_url:
+        raise_not_found("Secret key not found")
+
+    stats = click_stats.get_stats(db, db_url.id, granularity=granularity, start=start, end=end)
+    return schemas.URLStatsOut(key=db_url.key, **stats)
 
 
 @app.delete("/admin/{secret_key}", tags=["Admin"])
@@ -313,7 +525,8 @@ def disable_api_key(api_key_id: int, request: Request, tenant: models.Tenant = D
 @app.post("/api/urls", response_model=schemas.URLInfoOwned, tags=["URLs Auth"])  # <-- CAMBIO
 def create_url_for_tenant(url: schemas.URLBase, request: Request, tenant: models.Tenant = Depends(get_current_tenant), db: Session = Depends(get_db)):
     rate_limit(request)
-    validate_target_url(str(url.target_url), for_redirect=False)
+    verdict = _new_target_verdict(str(url.target_url))
+    _check_dedup_window(url.dedup_window_seconds)
 
     if url.custom_key:
         validate_custom_key(url.custom_key)
@@ -328,27 +541,32 @@ def create_url_for_tenant(url: schemas.URLBase, request: Request, tenant: models
                 break
             except IntegrityError:
                 db.rollback()
+                metrics.inc(keygen.KEYGEN_RETRIES, ("integrity_error",))
                 continue
         else:
             raise_bad_request("Could not generate unique key")
 
+    crud.store_target_verdict(db, db_url, verdict)
     info = get_admin_info(db_url)
     return schemas.URLInfoOwned.model_validate(info, from_attributes=True)  # <-- CAMBIO
 
 
 @app.get("/api/urls", response_model=schemas.URLListOut, tags=["URLs Auth"])  # <-- CAMBIO
-
+@query_stats.budget(5)  # auth + página + sketches HLL (+ last_used_at de la key)
 def list_urls(request: Request, tenant: models.Tenant = Depends(get_current_tenant), db: Session = Depends(get_db), limit: int = 100, offset: int = 0):
     rate_limit(request)
     items = crud.list_urls_for_tenant(db, tenant.id, limit=limit, offset=offset)
+    # una consulta de sketches HLL para toda la página, no una por link
+    uniques = hll.unique_visitors_many(db, [u.id for u in items]) if settings.hll_enabled else {}
     out_items = []
     for u in items:
-        info = get_admin_info(u)
+        info = get_admin_info(u, uniques.get(u.id))
         out_items.append(schemas.URLInfoOwned.model_validate(info, from_attributes=True))  # <-- CAMBIO
     return schemas.URLListOut(items=out_items)
 
 
 @app.get("/api/urls/{url_key}", response_model=schemas.URLInfoOwned, tags=["URLs Auth"])  # <-- CAMBIO
+@query_stats.budget(5)
 def get_url(url_key: str, request: Request, tenant: models.Tenant = Depends(get_current_tenant), db: Session = Depends(get_db)):
     rate_limit(request)
     u = crud.get_db_url_by_key_for_tenant(db, url_key, tenant.id)
@@ -393,6 +611,70 @@ def update_expiry_for_tenant(url_key: str, payload: ExpiryUpdate, request: Reque
     return schemas.URLInfoOwned.model_validate(info, from_attributes=True)  # <-- CAMBIO
 
 
+@app.patch("/api/urls/{url_key}/bot-clicks", response_model=schemas.URLInfoOwned, tags=["URLs Auth"])
+def update_bot_clicks_for_tenant(url_key: str, payload: schemas.BotClicksUpdate, request: Request, tenant: models.Tenant = Depends(get_current_tenant), db: Session = Depends(get_db)):
+    rate_limit(request)
+    u = crud.set_count_bot_clicks_for_tenant(db, url_key, tenant.id, payload.count_bot_clicks)
+    if not u:
+        raise_not_found("URL not found")
+    info = get_admin_info(u)
+    return schemas.URLInfoOwned.model_validate(info, from_attributes=True)
+
+
+@app.patch("/api/urls/{url_key}/dedup", response_model=schemas.URLInfoOwned, tags=["URLs Auth"])
+def update_dedup_window_for_tenant(url_key: str, payload: schemas.DedupWindowUpdate, request: Request, tenant: models.Tenant = Depends(get_current_tenant), db: Session = Depends(get_db)):
+    rate_limit(request)
+    _check_dedup_window(payload.dedup_window_seconds)
+    u = crud.set_dedup_window_for_tenant(db, url_key, tenant.id, payload.dedup_window_seconds)
+    if not u:
+        raise_not_found("URL not found")
+    info = get_admin_info(u)
+    return schemas.URLInfoOwned.model_validate(info, from_attributes=True)
+
+
+@app.get("/api/urls/{url_key}/stats", response_model=schemas.URLStatsOut, tags=["URLs Auth"])
+def url_stats_for_tenant(
+    url_key: str,
+    request: Request,
+    granularity: schemas.StatsGranularity = "hour",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    tenant: models.Tenant = Depends(get_current_tenant),
+    db: Session = Depends(get_db),
+):
+    rate_limit(request)
+    u = crud.get_db_url_by_key_for_tenant(db, url_key, tenant.id)
+    if not u:
+        raise_not_found("URL not found")
+    stats = click_stats.get_stats(db, u.id, granularity=granularity, start=start, end=end)
+    return schemas.URLStatsOut(key=u.key, **stats)
+
+
+@app.put("/api/urls/geo-rules", response_model=schemas.GeoRulesBulkOut, tags=["URLs Auth"])
+def set_geo_rules(payload: schemas.GeoRulesBulkIn, request: Request, tenant: models.Tenant = Depends(get_current_tenant), db: Session = Depends(get_db)):
+    rate_limit(request)
+    rules_by_key: dict[str, str | None] = {}
+    verdicts = {}
+    for item in payload.items:
+        rules = geo_rules.normalize_rules(item.rules.block, item.rules.targets) if item.rules else None
+        if rules and not settings.geoip_enabled:
+            # sin país no se aplicaría ninguna regla: mejor rechazarlas que guardarlas muertas
+            raise HTTPException(status_code=409, detail="Geo rules require GeoIP (GEOIP_ENABLED=true)")
+        if rules:
+            # los destinos alternativos pasan la misma validación que target_url
+            # y guardan su veredicto (se revalidan como el destino principal)
+            targets = {}
+            for cc, url in rules["targets"].items():
+                target = validate_target_url(url, for_redirect=False)
+                if target not in verdicts:
+                    verdicts[target] = evaluate_target_url(target)
+                targets[cc] = target
+            rules["targets"] = targets
+        rules_by_key[item.key] = geo_rules.dump_rules(rules)
+    not_found = crud.set_geo_rules_for_tenant(db, tenant.id, rules_by_key, verdicts)
+    return schemas.GeoRulesBulkOut(updated=len(rules_by_key) - len(not_found), not_found=not_found)
+
+
 @app.delete("/api/urls/{url_key}", tags=["URLs Auth"])  # <-- CAMBIO: soft delete
 def delete_url_for_tenant(url_key: str, request: Request, tenant: models.Tenant = Depends(get_current_tenant), db: Session = Depends(get_db)):
     rate_limit(request)
@@ -0,0 +1,232 @@
+# metrics.py
+
+"""
+Métricas estilo Prometheus (GET /metrics, formato de texto 0.0.4).
+
+Pensado para el camino del redirect:
+
+- Cada hilo escribe en sus propios dicts (threading.local): sin locks ni
+  contención en inc()/observe(). El scrape suma las particiones de todos los
+  hilos; los hilos que mueren dejan sus valores (son acumulados).
+- Los estados que ya existen en otros módulos (cachés, listas, rate limiter) no
+  se duplican: se leen en el scrape con collectors registrados.
+
+Uso:
+    REQUESTS = metrics.counter("x_total", "Ayuda", ("label",))
+    metrics.inc(REQUESTS, ("valor",))
+    metrics.observe(LATENCY, 0.012, ("GET", "/{url_key}"))
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from config import settings
+
+
+# -------------------------
+# Registro
+# -------------------------
+
+@dataclass(frozen=True)
+class Metric:
+    name: str
+    kind: str  # counter | histogram | gauge
+    help: str
+    labels: tuple[str, ...] = ()
+    buckets: tuple[float, ...] = ()
+
+
+_metrics: dict[str, Metric] = {}
+# collector() -> [(Metric, {label_values: valor})] ; se llaman en cada scrape
+_collectors: list[Callable[[], Iterable[tuple[Metric, dict]]]] = []
+
+
+def counter(name: str, help: str, labels: tuple[str, ...] = ()) -> Metric:
+    return _metrics.setdefault(name, Metric(name, "counter", help, labels))
+
+
+def histogram(name: str, help: str, labels: tuple[str, ...] = (), buckets: Iterable[float] = ()) -> Metric:
+    return _metrics.setdefault(name, Metric(name, "histogram", help, labels, tuple(sorted(buckets))))
+
+
+def gauge(name: str, help: str, labels: tuple[str, ...] = ()) -> Metric:
+    """Solo para collectors: el valor se calcula en el scrape."""
+    return Metric(name, "gauge", help, labels)
+
+
+def register_collector(fn: Callable[[], Iterable[tuple[Metric, dict]]]) -> None:
+    _collectors.append(fn)
+
+
+# -------------------------
+# Particiones por hilo
+# -------------------------
+
+class _Shard:
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        # (metric, label_values) -> valor
+        self.counters: dict[tuple[Metric, tuple], float] = {}
+        # (metric, label_values) -> [cuentas por bucket..., +Inf, suma]
+        self.histograms: dict[tuple[Metric, tuple], list] = {}
+
+
+_local = threading.local()
+_shards: list[_Shard] = []
+_shards_lock = threading.Lock()  # solo al crear la partición de un hilo nuevo
+
+
+def _shard() -> _Shard:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def inc(metric: Metric, labels: tuple = (), value: float = 1) -> None:
+    if not settings.metrics_enabled:
+        return
+    counters = _shard().counters
+    key = (metric, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(metric: Metric, value: float, labels: tuple = ()) -> None:
+    if not settings.metrics_enabled:
+        return
+    histograms = _shard().histograms
+    key = (metric, labels)
+    h = histograms.get(key)
+    if h is None:
+        h = histograms[key] = [0] * (len(metric.buckets) + 1) + [0.0]
+    h[bisect.bisect_left(metric.buckets, value)] += 1
+    h[-1] += value
+
+
+# -------------------------
+# Scrape
+# -------------------------
+
+def _fmt_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_value(v: float) -> str:
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+def render() -> str:
+    with _shards_lock:
+        shards = list(_shards)
+    counters: dict[tuple[Metric, tuple], float] = {}
+    histograms: dict[tuple[Metric, tuple], list] = {}
+    for shard in shards:
+        # list(...) es una copia atómica bajo el GIL aunque el hilo siga escribiendo
+        for key, value in list(shard.counters.items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, h in list(shard.histograms.items()):
+            acc = histograms.get(key)
+            if acc is None:
+                histograms[key] = list(h)
+            else:
+                for i, v in enumerate(h):
+                    acc[i] += v
+
+    families: dict[str, tuple[Metric, list[str]]] = {}
+
+    def family(metric: Metric) -> list[str]:
+        if metric.name not in families:
+            families[metric.name] = (metric, [])
+        return families[metric.name][1]
+
+    for (metric, labels), value in sorted(counters.items(), key=lambda kv: (kv[0][0].name, kv[0][1])):
+        family(metric).append(f"{metric.name}{_fmt_labels(metric.labels, labels)} {_fmt_value(value)}")
+
+    for (metric, labels), h in sorted(histograms.items(), key=lambda kv: (kv[0][0].name, kv[0][1])):
+        lines = family(metric)
+        cumulative = 0
+        for bound, count in zip(metric.buckets + (float("inf"),), h[:-1]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _fmt_value(float(bound))
+            le_label = f'le="{le}"'
+            lines.append(f"{metric.name}_bucket{_fmt_labels(metric.labels, labels, le_label)} {cumulative}")
+        lines.append(f"{metric.name}_sum{_fmt_labels(metric.labels, labels)} {_fmt_value(h[-1])}")
+        lines.append(f"{metric.name}_count{_fmt_labels(metric.labels, labels)} {cumulative}")
+
+    for collect in _collectors:
+        try:
+            samples = list(collect())
+        except Exception:
+            continue  # un collector roto no tumba el scrape
+        for metric, values in samples:
+            lines = family(metric)
+            for labels, value in values.items():
+                lines.append(f"{metric.name}{_fmt_labels(metric.labels, labels)} {_fmt_value(value)}")
+
+    out = []
+    for name in sorted(families):
+        metric, lines = families[name]
+        out.append(f"# HELP {name} {metric.help}")
+        out.append(f"# TYPE {name} {metric.kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+# -------------------------
+# HTTP: latencia y status por ruta
+# -------------------------
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HTTP_LATENCY = histogram(
+    "http_request_duration_seconds", "Latencia por ruta", ("method", "route"), LATENCY_BUCKETS
+)
+HTTP_REQUESTS = counter("http_requests_total", "Requests por ruta y status", ("method", "route", "status"))
+
+
+class MetricsMiddleware:
+    """Middleware ASGI puro (sin BaseHTTPMiddleware): una medida por request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            observe(HTTP_LATENCY, elapsed, (method, path))
+            inc(HTTP_REQUESTS, (method, path, str(status_holder[0])))
+
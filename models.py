@@ -1,6 +1,6 @@
 # short/models.py
 
-from sqlalchemy import DateTime, Boolean, Column, Integer, String, ForeignKey  # <-- CAMBIO: ForeignKey
+from sqlalchemy import BigInteger, DateTime, Boolean, Column, Integer, LargeBinary, String, Text, ForeignKey, UniqueConstraint, false  # <-- CAMBIO: ForeignKey
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship  # <-- CAMBIO: relationship
 from datetime import datetime
@@ -40,6 +40,11 @@ class URL(Base):
     key = Column(String, unique=True, index=True)
     secret_key = Column(String, unique=True, index=True)
     target_url = Column(String, index=True)
+    # Host normalizado del destino (IDNA, minúsculas) y el mismo host con las
+    # etiquetas invertidas ("com.example.www"): "todo *.example.com" es un rango
+    # del índice en vez de un LIKE sobre target_url.
+    target_host = Column(String, index=True, nullable=True)
+    target_host_rev = Column(String, index=True, nullable=True)
     is_active = Column(Boolean, default=True)
     clicks = Column(Integer, default=0)
 
@@ -50,6 +55,25 @@ class URL(Base):
     disabled_at = Column(DateTime, nullable=True)  # <-- CAMBIO: marca de desactivación (audit mínimo)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Último veredicto de validación del destino (target_validation.evaluate_target_url).
+    # Vale mientras no cambie la generación de la política ni caduque el DNS usado.
+    verdict_ok = Column(Boolean, nullable=True)
+    verdict_reason = Column(String, nullable=True)
+    verdict_generation = Column(BigInteger, nullable=True)
+    verdict_expires_at = Column(DateTime, nullable=True)
+    # IPs con las que se calculó el veredicto (separadas por espacios)
+    target_ips = Column(String, nullable=True)
+    # Primer momento en que el destino se vio bloqueado (revalidation.py / redirect)
+    blocked_at = Column(DateTime, nullable=True, index=True)
+
+    # Reglas por país (geo_rules.py): JSON {"block": [...], "targets": {...}}.
+    # Cada destino alternativo tiene además su fila en url_geo_targets.
+    geo_rules = Column(Text, nullable=True)
+    # ¿Cuentan los clicks de bots y preview fetchers? (ua_classifier.py)
+    count_bot_clicks = Column(Boolean, nullable=False, default=False, server_default=false())
+    # Ventana de deduplicación de clicks por visitante (click_dedup.py); None = sin dedup
+    dedup_window_seconds = Column(Integer, nullable=True)
+
     tenant = relationship("Tenant", back_populates="urls")  # <-- CAMBIO
 
     @hybrid_property
@@ -63,3 +87,93 @@ class URL(Base):
         if self.is_active is False:
             return "disabled"
         return "active"
+
+
+class GeoTarget(Base):
+    """
+    Destino alternativo por país de un link (urls.geo_rules["targets"]), con el
+    mismo índice de host y el mismo veredicto persistido que urls: así entra en
+    la revalidación, en /admin/links/by-host y en policy_impact.
+    """
+
+    __tablename__ = "url_geo_targets"
+    __table_args__ = (UniqueConstraint("url_id", "country"),)
+
+    id = Column(Integer, primary_key=True)
+    url_id = Column(Integer, ForeignKey("urls.id"), nullable=False, index=True)
+    country = Column(String(2), nullable=False)
+    target_url = Column(String, nullable=False)
+    target_host = Column(String, index=True, nullable=True)
+    target_host_rev = Column(String, index=True, nullable=True)
+
+    verdict_ok = Column(Boolean, nullable=True)
+    verdict_reason = Column(String, nullable=True)
+    verdict_generation = Column(BigInteger, nullable=True)
+    verdict_expires_at = Column(DateTime, nullable=True)
+    target_ips = Column(String, nullable=True)
+    blocked_at = Column(DateTime, nullable=True)
+
+
+class ClickEvent(Base):
+    """Un click (append-only). Lo escribe por lotes click_events.ClickEventWriter."""
+
+    __tablename__ = "click_events"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    url_id = Column(Integer, ForeignKey("urls.id"), index=True, nullable=False)
+    ts = Column(DateTime, index=True, nullable=False)
+    country = Column(String(2), nullable=True)
+    ua_class = Column(String(16), nullable=True)
+    referrer_host = Column(String, nullable=True)
+    # >1 si el evento representa a otros descartados por muestreo (buffer lleno);
+    # Integer y no SmallInteger: CLICK_SAMPLE_RATE es configurable sin tope
+    weight = Column(Integer, nullable=False, default=1)
+
+
+class ClickRollup(Base):
+    """Clicks por link y bucket de tiempo (m=minuto, h=hora, d=día). click_stats.py"""
+
+    __tablename__ = "click_rollups"
+
+    url_id = Column(Integer, ForeignKey("urls.id"), primary_key=True)
+    granularity = Column(String(1), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    clicks = Column(BigInteger, nullable=False, default=0)
+
+
+class ClickRollupDim(Base):
+    """Clicks por link, día y valor de una dimensión (country / referrer). click_stats.py"""
+
+    __tablename__ = "click_rollup_dims"
+
+    url_id = Column(Integer, ForeignKey("urls.id"), primary_key=True)
+    dim = Column(String(16), primary_key=True)
+    day = Column(DateTime, primary_key=True)
+    value = Column(String, primary_key=True)  # "" = desconocido
+    clicks = Column(BigInteger, nullable=False, default=0)
+
+
+class UniqueSketch(Base):
+    """Sketch HyperLogLog de visitantes únicos por link y periodo ("all" o "YYYY-MM-DD"). hll.py"""
+
+    __tablename__ = "unique_sketches"
+
+    url_id = Column(Integer, ForeignKey("urls.id"), primary_key=True)
+    period = Column(String(10), primary_key=True)
+    registers = Column(LargeBinary, nullable=False)  # 4096 bytes (p=12)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Lease(Base):
+    """
+    Turno exclusivo entre workers para tareas de fondo (p. ej. "revalidation").
+    crud.acquire_lease / renew_lease / release_lease.
+    """
+
+    __tablename__ = "leases"
+
+    name = Column(String(64), primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    # fin de la última ejecución completa (para espaciar las siguientes)
+    completed_at = Column(DateTime, nullable=True)
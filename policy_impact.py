@@ -0,0 +1,355 @@
+# policy_impact.py
+
+"""
+Análisis offline del impacto de una lista target_* candidata.
+
+Antes de publicar una nueva target_denylist (o allowlist) queremos saber qué
+links existentes dejaría bloqueados. Evaluar decide_by_policy fila a fila sobre
+millones de urls es lento; aquí se cargan hosts e IPs de la tabla urls en
+arrays NumPy y el matching se hace vectorizado:
+
+- CIDRs IPv4: búsqueda de rangos con np.searchsorted sobre starts/ends.
+- CIDRs IPv6: bisect por IP (IPRangeSet.contains); son pocas en la práctica.
+- Dominios: hashes de cada host y de sus dominios padre + np.isin contra los
+  hashes de la lista (exactos y *.sufijos).
+
+Misma semántica que target_validation: el host debe pasar la política y TODAS
+las IPs evaluadas (urls.target_ips, guardadas con el veredicto) también. Los
+rangos privados/reservados no dependen de las listas y no se reevalúan.
+
+Un link con destinos por país (url_geo_targets) se evalúa en cada uno de ellos:
+queda afectado si lo está cualquiera de sus destinos.
+
+Uso:
+    python -m policy_impact --deny nueva_denylist.txt
+    python -m policy_impact --allow nueva_allowlist.txt --policy deny --json
+
+Requiere NumPy (grupo de dependencias "analysis": uv sync --group analysis).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dependencia opcional
+    np = None
+
+from sqlalchemy import select
+
+import models
+from config import settings
+from database import engine
+from policy_lists import CompiledLists, _compile_file, _policy_name, ip_to_int
+from url_canon import host_of
+
+
+@dataclass
+class LinkTable:
+    """Destinos de los links (target_url y destinos por país) en forma columnar."""
+
+    ids: "np.ndarray"  # int64, por fila: id del link (se repite con destinos por país)
+    tenant_ids: "np.ndarray"  # int64, -1 = sin tenant
+    keys: list[str]
+    # hosts únicos y, por fila, su índice en `hosts`
+    hosts: list[str]
+    host_idx: "np.ndarray"
+    # candidatos de dominio (host + padres) por host único
+    cand_hash: "np.ndarray"
+    cand_owner: "np.ndarray"
+    self_hash: "np.ndarray"
+    # IPs planas: fila dueña + valor
+    ip4_row: "np.ndarray"
+    ip4: "np.ndarray"  # uint64
+    ip6_row: "np.ndarray"
+    ip6: list[int]
+    rows_without_ips: int = 0
+    geo_targets: int = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def by_link(self, ok: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+        """
+        Agrega un resultado por fila a uno por link (pasa si pasan todos sus
+        destinos). Devuelve (primera fila de cada link, ok por link).
+        """
+        _, first, inverse = np.unique(self.ids, return_index=True, return_inverse=True)
+        return first, np.bincount(inverse[~ok], minlength=len(first)) == 0
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise SystemExit("policy_impact requiere numpy (uv sync --group analysis)")
+
+
+def _domain_candidates(host: str):
+    # el host y cada dominio padre (como policy_lists._match_domain)
+    candidate = host
+    while candidate:
+        yield candidate
+        dot = candidate.find(".")
+        if dot < 0:
+            break
+        candidate = candidate[dot + 1:]
+
+
+def load_links(*, include_inactive: bool = False) -> LinkTable:
+    """Carga id/tenant/key/host/IPs de urls y url_geo_targets a arrays (una pasada por tabla)."""
+    _require_numpy()
+    U, G = models.URL, models.GeoTarget
+    stmt = select(U.id, U.tenant_id, U.key, U.target_url, U.target_ips)
+    geo_stmt = select(U.id, U.tenant_id, U.key, G.target_url, G.target_ips).join(G, G.url_id == U.id)
+    if not include_inactive:
+        stmt = stmt.where(U.is_active.is_(True), U.disabled_at.is_(None))
+        geo_stmt = geo_stmt.where(U.is_active.is_(True), U.disabled_at.is_(None))
+
+    ids: list[int] = []
+    tenant_ids: list[int] = []
+    keys: list[str] = []
+    host_idx: list[int] = []
+    host_index: dict[str, int] = {}
+    ip4_row: list[int] = []
+    ip4: list[int] = []
+    ip6_row: list[int] = []
+    ip6: list[int] = []
+    without_ips = 0
+
+    def rows():
+        # una consulta tras otra: nunca dos cursores abiertos a la vez
+        with engine.connect() as conn:
+            yield from conn.execution_options(yield_per=50_000).execute(stmt)
+            yield from conn.execution_options(yield_per=50_000).execute(geo_stmt)
+
+    for row, (url_id, tenant_id, key, target_url, target_ips) in enumerate(rows()):
+        ids.append(url_id)
+        tenant_ids.append(-1 if tenant_id is None else tenant_id)
+        keys.append(key)
+
+        host = host_of(target_url or "") or ""
+        i = host_index.get(host)
+        if i is None:
+            i = host_index[host] = len(host_index)
+        host_idx.append(i)
+
+        parsed = [ip_to_int(t) for t in target_ips.split()] if target_ips else []
+        if not parsed:
+            # sin veredicto guardado: si el host es una IP literal, es la IP evaluada
+            lit = ip_to_int(host) if host else None
+            if lit is None:
+                without_ips += 1
+                continue
+            parsed = [lit]
+        for ip_num in parsed:
+            if ip_num is None:
+                continue
+            if ip_num[0] == 4:
+                ip4_row.append(row)
+                ip4.append(ip_num[1])
+            else:
+                ip6_row.append(row)
+                ip6.append(ip_num[1])
+
+    hosts = list(host_index)
+    cand_hash: list[int] = []
+    cand_owner: list[int] = []
+    for i, host in enumerate(hosts):
+        for candidate in _domain_candidates(host):
+            cand_hash.append(hash(candidate))
+            cand_owner.append(i)
+
+    return LinkTable(
+        ids=np.asarray(ids, dtype=np.int64),
+        tenant_ids=np.asarray(tenant_ids, dtype=np.int64),
+        keys=keys,
+        hosts=hosts,
+        host_idx=np.asarray(host_idx, dtype=np.int64),
+        cand_hash=np.asarray(cand_hash, dtype=np.int64),
+        cand_owner=np.asarray(cand_owner, dtype=np.int64),
+        self_hash=np.fromiter((hash(h) for h in hosts), dtype=np.int64, count=len(hosts)),
+        ip4_row=np.asarray(ip4_row, dtype=np.int64),
+        ip4=np.asarray(ip4, dtype=np.uint64),
+        ip6_row=np.asarray(ip6_row, dtype=np.int64),
+        ip6=ip6,
+        rows_without_ips=without_ips,
+        # las filas de destinos por país repiten el id de su link
+        geo_targets=len(ids) - len(set(ids)),
+    )
+
+
+def _hash_array(domains) -> "np.ndarray":
+    # hash() de str es estable dentro del proceso: basta para comparar ambos lados
+    return np.fromiter((hash(d) for d in domains), dtype=np.int64)
+
+
+def _host_hits(table: LinkTable, compiled: CompiledLists) -> "np.ndarray":
+    """Por host único: ¿match exacto o por sufijo en la lista?"""
+    hits = np.isin(table.self_hash, _hash_array(compiled.domain_exact))
+    suffix_hit = np.isin(table.cand_hash, _hash_array(compiled.domain_suffixes))
+    hits |= np.bincount(table.cand_owner[suffix_hit], minlength=len(table.hosts)) > 0
+    return hits
+
+
+def _ip4_hits(table: LinkTable, compiled: CompiledLists) -> "np.ndarray":
+    starts = np.frombuffer(compiled.ipv4.starts, dtype=np.uint64) if len(compiled.ipv4) else None
+    if starts is None or not len(table.ip4):
+        return np.zeros(len(table.ip4), dtype=bool)
+    ends = np.frombuffer(compiled.ipv4.ends, dtype=np.uint64)
+    # último rango con start <= ip; hit si ip <= end de ese rango
+    idx = np.searchsorted(starts, table.ip4, side="right") - 1
+    return (idx >= 0) & (table.ip4 <= ends[np.maximum(idx, 0)])
+
+
+def _ip6_hits(table: LinkTable, compiled: CompiledLists) -> "np.ndarray":
+    contains = compiled.ipv6.contains
+    return np.fromiter((contains(ip) for ip in table.ip6), dtype=bool, count=len(table.ip6))
+
+
+def evaluate(table: LinkTable, *, allow: CompiledLists, deny: CompiledLists, default_policy: str) -> "np.ndarray":
+    """Por fila: True si el destino pasa la política (solo listas)."""
+    n = len(table)
+    if _policy_name(default_policy) == "allow":
+        host_ok = ~_host_hits(table, deny)
+        ip4_ok = ~_ip4_hits(table, deny)
+        ip6_ok = ~_ip6_hits(table, deny)
+    else:
+        host_ok = _host_hits(table, allow)
+        ip4_ok = _ip4_hits(table, allow)
+        ip6_ok = _ip6_hits(table, allow)
+
+    ok = host_ok[table.host_idx]
+    bad_rows = np.concatenate([table.ip4_row[~ip4_ok], table.ip6_row[~ip6_ok]])
+    ok &= np.bincount(bad_rows, minlength=n) == 0
+    return ok
+
+
+def _tenant_names() -> dict[int, str]:
+    with engine.connect() as conn:
+        return {tid: name for tid, name in conn.execute(select(models.Tenant.id, models.Tenant.name))}
+
+
+def _per_tenant(table: LinkTable, mask, names: dict[int, str], show_keys: int) -> list[dict]:
+    tenants, counts = np.unique(table.tenant_ids[mask], return_counts=True)
+    order = np.argsort(-counts, kind="stable")
+    report = []
+    for tid, count in zip(tenants[order].tolist(), counts[order].tolist()):
+        entry = {
+            "tenant_id": None if tid < 0 else tid,
+            "tenant": names.get(tid) if tid >= 0 else None,
+            "links": count,
+        }
+        if show_keys:
+            rows = np.flatnonzero(mask & (table.tenant_ids == tid))[:show_keys]
+            entry["keys"] = [table.keys[r] for r in rows.tolist()]
+        report.append(entry)
+    return report
+
+
+def analyze(
+    *,
+    candidate_allow: str,
+    candidate_deny: str,
+    candidate_policy: str,
+    include_inactive: bool = False,
+    show_keys: int = 0,
+) -> dict:
+    """Compara la política actual (settings) con la candidata sobre todos los links."""
+    t0 = time.perf_counter()
+    table = load_links(include_inactive=include_inactive)
+    t_load = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    first, current = table.by_link(
+        evaluate(
+            table,
+            allow=_compile_file(settings.target_allowlist_path),
+            deny=_compile_file(settings.target_denylist_path),
+            default_policy=settings.default_target_policy,
+        )
+    )
+    _, candidate = table.by_link(
+        evaluate(
+            table,
+            allow=_compile_file(candidate_allow),
+            deny=_compile_file(candidate_deny),
+            default_policy=candidate_policy,
+        )
+    )
+    newly_blocked = current & ~candidate
+    newly_allowed = ~current & candidate
+    t_eval = time.perf_counter() - t0
+
+    # por tenant se agrupa sobre la primera fila (target_url) de cada link
+    newly_blocked_rows = np.zeros(len(table), dtype=bool)
+    newly_blocked_rows[first[newly_blocked]] = True
+
+    names = _tenant_names()
+    return {
+        "links": len(first),
+        "geo_targets": table.geo_targets,
+        "unique_hosts": len(table.hosts),
+        "links_without_ips": table.rows_without_ips,
+        "blocked_current": int((~current).sum()),
+        "blocked_candidate": int((~candidate).sum()),
+        "newly_blocked": int(newly_blocked.sum()),
+        "newly_allowed": int(newly_allowed.sum()),
+        "newly_blocked_by_tenant": _per_tenant(table, newly_blocked_rows, names, show_keys),
+        "seconds": {"load": round(t_load, 3), "evaluate": round(t_eval, 3)},
+    }
+
+
+def _print_text(report: dict) -> None:
+    print(
+        f"links={report['links']} geo_targets={report['geo_targets']} hosts={report['unique_hosts']} "
+        f"sin_ips={report['links_without_ips']} "
+        f"(load {report['seconds']['load']}s, eval {report['seconds']['evaluate']}s)"
+    )
+    print(f"bloqueados: actual={report['blocked_current']} candidata={report['blocked_candidate']}")
+    print(f"nuevos bloqueados: {report['newly_blocked']}  nuevos permitidos: {report['newly_allowed']}")
+    for entry in report["newly_blocked_by_tenant"]:
+        label = entry["tenant"] or ("-" if entry["tenant_id"] is None else f"#{entry['tenant_id']}")
+        line = f"  {label}: {entry['links']}"
+        if "keys" in entry:
+            line += "  " + " ".join(entry["keys"])
+        print(line)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="policy_impact", description=__doc__.splitlines()[1])
+    parser.add_argument("--allow", default=settings.target_allowlist_path, help="allowlist candidata")
+    parser.add_argument("--deny", default=settings.target_denylist_path, help="denylist candidata")
+    parser.add_argument(
+        "--policy",
+        default=settings.default_target_policy,
+        choices=["allow", "deny"],
+        help="política por defecto candidata",
+    )
+    parser.add_argument("--include-inactive", action="store_true", help="incluye links desactivados")
+    parser.add_argument("--show-keys", type=int, default=0, metavar="N", help="N keys de ejemplo por tenant")
+    parser.add_argument("--json", action="store_true", help="salida JSON")
+    args = parser.parse_args(argv)
+
+    _require_numpy()
+    report = analyze(
+        candidate_allow=args.allow,
+        candidate_deny=args.deny,
+        candidate_policy=args.policy,
+        include_inactive=args.include_inactive,
+        show_keys=args.show_keys,
+    )
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        _print_text(report)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
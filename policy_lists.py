@@ -2,13 +2,20 @@
 
 from __future__ import annotations
 
+import hashlib
 import os
-from dataclasses import dataclass
-from typing import Optional
+import socket
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Container, Iterable, Optional
 from urllib.parse import urlsplit
 
 import ipaddress
 
+import metrics
+from caches import DictHandle, FunctionCacheHandle, register
 from config import settings
 
 
@@ -33,7 +40,9 @@ def _to_host_or_token(token: str) -> str:
     return t
 
 
-def _normalize_host(host: str) -> str:
+@lru_cache(maxsize=65536)
+def normalize_host(host: str) -> str:
+    """Host -> ASCII (IDNA/punycode) en minúsculas. Única implementación, cacheada."""
     h = host.strip().strip(".").lower()
     try:
         return h.encode("idna").decode("ascii")
@@ -41,55 +50,137 @@ def _normalize_host(host: str) -> str:
         return h
 
 
+class IPRangeSet:
+    """
+    Rangos de IPs de una familia como enteros [start, end], fusionados y
+    ordenados. El lookup es un bisect: O(log n) sin crear objetos ipaddress.
+    """
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, ranges: list[tuple[int, int]] | None = None, *, typecode: str | None = None):
+        starts: list[int] = []
+        ends: list[int] = []
+        for start, end in sorted(ranges or ()):
+            # solapados o contiguos => un único rango
+            if ends and start <= ends[-1] + 1:
+                if end > ends[-1]:
+                    ends[-1] = end
+                continue
+            starts.append(start)
+            ends.append(end)
+
+        # IPv4 cabe en 64 bits: array compacto en vez de lista de ints
+        if typecode:
+            self.starts = array(typecode, starts)
+            self.ends = array(typecode, ends)
+        else:
+            self.starts = starts
+            self.ends = ends
+
+    @classmethod
+    def from_sorted(cls, starts, ends) -> "IPRangeSet":
+        """Envuelve secuencias ya fusionadas y ordenadas (p.ej. vistas mmap)."""
+        obj = cls.__new__(cls)
+        obj.starts = starts
+        obj.ends = ends
+        return obj
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def contains(self, ip_int: int) -> bool:
+        i = bisect_right(self.starts, ip_int) - 1
+        return i >= 0 and ip_int <= self.ends[i]
+
+
 @dataclass
 class CompiledLists:
-    # dominios exactos y sufijos (para wildcard *.example.com)
-    domain_suffixes: set[str]
-    domain_exact: set[str]
-    # redes / IPs
-    networks: list[ipaddress._BaseNetwork]
+    # dominios exactos y sufijos (para wildcard *.example.com).
+    # set[str] al compilar; índice hasheado si viene de un snapshot mmap.
+    domain_suffixes: Container[str]
+    domain_exact: Container[str]
+    # redes / IPs como rangos enteros por familia
+    ipv4: IPRangeSet = field(default_factory=lambda: IPRangeSet(typecode="Q"))
+    ipv6: IPRangeSet = field(default_factory=IPRangeSet)
+    # huella del contenido del fichero (0 = vacío / no existe)
+    digest: int = 0
+
+    def ranges_for(self, version: int) -> IPRangeSet:
+        return self.ipv4 if version == 4 else self.ipv6
+
+
+def _content_digest(content: bytes) -> int:
+    # 63 bits: cabe en un BIGINT con signo (SQLite/Postgres)
+    return int.from_bytes(hashlib.blake2b(content, digest_size=8).digest(), "big") >> 1
+
+
+def _network_range(token: str) -> Optional[tuple[int, int, int]]:
+    """IP o CIDR -> (version, start, end). None si no es una red."""
+    try:
+        net = ipaddress.ip_network(token, strict=False)
+    except ValueError:
+        return None
+    first = int(net.network_address)
+    return net.version, first, first + net.num_addresses - 1
+
+
+def compile_networks(tokens: Iterable[str]) -> CompiledLists:
+    """Compila solo IPs/CIDRs (p.ej. proxies de confianza); ignora lo demás."""
+    ranges: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+    for token in tokens:
+        r = _network_range(token.strip())
+        if r is not None:
+            ranges[r[0]].append((r[1], r[2]))
+    return CompiledLists(set(), set(), IPRangeSet(ranges[4], typecode="Q"), IPRangeSet(ranges[6]))
 
 
 def _compile_file(path: str) -> CompiledLists:
     domain_suffixes: set[str] = set()
     domain_exact: set[str] = set()
-    networks: list[ipaddress._BaseNetwork] = []
+    ranges: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
 
     if not os.path.exists(path):
         # no existe => listas vacías
-        return CompiledLists(domain_suffixes, domain_exact, networks)
+        return CompiledLists(domain_suffixes, domain_exact)
 
-    with open(path, "r", encoding="utf-8") as f:
-        for raw in f:
-            line = _strip_comment(raw)
-            if not line:
-                continue
+    with open(path, "rb") as f:
+        content = f.read()
 
-            token = _to_host_or_token(line)
-            if not token:
-                continue
+    for raw in content.decode("utf-8").splitlines():
+        line = _strip_comment(raw)
+        if not line:
+            continue
 
-            token = token.strip()
+        token = _to_host_or_token(line)
+        if not token:
+            continue
 
-            # IP o CIDR
-            try:
-                net = ipaddress.ip_network(token, strict=False)
-                networks.append(net)
-                continue
-            except ValueError:
-                pass
-
-            # wildcard de dominio
-            if token.startswith("*."):
-                suf = _normalize_host(token[2:])
-                if suf:
-                    domain_suffixes.add(suf)
-                continue
+        token = token.strip()
+
+        # IP o CIDR
+        r = _network_range(token)
+        if r is not None:
+            ranges[r[0]].append((r[1], r[2]))
+            continue
 
-            # dominio exacto / FQDN / host
-            domain_exact.add(_normalize_host(token))
+        # wildcard de dominio
+        if token.startswith("*."):
+            suf = normalize_host(token[2:])
+            if suf:
+                domain_suffixes.add(suf)
+            continue
 
-    return CompiledLists(domain_suffixes, domain_exact, networks)
+        # dominio exacto / FQDN / host
+        domain_exact.add(normalize_host(token))
+
+    return CompiledLists(
+        domain_suffixes,
+        domain_exact,
+        IPRangeSet(ranges[4], typecode="Q"),
+        IPRangeSet(ranges[6]),
+        _content_digest(content),
+    )
 
 
 class ListsManager:
@@ -100,8 +191,54 @@ class ListsManager:
     def __init__(self):
         self._cache = {}
         self._mtime = {}
+        self._snapshot = None
+        self._snapshot_stat = None
+        # sube cada vez que cambia alguna lista (recompilación o snapshot nuevo)
+        self.version = 0
+
+    def _current_snapshot(self):
+        """
+        Snapshot mmap (si está configurado). Se reabre cuando cambia el fichero
+        y solo se sustituye si cambia su versión.
+        """
+        snap_path = settings.policy_snapshot_path
+        if not snap_path:
+            return None
+
+        try:
+            st = os.stat(snap_path)
+        except FileNotFoundError:
+            self._snapshot = None
+            self._snapshot_stat = None
+            return None
+
+        stat_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stat_key != self._snapshot_stat:
+            import policy_snapshot  # evita import circular
+
+            try:
+                snap = policy_snapshot.open_snapshot(snap_path)
+            except (OSError, ValueError):
+                # snapshot corrupto/incompatible => seguimos con el anterior (o los .txt)
+                snap = self._snapshot
+            if self._snapshot is None or snap is None or snap.version != self._snapshot.version:
+                self._snapshot = snap
+                self.version += 1
+                if snap is not None:
+                    # un snapshot nuevo equivale a recargar cada lista que trae
+                    for key in snap.lists:
+                        metrics.inc(LIST_RELOADS, (os.path.basename(key),))
+            self._snapshot_stat = stat_key
+
+        return self._snapshot
 
     def load(self, path: str) -> CompiledLists:
+        snap = self._current_snapshot()
+        if snap is not None:
+            compiled = snap.get(path)
+            if compiled is not None:
+                return compiled
+
         try:
             mtime = os.path.getmtime(path)
         except FileNotFoundError:
@@ -112,30 +249,162 @@ class ListsManager:
             return self._cache[path]
 
         compiled = _compile_file(path)
+        metrics.inc(LIST_RELOADS, (os.path.basename(path),))
         self._cache[path] = compiled
         self._mtime[path] = mtime
+        self.version += 1
         return compiled
 
+    def active(self) -> dict:
+        """ruta -> lista compilada en uso: las del snapshot mandan sobre las .txt."""
+        lists = dict(self._cache)
+        if self._snapshot is not None:
+            lists.update(self._snapshot.lists)
+        return lists
+
+    def clear(self) -> int:
+        """Olvida listas compiladas y snapshot: se recargan en el siguiente uso."""
+        n = len(self.active())
+        self._cache.clear()
+        self._mtime.clear()
+        self._snapshot = None
+        self._snapshot_stat = None
+        self.version += 1
+        return n
+
+    def drop(self, path: str) -> bool:
+        """
+        Olvida una lista. Si viene del snapshot se suelta el snapshot entero (no
+        se puede recargar una lista suelta de él).
+        """
+        found = self._cache.pop(path, None) is not None
+        self._mtime.pop(path, None)
+        snap = self._snapshot
+        if snap is not None and snap.get(path) is not None:
+            self._snapshot = None
+            self._snapshot_stat = None
+            found = True
+        if found:
+            self.version += 1
+        return found
+
+
+LIST_RELOADS = metrics.counter("policy_list_reloads_total", "Compilaciones de listas (arranque + cambios)", ("list",))
+_LIST_SIZE = metrics.gauge("policy_list_entries", "Entradas por lista compilada", ("list", "kind"))
 
 _lists_mgr = ListsManager()
 
 
+def _collect_list_sizes():
+    values = {}
+    for path, compiled in _lists_mgr.active().items():
+        name = os.path.basename(path)
+        values[(name, "domain_exact")] = len(compiled.domain_exact)
+        values[(name, "domain_suffix")] = len(compiled.domain_suffixes)
+        values[(name, "ipv4_range")] = len(compiled.ipv4)
+        values[(name, "ipv6_range")] = len(compiled.ipv6)
+    yield _LIST_SIZE, values
+
+
+metrics.register_collector(_collect_list_sizes)
+
+
+def _list_path(name: str) -> str:
+    # el operador puede dar la ruta completa o solo el nombre del fichero
+    for path in _lists_mgr.active():
+        if name in (path, os.path.basename(path)):
+            return path
+    return name
+
+
+class _ListsHandle(DictHandle):
+    """Listas .txt compiladas y, en modo snapshot, las del snapshot mmap."""
+
+    def info(self) -> dict:
+        # el snapshot es un mmap compartido: cuenta como entradas, no como memoria propia
+        return {**super().info(), "entries": len(_lists_mgr.active())}
+
+    def purge(self) -> int:
+        return _lists_mgr.clear()
+
+    def invalidate(self, key: str) -> bool:
+        return _lists_mgr.drop(self.key_from_str(key))
+
+
+# vaciarla fuerza a recompilar las listas (o reabrir el snapshot) en el siguiente uso
+register(_ListsHandle("policy_lists", _lists_mgr._cache, "ruta de lista -> lista compilada", key_from_str=_list_path))
+register(FunctionCacheHandle("normalize_host", normalize_host, "host -> ASCII (IDNA) en minúsculas"))
+
+
 def _match_domain(host_ascii: str, compiled: CompiledLists) -> bool:
     # exact match
     if host_ascii in compiled.domain_exact:
         return True
-    # suffix match (*.example.com)
-    for suf in compiled.domain_suffixes:
-        if host_ascii == suf or host_ascii.endswith("." + suf):
+    # suffix match (*.example.com): probamos el host y cada dominio padre
+    # => O(nº de etiquetas) en vez de recorrer todos los sufijos
+    suffixes = compiled.domain_suffixes
+    candidate = host_ascii
+    while candidate:
+        if candidate in suffixes:
             return True
+        dot = candidate.find(".")
+        if dot < 0:
+            break
+        candidate = candidate[dot + 1:]
     return False
 
 
-def _match_ip(ip: ipaddress._BaseAddress, compiled: CompiledLists) -> bool:
-    for net in compiled.networks:
-        if ip in net:
+def _match_ip(version: int, ip_int: int, compiled: CompiledLists) -> bool:
+    return compiled.ranges_for(version).contains(ip_int)
+
+
+def ip_to_int(ip: str) -> Optional[tuple[int, int]]:
+    """
+    "1.2.3.4" -> (4, 16909060). Devuelve None si no es una IP válida.
+    Usa inet_pton: sin objetos ipaddress intermedios.
+    """
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, ValueError, UnicodeError):
+        pass
+    try:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+    except (OSError, ValueError, UnicodeError):
+        return None
+
+
+def int_to_ip(ip_num: tuple[int, int]) -> str:
+    """(4, 16909060) -> "1.2.3.4" (inversa de ip_to_int)."""
+    version, ip_int = ip_num
+    if version == 4:
+        return socket.inet_ntop(socket.AF_INET, ip_int.to_bytes(4, "big"))
+    return socket.inet_ntop(socket.AF_INET6, ip_int.to_bytes(16, "big"))
+
+
+def _policy_name(default_policy: str) -> str:
+    policy = (default_policy or "allow").strip().lower()
+    return policy if policy in {"allow", "deny"} else "allow"
+
+
+def decide_ip_by_policy(
+    *,
+    default_policy: str,
+    allow_path: str,
+    deny_path: str,
+    ip_num: Optional[tuple[int, int]],
+) -> bool:
+    """
+    Como decide_by_policy pero solo por IP, ya en forma (version, entero).
+    Pensado para el camino caliente (middleware de cliente).
+    """
+    if _policy_name(default_policy) == "allow":
+        if ip_num is None:
             return True
-    return False
+        return not _match_ip(ip_num[0], ip_num[1], _lists_mgr.load(deny_path))
+
+    if ip_num is None:
+        return False
+    return _match_ip(ip_num[0], ip_num[1], _lists_mgr.load(allow_path))
 
 
 def decide_by_policy(
@@ -145,25 +414,23 @@ def decide_by_policy(
     deny_path: str,
     host: Optional[str] = None,
     ip: Optional[str] = None,
+    ip_num: Optional[tuple[int, int]] = None,
 ) -> bool:
     """
     Devuelve True si PERMITE, False si BLOQUEA.
 
+    La IP puede venir como texto (ip) o ya empaquetada como (version, entero)
+    (ip_num), que es como la transporta el pipeline de validación.
+
     - default_policy = "allow" => permite todo salvo denylist
     - default_policy = "deny"  => bloquea todo salvo allowlist
     """
-    policy = (default_policy or "allow").strip().lower()
-    if policy not in {"allow", "deny"}:
-        policy = "allow"
+    policy = _policy_name(default_policy)
 
-    host_ascii = _normalize_host(host) if host else None
+    host_ascii = normalize_host(host) if host else None
 
-    ip_obj = None
-    if ip:
-        try:
-            ip_obj = ipaddress.ip_address(ip)
-        except ValueError:
-            ip_obj = None
+    if ip_num is None and ip:
+        ip_num = ip_to_int(ip)
 
     allow = _lists_mgr.load(allow_path)
     deny = _lists_mgr.load(deny_path)
@@ -175,11 +442,31 @@ def decide_by_policy(
         allow_hit = allow_hit or _match_domain(host_ascii, allow)
         deny_hit = deny_hit or _match_domain(host_ascii, deny)
 
-    if ip_obj is not None:
-        allow_hit = allow_hit or _match_ip(ip_obj, allow)
-        deny_hit = deny_hit or _match_ip(ip_obj, deny)
+    if ip_num is not None:
+        version, ip_int = ip_num
+        allow_hit = allow_hit or _match_ip(version, ip_int, allow)
+        deny_hit = deny_hit or _match_ip(version, ip_int, deny)
 
     if policy == "allow":
         return not deny_hit
     else:
         return allow_hit
+
+
+def lists_version() -> int:
+    """Contador local de cambios de listas en este worker (barato de comparar)."""
+    return _lists_mgr.version
+
+
+def policy_generation(*paths: str, extra: str = "") -> int:
+    """
+    Generación de la política formada por las listas indicadas.
+
+    Es una huella del contenido: cambia cada vez que cambia alguna lista (o
+    `extra`, p.ej. la política por defecto) y vale lo mismo en todos los
+    workers/instancias, así que se puede persistir y comparar en BD.
+    """
+    h = hashlib.blake2b(extra.encode("utf-8"), digest_size=8)
+    for path in paths:
+        h.update(_lists_mgr.load(path).digest.to_bytes(8, "big"))
+    return int.from_bytes(h.digest(), "big") >> 1
@@ -0,0 +1,272 @@
+# policy_snapshot.py
+
+"""
+Snapshot binario de las listas de políticas ya compiladas.
+
+Con varios workers (uvicorn/gunicorn) cada proceso parseaba y guardaba su propia
+copia de cada allow/deny list. Aquí se compilan UNA vez a un fichero versionado
+que los workers mapean en memoria (mmap, solo lectura): todos comparten las
+mismas páginas físicas y el arranque en frío no parsea nada.
+
+Formato (orden de bytes nativo, secciones alineadas a 8 bytes):
+
+    cabecera  : magic (8) | formato u32 | len_indice u32 | version u64
+    indice    : JSON utf-8 -> por lista, (offset, nº elementos) de cada sección
+    secciones : arrays uint64
+                  - exact / suffix : hashes blake2b-64 de dominios, ordenados
+                  - v4             : starts + ends de rangos IPv4
+                  - v6             : starts_hi + starts_lo + ends_hi + ends_lo
+                El índice guarda además la huella (digest) del .txt de origen,
+                que alimenta policy_lists.policy_generation().
+
+El fichero se escribe en un temporal y se sustituye con os.replace(): los
+workers que aún tengan mapeada la versión anterior siguen leyendo el inodo
+viejo hasta que detectan el cambio (policy_lists.ListsManager).
+
+Uso:
+    python -m policy_snapshot build [--out PATH] [lista.txt ...]
+    python -m policy_snapshot info [PATH]
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Optional
+
+from config import settings
+from policy_lists import CompiledLists, IPRangeSet, _compile_file
+
+
+MAGIC = b"SHPOLSNP"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("=8sIIQ")
+_U64 = 8
+_MASK64 = (1 << 64) - 1
+
+
+def _host_hash(host_ascii: str) -> int:
+    # hash estable entre procesos (hash() de Python está aleatorizado)
+    digest = hashlib.blake2b(host_ascii.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, sys.byteorder)
+
+
+def _align(n: int) -> int:
+    return (n + _U64 - 1) & ~(_U64 - 1)
+
+
+def _list_key(path: str) -> str:
+    return os.path.abspath(path)
+
+
+class HashedDomainSet:
+    """Conjunto de dominios como hashes uint64 ordenados (solo lectura)."""
+
+    __slots__ = ("_hashes",)
+
+    def __init__(self, hashes):
+        self._hashes = hashes
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, host_ascii: object) -> bool:
+        if not isinstance(host_ascii, str):
+            return False
+        h = _host_hash(host_ascii)
+        i = bisect_left(self._hashes, h)
+        return i < len(self._hashes) and self._hashes[i] == h
+
+
+class _U128View:
+    """Secuencia de enteros de 128 bits sobre dos vistas uint64 (hi, lo)."""
+
+    __slots__ = ("_hi", "_lo")
+
+    def __init__(self, hi, lo):
+        self._hi = hi
+        self._lo = lo
+
+    def __len__(self) -> int:
+        return len(self._hi)
+
+    def __getitem__(self, i: int) -> int:
+        return (self._hi[i] << 64) | self._lo[i]
+
+
+class PolicySnapshot:
+    """Snapshot abierto: listas compiladas respaldadas por un mmap."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mm) < _HEADER.size:
+            raise ValueError("policy snapshot truncated")
+        magic, fmt, index_len, version = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError("unsupported policy snapshot format")
+
+        index_end = _HEADER.size + index_len
+        index = json.loads(bytes(self._mm[_HEADER.size:index_end]).decode("utf-8"))
+        data_start = _align(index_end)
+        words = memoryview(self._mm)[data_start:].cast("Q")
+
+        def section(ref) -> memoryview:
+            offset, count = ref
+            return words[offset:offset + count]
+
+        self.path = path
+        self.version = int(version)
+        self.lists: dict[str, CompiledLists] = {}
+        for key, entry in index["lists"].items():
+            v4 = entry["v4"]
+            v6 = entry["v6"]
+            self.lists[key] = CompiledLists(
+                domain_suffixes=HashedDomainSet(section(entry["suffix"])),
+                domain_exact=HashedDomainSet(section(entry["exact"])),
+                ipv4=IPRangeSet.from_sorted(section(v4[0]), section(v4[1])),
+                ipv6=IPRangeSet.from_sorted(
+                    _U128View(section(v6[0]), section(v6[1])),
+                    _U128View(section(v6[2]), section(v6[3])),
+                ),
+                digest=int(entry.get("digest", 0)),
+            )
+
+    def get(self, path: str) -> Optional[CompiledLists]:
+        return self.lists.get(_list_key(path))
+
+
+def open_snapshot(path: str) -> PolicySnapshot:
+    return PolicySnapshot(path)
+
+
+def read_version(path: str) -> Optional[int]:
+    try:
+        with open(path, "rb") as f:
+            raw = f.read(_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(raw) < _HEADER.size:
+        return None
+    magic, fmt, _, version = _HEADER.unpack(raw)
+    if magic != MAGIC or fmt != FORMAT_VERSION:
+        return None
+    return int(version)
+
+
+def _sections_for(compiled: CompiledLists) -> dict[str, array]:
+    v6_starts = list(compiled.ipv6.starts)
+    v6_ends = list(compiled.ipv6.ends)
+    return {
+        "exact": array("Q", sorted({_host_hash(h) for h in compiled.domain_exact})),
+        "suffix": array("Q", sorted({_host_hash(h) for h in compiled.domain_suffixes})),
+        "v4_starts": array("Q", compiled.ipv4.starts),
+        "v4_ends": array("Q", compiled.ipv4.ends),
+        "v6_starts_hi": array("Q", (x >> 64 for x in v6_starts)),
+        "v6_starts_lo": array("Q", (x & _MASK64 for x in v6_starts)),
+        "v6_ends_hi": array("Q", (x >> 64 for x in v6_ends)),
+        "v6_ends_lo": array("Q", (x & _MASK64 for x in v6_ends)),
+    }
+
+
+def build_snapshot(paths: Iterable[str], out_path: str) -> int:
+    """
+    Compila las listas indicadas y escribe el snapshot de forma atómica.
+    Devuelve la nueva versión (anterior + 1).
+    """
+    blobs: list[array] = []
+    index: dict[str, dict] = {}
+    offset = 0
+
+    def push(arr: array) -> list[int]:
+        nonlocal offset
+        ref = [offset, len(arr)]
+        blobs.append(arr)
+        offset += len(arr)
+        return ref
+
+    for path in paths:
+        compiled = _compile_file(path)
+        s = _sections_for(compiled)
+        index[_list_key(path)] = {
+            "digest": compiled.digest,
+            "exact": push(s["exact"]),
+            "suffix": push(s["suffix"]),
+            "v4": [push(s["v4_starts"]), push(s["v4_ends"])],
+            "v6": [
+                push(s["v6_starts_hi"]),
+                push(s["v6_starts_lo"]),
+                push(s["v6_ends_hi"]),
+                push(s["v6_ends_lo"]),
+            ],
+        }
+
+    version = (read_version(out_path) or 0) + 1
+    index_raw = json.dumps({"lists": index}, separators=(",", ":")).encode("utf-8")
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(index_raw), version)
+    padding = _align(len(header) + len(index_raw)) - (len(header) + len(index_raw))
+
+    tmp_path = f"{out_path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(index_raw)
+        f.write(b"\0" * padding)
+        for arr in blobs:
+            arr.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, out_path)
+    return version
+
+
+def _default_paths() -> list[str]:
+    return [
+        settings.app_allowlist_path,
+        settings.app_denylist_path,
+        settings.target_allowlist_path,
+        settings.target_denylist_path,
+    ]
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="policy_snapshot", description=__doc__.splitlines()[1])
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="compila las listas a un snapshot mmap")
+    p_build.add_argument("--out", default=settings.policy_snapshot_path)
+    p_build.add_argument("lists", nargs="*", help="ficheros de listas (por defecto, los de settings)")
+
+    p_info = sub.add_parser("info", help="muestra versión y tamaños de un snapshot")
+    p_info.add_argument("path", nargs="?", default=settings.policy_snapshot_path)
+
+    args = parser.parse_args(argv)
+
+    if args.cmd == "build":
+        if not args.out:
+            parser.error("--out is required (or set POLICY_SNAPSHOT_PATH)")
+        version = build_snapshot(args.lists or _default_paths(), args.out)
+        print(f"policy snapshot v{version} -> {args.out}")
+        return 0
+
+    if not args.path:
+        parser.error("path is required (or set POLICY_SNAPSHOT_PATH)")
+    snap = open_snapshot(args.path)
+    print(f"{args.path}: version {snap.version}")
+    for key, compiled in snap.lists.items():
+        print(
+            f"  {key}: exact={len(compiled.domain_exact)} suffix={len(compiled.domain_suffixes)} "
+            f"v4_ranges={len(compiled.ipv4)} v6_ranges={len(compiled.ipv6)}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,185 @@
+# profiler.py
+
+"""
+Profiler por muestreo bajo demanda (POST /admin/profile).
+
+Mientras dura una captura, el hilo que atiende la petición despierta cada
+`interval_ms`, lee las pilas de todos los hilos del worker
+(sys._current_frames()) y acumula cada pila en formato "collapsed" (una línea
+por pila distinta: `marco;marco;marco cuenta`), que aceptan flamegraph.pl,
+speedscope o inferno.
+
+- Fuera de una captura no hay nada instalado: ni hilos, ni hooks, ni
+  sys.setprofile. Coste cero en reposo.
+- Cada muestra se etiqueta con la ruta que está sirviendo el hilo (se detecta
+  el código del endpoint en la pila) o, si no sirve ninguna, con el nombre del
+  hilo (`thread:hll-persister`).
+- Memoria acotada: PROFILER_MAX_STACKS pilas distintas (el resto se cuenta en
+  `[truncated]`) y PROFILER_MAX_DEPTH marcos por pila.
+- Una captura a la vez por worker; duración máxima PROFILER_MAX_SECONDS.
+
+Es por worker: con varios procesos, cada captura ve solo el que la atiende.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Iterable
+
+from config import settings
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+# marcos hoja que indican un hilo esperando (pool ocioso, Event.wait, select del loop)
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+
+_run_lock = threading.Lock()
+
+
+def _route_codes(routes: Iterable) -> dict:
+    """code object del endpoint -> path de la ruta."""
+    codes = {}
+    for route in routes:
+        endpoint = getattr(route, "endpoint", None)
+        code = getattr(endpoint, "__code__", None)
+        path = getattr(route, "path", None)
+        if code is not None and path:
+            codes[code] = path
+    return codes
+
+
+class _Capture:
+    def __init__(self, route_codes: dict, *, max_stacks: int, max_depth: int, include_idle: bool):
+        self.route_codes = route_codes
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.by_route: Counter = Counter()
+        self.samples = 0
+        self.idle = 0
+        self.truncated = 0
+        self._labels: dict = {}  # code -> "modulo:funcion" (se repiten mucho)
+        self._thread_names: dict[int, str] = {}
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = os.path.splitext(os.path.basename(code.co_filename))[0]
+            label = self._labels[code] = f"{name}:{code.co_name}"
+        return label
+
+    def _thread_name(self, ident: int) -> str:
+        name = self._thread_names.get(ident)
+        if name is None:
+            for t in threading.enumerate():
+                self._thread_names[t.ident] = t.name
+            name = self._thread_names.setdefault(ident, str(ident))
+        return name
+
+    def sample(self, skip: set) -> None:
+        for ident, frame in sys._current_frames().items():
+            if ident in skip:
+                continue
+            if not self.include_idle and frame.f_code.co_filename.endswith(_IDLE_FILES):
+                self.idle += 1
+                continue
+
+            codes = []
+            route = None
+            f = frame
+            while f is not None:
+                code = f.f_code
+                if route is None:
+                    route = self.route_codes.get(code)
+                codes.append(code)
+                f = f.f_back
+            del frame, f
+
+            # raíz primero, recortando por arriba (lo caro suele estar en las hojas)
+            codes.reverse()
+            if len(codes) > self.max_depth:
+                codes = codes[-self.max_depth :]
+            tag = route if route is not None else f"thread:{self._thread_name(ident)}"
+            key = ";".join([tag] + [self._label(c) for c in codes])
+
+            self.samples += 1
+            self.by_route[tag] += 1
+            if key in self.stacks or len(self.stacks) < self.max_stacks:
+                self.stacks[key] += 1
+            else:
+                self.truncated += 1
+
+    def collapsed(self) -> str:
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        if self.truncated:
+            lines.append(f"[truncated] {self.truncated}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, *, top: int = 20) -> dict:
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "samples": self.samples,
+            "idle_samples": self.idle,
+            "truncated_samples": self.truncated,
+            "distinct_stacks": len(self.stacks),
+            "by_route": dict(self.by_route.most_common()),
+            "top_leaf_frames": [{"frame": f, "samples": n} for f, n in leaves.most_common(top)],
+        }
+
+
+def profile(
+    routes: Iterable,
+    *,
+    seconds: float,
+    interval_ms: float = 5.0,
+    include_idle: bool = False,
+) -> tuple[_Capture, float]:
+    """
+    Muestrea el worker durante `seconds` desde el hilo que llama (que se
+    excluye de las muestras). Devuelve (captura, segundos reales).
+    Lanza ProfilerBusy si ya hay una captura en curso.
+    """
+    if not _run_lock.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already running on this worker")
+    try:
+        seconds = min(float(seconds), float(settings.profiler_max_seconds))
+        interval = max(0.001, interval_ms / 1000.0)
+        capture = _Capture(
+            _route_codes(routes),
+            max_stacks=max(1, settings.profiler_max_stacks),
+            max_depth=max(1, settings.profiler_max_depth),
+            include_idle=include_idle,
+        )
+        skip = {threading.get_ident()}
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_at = started
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now < next_at:
+                time.sleep(min(next_at, deadline) - now)
+                continue
+            capture.sample(skip)
+            next_at += interval
+            if next_at < now:
+                # nos hemos retrasado (GIL ocupado): no acumular muestras atrasadas
+                next_at = now + interval
+        return capture, time.perf_counter() - started
+    finally:
+        _run_lock.release()
+
+
+def is_running() -> bool:
+    return _run_lock.locked()
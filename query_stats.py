@@ -0,0 +1,191 @@
+# query_stats.py
+
+"""
+Contabilidad de consultas SQL por request.
+
+Hooks de cursor en el engine (instrument(engine)) que, dentro de un request,
+cuentan sentencias y tiempo en un acumulador de contexto (el contexto se copia
+al threadpool de Starlette, así que los endpoints sync ven el mismo). Con eso:
+
+- métricas: db_queries_per_request y db_query_seconds_total por ruta;
+- trazas: etapa `sql` en Server-Timing (tiempo total y nº de sentencias);
+- N+1: la misma sentencia ejecutada QUERY_N_PLUS_ONE_THRESHOLD veces o más en
+  un request deja un evento "n_plus_one" y cuenta en db_n_plus_one_total;
+- presupuestos: @budget(n) en un endpoint declara cuántas consultas puede hacer.
+  Pasarse se cuenta siempre; con QUERY_BUDGET_STRICT=true (tests) además lanza
+  QueryBudgetExceeded, que el TestClient propaga.
+
+Para probar funciones sueltas sin HTTP:
+
+    with query_stats.expect_queries(2):
+        crud.list_urls_for_tenant(db, tenant_id)
+
+Las consultas de los hilos de fondo (volcados, revalidación) no cuentan.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from sqlalchemy import event
+
+import metrics
+import tracing
+from config import settings
+from logger import log_event
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestQueries:
+    __slots__ = ("queries", "seconds", "started", "statements")
+
+    def __init__(self, track_statements: bool = True):
+        self.queries = 0
+        self.seconds = 0.0
+        self.started = 0.0
+        # sentencia -> veces (solo si se buscan N+1)
+        self.statements: Optional[dict[str, int]] = {} if track_statements else None
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        if not self.statements or threshold <= 0:
+            return []
+        return sorted(
+            ((stmt, n) for stmt, n in self.statements.items() if n >= threshold),
+            key=lambda item: -item[1],
+        )
+
+
+_current: contextvars.ContextVar[Optional[RequestQueries]] = contextvars.ContextVar("query_stats", default=None)
+
+
+def current() -> Optional[RequestQueries]:
+    return _current.get()
+
+
+# -------------------------
+# Hooks del engine
+# -------------------------
+
+def instrument(engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        acc = _current.get()
+        if acc is not None:
+            acc.started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        acc = _current.get()
+        if acc is None:
+            return
+        elapsed = time.perf_counter() - acc.started
+        acc.queries += 1
+        acc.seconds += elapsed
+        if acc.statements is not None:
+            # SQLAlchemy parametriza: el mismo SELECT con otro id es el mismo texto
+            acc.statements[statement] = acc.statements.get(statement, 0) + 1
+        trace = tracing.current()
+        if trace is not None:
+            trace.add("sql", elapsed)
+
+
+# -------------------------
+# Presupuestos
+# -------------------------
+
+def budget(max_queries: int):
+    """Declara el máximo de consultas SQL de un endpoint (no lo envuelve)."""
+
+    def decorator(fn):
+        fn.__query_budget__ = max_queries
+        return fn
+
+    return decorator
+
+
+def _describe(acc: RequestQueries, limit: int = 5) -> str:
+    if not acc.statements:
+        return ""
+    top = sorted(acc.statements.items(), key=lambda item: -item[1])[:limit]
+    return "; ".join(f"{n}x {' '.join(stmt.split())[:120]}" for stmt, n in top)
+
+
+@contextmanager
+def expect_queries(max_queries: int):
+    """Para tests: falla si el bloque ejecuta más de `max_queries` consultas."""
+    acc = RequestQueries()
+    token = _current.set(acc)
+    try:
+        yield acc
+    finally:
+        _current.reset(token)
+    if acc.queries > max_queries:
+        raise QueryBudgetExceeded(f"{acc.queries} queries > budget {max_queries}: {_describe(acc)}")
+
+
+# -------------------------
+# Middleware
+# -------------------------
+
+DB_QUERIES = metrics.histogram(
+    "db_queries_per_request", "Consultas SQL por request", ("route",), (0, 1, 2, 3, 5, 8, 13, 21, 50)
+)
+DB_TIME = metrics.counter("db_query_seconds_total", "Tiempo en consultas SQL", ("route",))
+N_PLUS_ONE = metrics.counter("db_n_plus_one_total", "Requests con una sentencia repetida (N+1)", ("route",))
+BUDGET_EXCEEDED = metrics.counter(
+    "db_query_budget_exceeded_total", "Requests por encima de su presupuesto de consultas", ("route",)
+)
+
+
+class QueryStatsMiddleware:
+    """ASGI puro: un acumulador por request y el balance al terminar."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        threshold = settings.query_n_plus_one_threshold
+        acc = RequestQueries(track_statements=threshold > 0 or settings.query_budget_strict)
+        token = _current.set(acc)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+        self._account(scope, acc, threshold)
+
+    @staticmethod
+    def _account(scope, acc: RequestQueries, threshold: int) -> None:
+        route = scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        metrics.observe(DB_QUERIES, acc.queries, (path,))
+        if acc.seconds:
+            metrics.inc(DB_TIME, (path,), acc.seconds)
+
+        repeated = acc.repeated(threshold)
+        if repeated:
+            metrics.inc(N_PLUS_ONE, (path,))
+        for statement, count in repeated:
+            log_event(
+                "n_plus_one",
+                logging.WARNING,
+                route=path,
+                count=count,
+                statement=" ".join(statement.split())[:300],
+            )
+
+        limit = getattr(getattr(route, "endpoint", None), "__query_budget__", None)
+        if limit is not None and acc.queries > limit:
+            metrics.inc(BUDGET_EXCEEDED, (path,))
+            if settings.query_budget_strict:
+                raise QueryBudgetExceeded(f"{path}: {acc.queries} queries > budget {limit}: {_describe(acc)}")
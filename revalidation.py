@@ -0,0 +1,264 @@
+# revalidation.py
+
+"""
+Barrido en background que revalida los destinos de todas las urls activas:
+target_url y los destinos por país (url_geo_targets).
+
+Si un dominio entra en target_denylist.txt o un host empieza a resolver a una
+red privada, el veredicto persistido (urls.verdict_* / blocked_at) se actualiza
+aquí y no en el siguiente click: el redirect sirve el 410 desde la fila.
+
+- Recorrido por keyset (id > último id) en lotes de REVALIDATION_BATCH_SIZE.
+- DNS de cada lote resuelto con concurrencia acotada (REVALIDATION_DNS_CONCURRENCY).
+- Límite de filas/segundo (REVALIDATION_MAX_ROWS_PER_SECOND) para no competir
+  con el tráfico real.
+- Progreso y throughput en SweepStats (GET /admin/revalidation).
+- Un solo worker barre: el lease "revalidation" (tabla leases) se toma al
+  empezar, se renueva en cada lote y guarda cuándo terminó el último barrido
+  completo; el resto de workers solo comprueban el lease cada
+  REVALIDATION_LEASE_SECONDS.
+- Un fallo transitorio del resolver (DNSUnavailable) no cambia nada: la fila
+  conserva su veredicto y cuenta en `errors`.
+- Los veredictos escritos aquí duran al menos hasta el siguiente barrido (el
+  TTL del DNS suele ser mucho más corto que el intervalo): sin eso el redirect
+  volvería a validar en línea entre barridos.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from typing import Optional
+
+import crud
+import models
+from config import settings
+from database import SessionLocal
+from logger import log_event, logger
+from target_validation import dns_host_of, evaluate_target_url, prefetch_dns
+
+LEASE_NAME = "revalidation"
+
+
+@dataclass
+class SweepStats:
+    running: bool = False
+    sweeps_completed: int = 0
+    # barrido en curso (o el último)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    total_estimate: int = 0
+    scanned: int = 0
+    last_id: int = 0
+    blocked: int = 0
+    newly_blocked: int = 0
+    unblocked: int = 0
+    errors: int = 0
+    rows_per_second: float = 0.0
+    # este worker tenía el lease en el último intento
+    leader: bool = False
+
+    def as_dict(self) -> dict:
+        d = asdict(self)
+        d["progress"] = (self.scanned / self.total_estimate) if self.total_estimate else None
+        return d
+
+
+class RevalidationSweeper:
+    def __init__(
+        self,
+        *,
+        session_factory=SessionLocal,
+        batch_size: int = settings.revalidation_batch_size,
+        max_rows_per_second: int = settings.revalidation_max_rows_per_second,
+        dns_concurrency: int = settings.revalidation_dns_concurrency,
+        interval_seconds: int = settings.revalidation_interval_seconds,
+        lease_seconds: int = settings.revalidation_lease_seconds,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = max(1, int(batch_size))
+        self.max_rows_per_second = max(0, int(max_rows_per_second))  # 0 = sin límite
+        self.dns_concurrency = max(1, int(dns_concurrency))
+        self.interval_seconds = max(1, int(interval_seconds))
+        self.lease_seconds = max(1, int(lease_seconds))
+
+        self.stats = SweepStats()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._sweep_lock = threading.Lock()
+
+    # ---- ciclo de vida ----
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="revalidation-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def trigger(self) -> bool:
+        """
+        Lanza un barrido ya (sin esperar al intervalo). False si ya hay uno en
+        curso en este worker; si lo hay en otro, el lease lo impide y
+        stats.leader queda en False.
+        """
+        if self.stats.running:
+            return False
+        # barrido periódico desactivado (o esperando): barrido puntual
+        threading.Thread(
+            target=self.run_once, kwargs={"force": True}, name="revalidation-sweep-once", daemon=True
+        ).start()
+        return True
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("revalidation sweep failed")
+            # comprobar el lease es un UPDATE: se mira a menudo para que, si el
+            # líder cae, otro worker retome el barrido sin esperar un intervalo
+            self._wake.wait(min(self.interval_seconds, self.lease_seconds))
+            self._wake.clear()
+
+    # ---- barrido ----
+
+    def run_once(self, *, force: bool = False) -> SweepStats:
+        """
+        Un barrido completo si este worker consigue el lease. Sin `force`, solo
+        si el último barrido completo (de cualquier worker) terminó hace más de
+        REVALIDATION_INTERVAL_SECONDS.
+        """
+        with self._sweep_lock:
+            owner = crud.worker_id()
+            db = self.session_factory()
+            try:
+                leader = crud.acquire_lease(
+                    db,
+                    LEASE_NAME,
+                    owner,
+                    self.lease_seconds,
+                    min_interval_seconds=0 if force else self.interval_seconds,
+                )
+                self.stats.leader = leader
+                if not leader:
+                    return self.stats
+
+                stats = SweepStats(
+                    running=True, sweeps_completed=self.stats.sweeps_completed, started_at=time.time(), leader=True
+                )
+                self.stats = stats
+                completed = False
+                try:
+                    stats.total_estimate = crud.count_active_urls(db) + crud.count_active_geo_targets(db)
+                    verdict_ttl = self._verdict_ttl(stats.total_estimate)
+                    sources = (
+                        (models.URL, crud.iter_active_url_batches),
+                        (models.GeoTarget, crud.iter_active_geo_target_batches),
+                    )
+                    with ThreadPoolExecutor(
+                        max_workers=self.dns_concurrency, thread_name_prefix="revalidation-dns"
+                    ) as pool:
+                        completed = all(
+                            self._sweep(db, pool, model, batches, stats, owner, verdict_ttl)
+                            for model, batches in sources
+                        )
+                finally:
+                    if stats.leader:
+                        crud.release_lease(db, LEASE_NAME, owner, completed=completed)
+                    stats.running = False
+                    stats.finished_at = time.time()
+                    stats.sweeps_completed += 1
+            finally:
+                db.close()
+
+            log_event(
+                "revalidation_sweep",
+                scanned=stats.scanned,
+                blocked=stats.blocked,
+                newly_blocked=stats.newly_blocked,
+                unblocked=stats.unblocked,
+                errors=stats.errors,
+                rows_per_second=round(stats.rows_per_second, 1),
+            )
+            return stats
+
+    def _sweep(self, db, pool, model, batches, stats: SweepStats, owner: str, verdict_ttl: int) -> bool:
+        """Recorre una tabla de destinos. False si se paró (stop o lease perdido)."""
+        for rows in batches(db, self.batch_size):
+            if self._stop.is_set():
+                return False
+            self._process_batch(db, pool, model, rows, stats, verdict_ttl)
+            self._throttle(stats)
+            if not crud.renew_lease(db, LEASE_NAME, owner, self.lease_seconds):
+                logger.warning("revalidation lease lost; stopping sweep")
+                stats.leader = False
+                return False
+        return True
+
+    def _verdict_ttl(self, total_estimate: int) -> int:
+        """Segundos hasta que el siguiente barrido vuelva a pasar por una fila."""
+        sweep_seconds = total_estimate / self.max_rows_per_second if self.max_rows_per_second else 0
+        return int(self.interval_seconds + self.lease_seconds + sweep_seconds)
+
+    def _process_batch(self, db, pool: ThreadPoolExecutor, model, rows, stats: SweepStats, verdict_ttl: int) -> None:
+        # 1) DNS del lote en paralelo (acotado): evaluate_target_url tirará de
+        #    caché y, para los hosts que fallaron, del error (sin resolver otra vez)
+        hosts = list({h for h in (dns_host_of(r.target_url) for r in rows) if h})
+        dns_errors = {host: err for host, err in zip(hosts, pool.map(prefetch_dns, hosts)) if err is not None}
+
+        # 2) veredictos + escritura en bloque
+        min_expires_at = time.time() + verdict_ttl
+        items = []
+        for row in rows:
+            try:
+                verdict = evaluate_target_url(row.target_url, dns_errors=dns_errors)
+            except Exception:
+                # DNSUnavailable (resolver caído) u otro fallo: resultado
+                # desconocido, la fila conserva su veredicto anterior
+                stats.errors += 1
+                continue
+            if verdict.expires_at is not None and verdict.expires_at < min_expires_at:
+                verdict = replace(verdict, expires_at=min_expires_at)
+            if not verdict.ok:
+                stats.blocked += 1
+                if row.blocked_at is None:
+                    stats.newly_blocked += 1
+            elif row.blocked_at is not None:
+                stats.unblocked += 1
+            items.append((row.id, row.blocked_at, verdict))
+
+        crud.store_target_verdicts(db, items, model)
+        stats.scanned += len(rows)
+        stats.last_id = rows[-1].id
+
+    def _throttle(self, stats: SweepStats) -> None:
+        elapsed = time.time() - stats.started_at
+        if self.max_rows_per_second:
+            min_elapsed = stats.scanned / self.max_rows_per_second
+            if min_elapsed > elapsed:
+                self._stop.wait(min_elapsed - elapsed)
+                elapsed = min_elapsed
+        stats.rows_per_second = stats.scanned / elapsed if elapsed > 0 else 0.0
+
+
+sweeper = RevalidationSweeper()
+
+
+def start_sweeper() -> None:
+    if settings.revalidation_enabled:
+        sweeper.start()
+
+
+def stop_sweeper() -> None:
+    sweeper.stop()
@@ -1,12 +1,14 @@
 # short/schemas.py
 
-from pydantic import AnyUrl, Field, BaseModel, ConfigDict
-from typing import Optional, List
+from pydantic import Field, BaseModel, ConfigDict, field_validator
+from typing import Literal, Optional, List
 from datetime import datetime
 
+from url_canon import canonicalize
+
 
 class URLBase(BaseModel):
-    target_url: AnyUrl
+    target_url: str
     custom_key: Optional[str] = Field(
         default=None,
         description="Alias opcional. Si lo dejas vacio, se genera automaticamente.",
@@ -18,6 +20,26 @@ class URLBase(BaseModel):
         le=3650,
         description="Caducidad opcional en días. Si no se indica, se usa el valor por defecto de settings.",
     )
+    count_bot_clicks: bool = Field(
+        default=False,
+        description="Si es true, los clicks de bots y previews (Slack, WhatsApp...) también cuentan.",
+    )
+    dedup_window_seconds: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=3600,
+        description="Ventana en segundos en la que las recargas del mismo visitante no cuentan.",
+    )
+
+    @field_validator("target_url")
+    @classmethod
+    def _canonical_target_url(cls, v: str) -> str:
+        # Una sola pasada (url_canon). Si no es válida se deja tal cual:
+        # validate_target_url responde el 400 con el motivo concreto.
+        try:
+            return canonicalize(v).url
+        except ValueError:
+            return v.strip()
 
 
 class URL(URLBase):
@@ -26,6 +48,14 @@ class URL(URLBase):
 
     expires_at: Optional[datetime] = None
     disabled_at: Optional[datetime] = None  # <-- CAMBIO: exponer marca de desactivación en responses
+    blocked_at: Optional[datetime] = None  # destino bloqueado por la política (revalidation.py)
+    blocked_reason: Optional[str] = None
+    geo_rules: Optional[dict] = None  # reglas por país (geo_rules.py)
+    unique_visitors: Optional[int] = Field(
+        default=None,
+        description="Visitantes únicos estimados (HyperLogLog p=12: error típico ±1.6%, ~±3.3% al 95%)",
+    )
+    unique_visitors_today: Optional[int] = Field(default=None, description="Idem, día UTC actual")
     created_at: Optional[datetime] = None
 
     state: str
@@ -90,3 +120,83 @@ class URLInfoOwned(URLInfo):  # <-- CAMBIO: response para /api/urls (incluye own
 
 class URLListOut(BaseModel):  # <-- CAMBIO
     items: List[URLInfoOwned]
+
+
+class BotClicksUpdate(BaseModel):
+    count_bot_clicks: bool
+
+
+class DedupWindowUpdate(BaseModel):
+    dedup_window_seconds: Optional[int] = Field(default=None, ge=1, le=3600, description="null = sin dedup")
+
+
+# -------------------------
+# Reglas por país (geo_rules.py)
+# -------------------------
+
+def _check_iso_codes(codes) -> None:
+    for cc in codes:
+        if len(cc.strip()) != 2 or not cc.strip().isalpha():
+            raise ValueError(f"invalid country code: {cc!r}")
+
+
+class GeoRulesIn(BaseModel):
+    block: List[str] = Field(default_factory=list, description="Códigos ISO de país sin acceso")
+    targets: dict[str, str] = Field(default_factory=dict, description="País -> destino alternativo")
+
+    @field_validator("block")
+    @classmethod
+    def _iso_codes(cls, v: List[str]) -> List[str]:
+        _check_iso_codes(v)
+        return v
+
+    @field_validator("targets")
+    @classmethod
+    def _iso_target_codes(cls, v: dict[str, str]) -> dict[str, str]:
+        _check_iso_codes(v)
+        return v
+
+
+class GeoRulesItem(BaseModel):
+    key: str
+    rules: Optional[GeoRulesIn] = None  # None => borra las reglas del link
+
+
+class GeoRulesBulkIn(BaseModel):
+    items: List[GeoRulesItem] = Field(min_length=1, max_length=1000)
+
+
+class GeoRulesBulkOut(BaseModel):
+    updated: int
+    not_found: List[str]
+
+
+# -------------------------
+# Estadísticas (click_stats.py)
+# -------------------------
+
+StatsGranularity = Literal["minute", "hour", "day"]
+
+
+class StatsPoint(BaseModel):
+    bucket: datetime
+    clicks: int
+
+
+class StatsBreakdown(BaseModel):
+    value: Optional[str] = None  # None = desconocido
+    clicks: int
+
+
+class URLStatsOut(BaseModel):
+    key: str
+    granularity: str
+    start: datetime
+    end: datetime
+    total: int
+    series: List[StatsPoint]
+    # countries/referrers son por día: rango de días completos que cubren
+    breakdown_start: datetime
+    breakdown_end: datetime
+    countries: List[StatsBreakdown]
+    referrers: List[StatsBreakdown]
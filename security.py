@@ -1,5 +1,6 @@
 import time
 import hmac
+from datetime import datetime, timedelta
 import hashlib
 from collections import defaultdict, deque
 from fastapi import HTTPException, Request, Depends, status, Security  # <-- CAMBIO
@@ -8,6 +9,9 @@ from fastapi.security import APIKeyHeader
 from sqlalchemy.orm import Session
 
 
+import metrics
+import tracing
+from caches import DictHandle, register
 from config import settings
 from database import get_db  # <-- CAMBIO
 import models  # <-- CAMBIO
@@ -20,6 +24,7 @@ x_root_key_scheme = APIKeyHeader(name="X-Root-Key", auto_error=False)
 
 # Sliding window in-memory: {identity: deque[timestamps]}
 _requests_log = defaultdict(lambda: deque())
+register(DictHandle("rate_limiter", _requests_log, "identidad (ip:... / api:...) -> timestamps de la ventana"))
 
 
 def hash_api_key(raw_api_key: str) -> str:  # <-- CAMBIO
@@ -64,11 +69,26 @@ def rate_limit(request: Request) -> None:
         q.popleft()
 
     if len(q) >= limit:
+        metrics.inc(RATE_LIMITED)
         raise HTTPException(status_code=429, detail="Too Many Requests")
 
     q.append(now)
 
 
+RATE_LIMITED = metrics.counter("rate_limited_total", "Requests rechazadas con 429")
+_RATE_LIMIT_STATE = metrics.gauge(
+    "rate_limiter_state", "Estado del rate limiter en memoria (identidades y timestamps)", ("kind",)
+)
+
+
+def _collect_rate_limiter():
+    queues = list(_requests_log.values())
+    yield _RATE_LIMIT_STATE, {("identities",): len(queues), ("timestamps",): sum(len(q) for q in queues)}
+
+
+metrics.register_collector(_collect_rate_limiter)
+
+
 def sign_message(message: str) -> str:
     """
     Firma HMAC (opcional). Usa HMAC_SECRET_KEY desde .env.
@@ -94,6 +114,7 @@ def require_root_admin(root_key: str = Security(x_root_key_scheme)) -> None:  #
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
 
 
+@tracing.traced("auth")
 def get_current_tenant(
     api_key: str = Security(x_api_key_scheme),
     db: Session = Depends(get_db),
@@ -102,24 +123,24 @@ def get_current_tenant(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing X-API-Key")
 
     key_hash = hash_api_key(api_key)
-    ak = (
-        db.query(models.APIKey)
+    # key + tenant en una sola consulta (el inner join descarta keys huérfanas)
+    row = (
+        db.query(models.APIKey, models.Tenant)
+        .join(models.Tenant, models.Tenant.id == models.APIKey.tenant_id)
         .filter(models.APIKey.key_hash == key_hash, models.APIKey.is_active == True)
         .first()
     )
-    if not ak:
+    if not row:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
-
-    # audit best-effort
-    try:
-        from datetime import datetime  # <-- CAMBIO
-        ak.last_used_at = datetime.utcnow()  # <-- CAMBIO
-        db.commit()
-    except Exception:
-        db.rollback()
-
-    tenant = db.query(models.Tenant).filter(models.Tenant.id == ak.tenant_id).first()
-    if not tenant:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Tenant not found")
+    ak, tenant = row
+
+    # audit best-effort, como mucho una escritura por key cada API_KEY_TOUCH_INTERVAL_SECONDS
+    now = datetime.utcnow()
+    if ak.last_used_at is None or now - ak.last_used_at >= timedelta(seconds=settings.api_key_touch_interval_seconds):
+        try:
+            ak.last_used_at = now
+            db.commit()
+        except Exception:
+            db.rollback()
 
     return tenant
@@ -2,90 +2,142 @@
 
 from __future__ import annotations
 
-import ipaddress
-from urllib.parse import urlsplit
-from typing import Optional
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Mapping, Optional
 
 from fastapi import HTTPException
 
 from config import settings
-from policy_lists import decide_by_policy
-from dns_cache import get_cached, resolve_host, set_cached  # <-- CAMBIO
+from policy_lists import (
+    compile_networks,
+    decide_by_policy,
+    decide_ip_by_policy,
+    ip_to_int,
+    lists_version,
+    policy_generation,
+)
+from dns_cache import DNSUnavailable, IPNum, get_cached_entry, resolve_host, set_cached  # <-- CAMBIO
+from url_canon import canonicalize, host_of
+import tracing
 
 
-
-def _normalize_host(host: str) -> str:
-    h = host.strip().strip(".").lower()
-    try:
-        return h.encode("idna").decode("ascii")
-    except Exception:
-        return h
+# Rangos que ipaddress considera is_private / is_loopback / is_link_local /
+# is_reserved / is_multicast / is_unspecified, precompilados a rangos enteros:
+# una búsqueda binaria en vez de evaluar seis propiedades por IP.
+_BLOCKED_RANGES = compile_networks(
+    [
+        # IPv4
+        "0.0.0.0/8",
+        "10.0.0.0/8",
+        "127.0.0.0/8",
+        "169.254.0.0/16",
+        "172.16.0.0/12",
+        "192.0.0.0/29",
+        "192.0.0.170/31",
+        "192.0.2.0/24",
+        "192.168.0.0/16",
+        "198.18.0.0/15",
+        "198.51.100.0/24",
+        "203.0.113.0/24",
+        "224.0.0.0/4",
+        "240.0.0.0/4",
+        # IPv6
+        "::/8",
+        "100::/8",
+        "200::/7",
+        "400::/6",
+        "800::/5",
+        "1000::/4",
+        "2001::/23",
+        "2001:2::/48",
+        "2001:db8::/32",
+        "2001:10::/28",
+        "4000::/3",
+        "6000::/3",
+        "8000::/3",
+        "a000::/3",
+        "c000::/3",
+        "e000::/4",
+        "f000::/5",
+        "f800::/6",
+        "fc00::/7",
+        "fe00::/9",
+        "fe80::/10",
+        "ff00::/8",
+    ]
+)
 
 
-def _is_blocked_ip(ip: ipaddress._BaseAddress) -> bool:
+def _is_blocked_ip(ip: IPNum) -> bool:
     if not settings.deny_private_nets:
         return False
-    return bool(
-        ip.is_private
-        or ip.is_loopback
-        or ip.is_link_local
-        or ip.is_reserved
-        or ip.is_multicast
-        or ip.is_unspecified
+    return _BLOCKED_RANGES.ranges_for(ip[0]).contains(ip[1])
+
+
+def _allowed_ip_by_policy(ip: IPNum) -> bool:
+    return decide_ip_by_policy(
+        default_policy=settings.default_target_policy,
+        allow_path=settings.target_allowlist_path,
+        deny_path=settings.target_denylist_path,
+        ip_num=ip,
     )
 
 
-def validate_target_url(raw_url: str, *, for_redirect: bool = False) -> str:
-    s = str(raw_url).strip()
+class _DnsUsage:
+    """Qué datos DNS/IP usó una validación (para persistir el veredicto)."""
+
+    __slots__ = ("expires_at", "ips", "dns_errors")
 
-    if not s:
-        raise HTTPException(status_code=400, detail="target_url is empty")
-    if len(s) > settings.max_target_url_length:
-        raise HTTPException(status_code=400, detail="target_url too long")
-    if any(c in s for c in [" ", "\t", "\n", "\r"]):
-        raise HTTPException(status_code=400, detail="target_url contains whitespace")
+    def __init__(self, dns_errors: Optional[Mapping[str, HTTPException]] = None):
+        self.expires_at: Optional[float] = None
+        self.ips: tuple[IPNum, ...] = ()
+        # host -> error de una resolución previa (prefetch_dns): no se repite
+        self.dns_errors = dns_errors
 
-    parts = urlsplit(s)
 
-    if parts.scheme not in {"http", "https"}:
-        raise HTTPException(status_code=400, detail="target_url scheme must be http or https")
-    if not parts.hostname:
-        raise HTTPException(status_code=400, detail="target_url must include a host")
-    if parts.username is not None or parts.password is not None:
-        raise HTTPException(status_code=400, detail="target_url must not contain credentials")
+def validate_target_url(raw_url: str, *, for_redirect: bool = False) -> str:
+    return _check_target_url(raw_url, usage=None)
+
 
-    host_ascii = _normalize_host(parts.hostname)
+@tracing.traced("validate")
+def _check_target_url(raw_url: str, *, usage: Optional[_DnsUsage]) -> str:
+    """
+    Validación completa; devuelve la URL canónica (url_canon). Si se pasa
+    `usage`, se anotan las IPs evaluadas y el expires_at de la resolución DNS
+    usada (hasta cuándo vale el veredicto).
+    """
+    try:
+        canon = canonicalize(raw_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    s = canon.url
+    host_ascii = canon.host_ascii
 
     if host_ascii in {"localhost"}:
         raise HTTPException(status_code=400, detail="target_url host is not allowed")
 
     # TARGET policy by host
-    allowed_by_lists = decide_by_policy(
-        default_policy=settings.default_target_policy,
-        allow_path=settings.target_allowlist_path,
-        deny_path=settings.target_denylist_path,
-        host=host_ascii,
-        ip=None,
-    )
+    with tracing.stage("policy"):
+        allowed_by_lists = decide_by_policy(
+            default_policy=settings.default_target_policy,
+            allow_path=settings.target_allowlist_path,
+            deny_path=settings.target_denylist_path,
+            host=host_ascii,
+            ip=None,
+        )
     if not allowed_by_lists:
         raise HTTPException(status_code=400, detail="target_url host blocked by policy")
 
     # literal IP?
-    ip_lit: Optional[ipaddress._BaseAddress] = None
-    try:
-        ip_lit = ipaddress.ip_address(host_ascii)
-    except ValueError:
-        ip_lit = None
+    ip_lit: Optional[IPNum] = canon.ip_literal
 
     if ip_lit is not None:
-        allowed_ip = decide_by_policy(
-            default_policy=settings.default_target_policy,
-            allow_path=settings.target_allowlist_path,
-            deny_path=settings.target_denylist_path,
-            host=None,
-            ip=str(ip_lit),
-        )
-        if not allowed_ip:
+        if usage is not None:
+            usage.ips = (ip_lit,)
+        if not _allowed_ip_by_policy(ip_lit):
             raise HTTPException(status_code=400, detail="target_url IP blocked by policy")
         if _is_blocked_ip(ip_lit):
             raise HTTPException(status_code=400, detail="target_url IP is in a blocked range")
@@ -93,20 +145,30 @@ def validate_target_url(raw_url: str, *, for_redirect: bool = False) -> str:
 
     # DNS resolve + cache
     if settings.resolve_dns:
-        ips = get_cached(host_ascii)  # <-- CAMBIO
-        if ips is None:
-            ips, ttl = resolve_host(host_ascii)  # <-- CAMBIO (ttl puede venir del DNS o fixed)
-            set_cached(host_ascii, ips, ttl)  # <-- CAMBIO
+        entry = get_cached_entry(host_ascii)  # <-- CAMBIO
+        if entry is None:
+            failed = usage.dns_errors.get(host_ascii) if usage is not None and usage.dns_errors else None
+            try:
+                if failed is not None:
+                    raise failed
+                ips, ttl = resolve_host(host_ascii)  # <-- CAMBIO (ttl puede venir del DNS o fixed)
+            except DNSUnavailable:
+                raise
+            except HTTPException:
+                # fallo de resolución: veredicto negativo de vida corta
+                if usage is not None:
+                    usage.expires_at = time.time() + max(1, int(settings.dns_cache_ttl_min_seconds))
+                raise
+            expires_at = set_cached(host_ascii, ips, ttl)  # <-- CAMBIO
+        else:
+            expires_at, ips = entry
+
+        if usage is not None:
+            usage.expires_at = expires_at
+            usage.ips = tuple(ips)
 
         for ip in ips:
-            allowed_ip = decide_by_policy(
-                default_policy=settings.default_target_policy,
-                allow_path=settings.target_allowlist_path,
-                deny_path=settings.target_denylist_path,
-                host=None,
-                ip=str(ip),
-            )
-            if not allowed_ip:
+            if not _allowed_ip_by_policy(ip):
                 raise HTTPException(status_code=400, detail="target_url resolves to blocked IP by policy")
             if _is_blocked_ip(ip):
                 raise HTTPException(status_code=400, detail="target_url resolves to a blocked IP range")
@@ -114,26 +176,146 @@ def validate_target_url(raw_url: str, *, for_redirect: bool = False) -> str:
     return s
 
 
+# -------------------------
+# Veredictos persistidos (urls.verdict_*)
+# -------------------------
+
+@dataclass(frozen=True)
+class TargetVerdict:
+    ok: bool
+    reason: Optional[str]
+    # generación de la política contra la que se calculó
+    generation: int
+    # caducidad de los datos DNS usados (epoch); None = no depende de DNS
+    expires_at: Optional[float]
+    # IPs evaluadas (resueltas o literal); () si no se llegó a resolver
+    ips: tuple[IPNum, ...] = ()
+
+
+def target_policy_generation() -> int:
+    """
+    Generación actual de la política de destinos: listas target_* + ajustes que
+    cambian el resultado de validate_target_url.
+    """
+    return policy_generation(
+        settings.target_allowlist_path,
+        settings.target_denylist_path,
+        extra=(
+            f"{settings.default_target_policy}|{settings.deny_private_nets}|"
+            f"{settings.resolve_dns}|{settings.max_target_url_length}"
+        ),
+    )
+
+
+# Generación vigente cacheada: el redirect compara un int. Se recalcula (stat de
+# las listas + hash) cuando este worker recompila alguna lista o, para ver
+# cambios en disco, como mucho cada POLICY_RELOAD_CHECK_SECONDS.
+_generation = 0
+_generation_version = -1
+_generation_next_check = 0.0
+
+
+def current_target_generation() -> int:
+    global _generation, _generation_version, _generation_next_check
+    now = time.monotonic()
+    if now >= _generation_next_check or _generation_version != lists_version():
+        _generation = target_policy_generation()
+        _generation_version = lists_version()
+        _generation_next_check = now + max(0.0, float(settings.policy_reload_check_seconds))
+    return _generation
+
+
+def evaluate_target_url(
+    raw_url: str, *, dns_errors: Optional[Mapping[str, HTTPException]] = None
+) -> TargetVerdict:
+    """
+    Como validate_target_url, pero devuelve un veredicto persistible.
+
+    Un fallo transitorio del resolver no es un veredicto: DNSUnavailable se
+    propaga y quien llama conserva el veredicto anterior. `dns_errors` son los
+    fallos ya obtenidos por prefetch_dns (no se vuelve a resolver ese host).
+    """
+    generation = target_policy_generation()
+    usage = _DnsUsage(dns_errors)
+    try:
+        _check_target_url(raw_url, usage=usage)
+        ok, reason = True, None
+    except DNSUnavailable:
+        raise
+    except HTTPException as e:
+        ok, reason = False, str(e.detail)
+    return TargetVerdict(ok, reason, generation, usage.expires_at, usage.ips)
+
+
+def target_host_of(raw_url: str) -> Optional[str]:
+    """Host normalizado (IDNA, minúsculas) de raw_url, incluidas IPs literales."""
+    return host_of(raw_url)
+
+
+def dns_host_of(raw_url: str) -> Optional[str]:
+    """Host (ASCII) que habría que resolver para validar raw_url; None si no aplica."""
+    try:
+        canon = canonicalize(raw_url)
+    except ValueError:
+        return None
+    return canon.host_ascii if canon.ip_literal is None else None
+
+
+def prefetch_dns(host_ascii: str) -> Optional[HTTPException]:
+    """
+    Calienta la caché DNS para host_ascii (lotes de revalidación). Devuelve el
+    error de resolución, si lo hubo, para pasarlo a evaluate_target_url en
+    `dns_errors` (y no resolver dos veces un host que no contesta).
+    """
+    if not settings.resolve_dns or get_cached_entry(host_ascii) is not None:
+        return None
+    try:
+        ips, ttl = resolve_host(host_ascii)
+    except HTTPException as e:
+        return e
+    set_cached(host_ascii, ips, ttl)
+    return None
+
+
+def stored_target_verdict(db_url) -> Optional[bool]:
+    """
+    Veredicto guardado en la fila si sigue vigente (misma generación de política
+    y DNS sin caducar). None => hay que revalidar.
+    """
+    if db_url.verdict_ok is None or db_url.verdict_generation != current_target_generation():
+        return None
+    expires_at = db_url.verdict_expires_at
+    if expires_at is not None and expires_at <= datetime.utcnow():
+        return None
+    return bool(db_url.verdict_ok)
+
+
+# Proxies de confianza: se parsean UNA vez (no por request)
+_trusted_proxies = compile_networks(settings.trusted_proxy_cidrs)
+
+
+def _is_trusted_proxy(remote: Optional[str]) -> bool:
+    # Sin trusted_proxy_cidrs se confía en cualquier remote (comportamiento previo)
+    if not settings.trusted_proxy_cidrs:
+        return True
+    ip_num = ip_to_int(remote) if remote else None
+    return ip_num is not None and _trusted_proxies.ranges_for(ip_num[0]).contains(ip_num[1])
+
+
+def client_ip_from(remote: Optional[str], xff: Optional[str]) -> str:
+    """
+    IP del cliente final a partir del remote de la conexión y X-Forwarded-For.
+    Compartido por get_client_ip_from_request y el middleware ASGI.
+    """
+    # Solo confiar XFF cuando el remote es uno de tus proxies
+    if settings.trust_x_forwarded_for and xff and _is_trusted_proxy(remote):
+        return xff.split(",")[0].strip()
+    return remote or "unknown"
+
+
 def get_client_ip_from_request(request) -> str:
     """
     IP del cliente final (no del proxy), si hay proxy de confianza.
     """
-    # Si tienes trusted_proxy_cidrs, solo confiar XFF cuando el remote es uno de tus proxies
-    if settings.trusted_proxy_cidrs:
-        try:
-            remote = request.client.host if request.client else ""
-            remote_ip = ipaddress.ip_address(remote)
-            ok = any(remote_ip in ipaddress.ip_network(c, strict=False) for c in settings.trusted_proxy_cidrs)
-        except Exception:
-            ok = False
-    else:
-        ok = True
-
-    if settings.trust_x_forwarded_for and ok:
-        xff = request.headers.get("x-forwarded-for")
-        if xff:
-            return xff.split(",")[0].strip()
-
-    if request.client:
-        return request.client.host
-    return "unknown"
+    remote = request.client.host if request.client else None
+    return client_ip_from(remote, request.headers.get("x-forwarded-for"))
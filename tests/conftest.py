@@ -1 +1,105 @@
+# tests/conftest.py
 
+"""
+Entorno de tests: BD sqlite temporal y presupuestos de consultas estrictos
+(QUERY_BUDGET_STRICT=true), así que un endpoint que se pasa de su @budget
+hace fallar el test con QueryBudgetExceeded.
+
+config.settings se congela al importarse: el entorno tiene que estar puesto
+antes de importar cualquier módulo del repo.
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="shortener-tests-")
+ROOT_KEY = "test-root-key"
+# rango de documentación (TEST-NET-3) en la app_denylist de los tests
+DENIED_NET = "203.0.113.0/24"
+TRACE_TOKEN = "test-trace-token"
+METRICS_TOKEN = "test-metrics-token"
+
+# listas de política propias de los tests (las de list/ no se tocan)
+for _name in ("app_allowlist", "app_denylist", "target_allowlist", "target_denylist"):
+    Path(_TMP, f"{_name}.txt").write_text(DENIED_NET + "\n" if _name == "app_denylist" else "")
+
+os.environ.update(
+    {
+        "DB_URL": f"sqlite:///{_TMP}/test.db",
+        "QUERY_BUDGET_STRICT": "true",
+        "RESOLVE_DNS": "false",
+        "GEOIP_ENABLED": "false",
+        "REVALIDATION_ENABLED": "false",
+        "RATE_LIMIT_MAX_REQUESTS": "1000000",
+        "LOG_SAMPLE_RATES": "redirect=0",
+        "ROOT_ADMIN_KEY": ROOT_KEY,
+        "APP_ALLOWLIST_PATH": f"{_TMP}/app_allowlist.txt",
+        "APP_DENYLIST_PATH": f"{_TMP}/app_denylist.txt",
+        "TARGET_ALLOWLIST_PATH": f"{_TMP}/target_allowlist.txt",
+        "TARGET_DENYLIST_PATH": f"{_TMP}/target_denylist.txt",
+        "POLICY_SNAPSHOT_PATH": "",
+        # los cambios de listas se ven en el siguiente request
+        "POLICY_RELOAD_CHECK_SECONDS": "0",
+        "TRACE_TOKEN": TRACE_TOKEN,
+        "METRICS_TOKEN": METRICS_TOKEN,
+    }
+)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def api_headers(client):
+    """Tenant nuevo por test (sus urls no se mezclan con las de otros tests)."""
+    r = client.post("/api/bootstrap", json={"name": f"t-{uuid.uuid4().hex[:8]}"}, headers={"x-root-key": ROOT_KEY})
+    assert r.status_code == 200, r.text
+    return {"x-api-key": r.json()["api_key"]}
+
+
+@pytest.fixture
+def admin_headers():
+    from enterprise_admin_auth import create_admin_token
+
+    return {"authorization": f"Bearer {create_admin_token(subject='test-admin')}"}
+
+
+@pytest.fixture
+def make_url(client, api_headers):
+    def _make(target: str = "https://example.com/page") -> str:
+        r = client.post("/api/urls", json={"target_url": target}, headers=api_headers)
+        assert r.status_code == 200, r.text
+        return r.json()["url"].rsplit("/", 1)[1]
+
+    return _make
+
+
+@pytest.fixture
+def target_denylist():
+    """Escribe la target_denylist de los tests; se vacía al terminar."""
+    path = Path(os.environ["TARGET_DENYLIST_PATH"])
+    bumps = [0]
+
+    def _write(*entries: str) -> None:
+        path.write_text("".join(f"{e}\n" for e in entries))
+        # mtime distinto aunque se escriba dos veces en el mismo instante
+        bumps[0] += 1
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + bumps[0] * 1_000_000))
+
+    yield _write
+    _write()
@@ -0,0 +1,152 @@
+# tests/test_caches.py
+
+"""Endpoints /admin/caches (auditados) y el handle de las listas de política."""
+
+import dataclasses
+
+import pytest
+from sqlalchemy import select
+
+import caches
+import policy_lists
+import target_validation
+from database import SessionLocal
+from enterprise_models import AuditLog
+from policy_snapshot import build_snapshot
+
+
+@pytest.fixture
+def test_cache():
+    cache = caches.LRUCache(10)
+    handle = caches.register(caches.LRUHandle("test_cache", cache, "solo tests", key_from_str=int))
+    yield cache
+    caches._registry.pop(handle.name, None)
+
+
+def _audits(action: str) -> list[AuditLog]:
+    db = SessionLocal()
+    try:
+        q = select(AuditLog).where(AuditLog.action == action, AuditLog.target_id == "test_cache")
+        return list(db.execute(q.order_by(AuditLog.id)).scalars())
+    finally:
+        db.close()
+
+
+def test_cache_endpoints_require_admin(client, test_cache):
+    assert client.get("/admin/caches").status_code == 401
+    assert client.post("/admin/caches/test_cache/purge").status_code == 401
+
+
+def test_purge_resize_and_invalidate_are_audited(client, admin_headers, test_cache):
+    for i in range(5):
+        test_cache.set(i, str(i))
+    listed = {c["name"]: c for c in client.get("/admin/caches", headers=admin_headers).json()}
+    assert listed["test_cache"]["entries"] == 5
+    assert listed["test_cache"]["resizable"] and listed["test_cache"]["invalidatable"]
+
+    # la clave llega como texto y se convierte con key_from_str
+    r = client.delete("/admin/caches/test_cache/keys/3", headers=admin_headers)
+    assert r.json() == {"name": "test_cache", "key": "3", "invalidated": True}
+    assert test_cache.get(3) is None
+    assert client.delete("/admin/caches/test_cache/keys/x", headers=admin_headers).status_code == 400
+
+    r = client.patch("/admin/caches/test_cache", json={"maxsize": 2}, headers=admin_headers)
+    assert r.status_code == 200 and r.json()["maxsize"] == 2
+    assert len(test_cache) == 2
+
+    r = client.post("/admin/caches/test_cache/purge", headers=admin_headers)
+    assert r.json() == {"name": "test_cache", "purged": 2}
+    assert len(test_cache) == 0
+
+    (invalidate,) = _audits("cache.invalidate")
+    assert invalidate.after == {"key": "3", "invalidated": True}
+    assert invalidate.actor_subject == "test-admin" and invalidate.target_type == "cache"
+    (resize,) = _audits("cache.resize")
+    assert resize.after == {"maxsize_before": 10, "maxsize": 2}
+    (purge,) = _audits("cache.purge")
+    assert purge.after == {"purged": 2}
+
+
+def test_unknown_and_unsupported_operations(client, admin_headers):
+    assert client.post("/admin/caches/nope/purge", headers=admin_headers).status_code == 404
+    # functools.lru_cache: tamaño fijo al decorar
+    r = client.patch("/admin/caches/normalize_host", json={"maxsize": 5}, headers=admin_headers)
+    assert r.status_code == 400
+
+
+def test_lists_manager_clear_and_drop(tmp_path):
+    deny = tmp_path / "deny.txt"
+    deny.write_text("blocked.example\n")
+    other = tmp_path / "other.txt"
+    other.write_text("10.0.0.0/8\n")
+
+    mgr = policy_lists.ListsManager()
+    mgr.load(str(deny))
+    mgr.load(str(other))
+    version = mgr.version
+
+    assert mgr.drop(str(other)) is True
+    assert mgr.drop(str(other)) is False
+    assert mgr.version == version + 1
+    assert list(mgr.active()) == [str(deny)]
+
+    assert mgr.clear() == 1
+    assert mgr.active() == {} and mgr.version == version + 2
+
+
+def test_drop_from_snapshot_releases_it(tmp_path, monkeypatch):
+    deny = tmp_path / "deny.txt"
+    deny.write_text("blocked.example\n")
+    other = tmp_path / "other.txt"
+    other.write_text("allowed.example\n")
+    snap_path = tmp_path / "policy.snap"
+    build_snapshot([str(deny), str(other)], str(snap_path))
+    monkeypatch.setattr(
+        policy_lists, "settings", dataclasses.replace(policy_lists.settings, policy_snapshot_path=str(snap_path))
+    )
+
+    mgr = policy_lists.ListsManager()
+    assert "blocked.example" in mgr.load(str(deny)).domain_exact
+    assert mgr._snapshot is not None
+    assert set(mgr.active()) == {str(deny), str(other)}
+
+    # no se puede soltar una lista suelta del snapshot: se suelta entero
+    version = mgr.version
+    assert mgr.drop(str(deny)) is True
+    assert mgr._snapshot is None and mgr.version == version + 1
+    assert mgr.active() == {}
+
+    # el siguiente uso lo vuelve a abrir
+    mgr.load(str(other))
+    assert mgr._snapshot is not None
+
+
+def test_purging_policy_lists_forces_generation_recheck(client, admin_headers, monkeypatch):
+    # sin re-comprobación periódica: solo un cambio de lists_version obliga a recalcular
+    monkeypatch.setattr(
+        target_validation,
+        "settings",
+        dataclasses.replace(target_validation.settings, policy_reload_check_seconds=3600),
+    )
+    monkeypatch.setattr(target_validation, "_generation_next_check", 0.0)
+    calls = []
+    real = target_validation.target_policy_generation
+
+    def counting():
+        calls.append(1)
+        return real()
+
+    monkeypatch.setattr(target_validation, "target_policy_generation", counting)
+
+    generation = target_validation.current_target_generation()
+    target_validation.current_target_generation()
+    assert len(calls) == 1
+
+    version = policy_lists.lists_version()
+    r = client.post("/admin/caches/policy_lists/purge", headers=admin_headers)
+    assert r.status_code == 200
+    assert policy_lists.lists_version() > version
+
+    # mismas listas en disco: se recalcula y sale la misma generación
+    assert target_validation.current_target_generation() == generation
+    assert len(calls) == 2
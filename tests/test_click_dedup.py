@@ -0,0 +1,58 @@
+# tests/test_click_dedup.py
+
+"""Filtros de Bloom y deduplicación de clicks por ventana (click_dedup.py)."""
+
+import random
+
+from click_dedup import BloomFilter, ClickDeduper
+
+
+def _hashes(n: int, seed: int) -> list[int]:
+    rnd = random.Random(seed)
+    return [rnd.getrandbits(64) for _ in range(n)]
+
+
+def test_bloom_has_no_false_negatives():
+    bloom = BloomFilter(1 << 14, 4)
+    items = _hashes(1000, seed=5)
+    for h in items:
+        bloom.add(bloom._positions(h, h >> 1 | 1))
+    assert all(bloom.contains(bloom._positions(h, h >> 1 | 1)) for h in items)
+    assert bloom.count == 1000
+    assert 0 < bloom.fill_ratio() < 1
+    bloom.clear()
+    assert bloom.fill_ratio() == 0 and bloom.count == 0
+
+
+def _deduper() -> ClickDeduper:
+    return ClickDeduper(bucket_seconds=10, buckets=7, bloom_bits=1 << 14, hashes=4)
+
+
+def test_deduper_window():
+    d = _deduper()
+    t0 = 1_000_000.0
+    assert d.seen(1, "visitor", 60, now=t0) is False
+    assert d.seen(1, "visitor", 60, now=t0 + 30) is True
+    # otro link u otro visitante no son repetición
+    assert d.seen(2, "visitor", 60, now=t0 + 30) is False
+    assert d.seen(1, "other", 60, now=t0 + 30) is False
+    # pasada la ventana (redondeada al intervalo) vuelve a contar
+    assert d.seen(1, "visitor", 60, now=t0 + 80) is False
+    assert d.checked == 5 and d.repeats == 1
+
+
+def test_deduper_window_is_capped_by_ring():
+    d = _deduper()
+    assert d.max_window_seconds == 60
+    t0 = 1_000_000.0
+    d.seen(1, "visitor", 3600, now=t0)
+    # el filtro de t0 se reutiliza al dar la vuelta al anillo
+    assert d.seen(1, "visitor", 3600, now=t0 + 70) is False
+
+
+def test_deduper_false_positive_rate_is_low():
+    d = _deduper()
+    t0 = 1_000_000.0
+    repeats = sum(d.seen(1, f"v{i}", 60, now=t0) for i in range(1000))
+    assert repeats <= 5
+    assert d.stats(now=t0)["est_false_positive_rate"] < 0.01
@@ -0,0 +1,101 @@
+# tests/test_click_events.py
+
+"""Buffer acotado de clicks (muestreo y descartes) y escritor por lotes."""
+
+from sqlalchemy import func, select
+
+import click_events
+import click_stats
+import models
+from database import SessionLocal
+
+
+def _url_id(key: str) -> int:
+    db = SessionLocal()
+    try:
+        return db.execute(select(models.URL.id).where(models.URL.key == key)).scalar_one()
+    finally:
+        db.close()
+
+
+def _weights(buffer) -> list[int]:
+    return [event[-1] for event in buffer.drain(1000)]
+
+
+def test_sampling_above_soft_limit_writes_weight():
+    # capacidad 8 => muestreo desde 6 encolados
+    buf = click_events.ClickBuffer(8, overflow_policy="sample", sample_rate=3)
+    accepted = [buf.push(1, None, None, None) for _ in range(12)]
+
+    # 6 normales; después solo 1 de cada 3, con weight=3
+    assert accepted == [True] * 6 + [False, False, True] * 2
+    assert buf.stats.pushed == 8
+    assert buf.stats.sampled_out == 4
+    assert buf.stats.dropped == 0
+    assert _weights(buf) == [1] * 6 + [3, 3]
+
+
+def test_full_buffer_drops():
+    buf = click_events.ClickBuffer(8, overflow_policy="sample", sample_rate=1)
+    for _ in range(8):
+        assert buf.push(1, None, None, None)
+    assert buf.push(1, None, None, None) is False
+    assert buf.stats.dropped == 1 and len(buf) == 8
+
+
+def test_drop_policy_accepts_until_full():
+    buf = click_events.ClickBuffer(8, overflow_policy="drop", sample_rate=3)
+    accepted = [buf.push(1, None, None, None) for _ in range(10)]
+    assert accepted == [True] * 8 + [False, False]
+    assert buf.stats.sampled_out == 0 and buf.stats.dropped == 2
+    assert _weights(buf) == [1] * 8
+
+
+def _count(db, model, url_id: int, column) -> int:
+    return db.execute(select(func.coalesce(func.sum(column), 0)).where(model.url_id == url_id)).scalar_one()
+
+
+def test_writer_commits_events_with_rollups(client, make_url):
+    url_id = _url_id(make_url())
+    buf = click_events.ClickBuffer(100, sample_rate=4)
+    ts = 1_700_000_000.0
+    for i in range(5):
+        buf.push(url_id, "ES", "human", "news.example", ts=ts + i)
+    buf._items.append((url_id, ts, "ES", "human", None, 4))  # un evento muestreado
+
+    writer = click_events.ClickEventWriter(buf, batch_size=2)
+    assert writer.flush() == 6
+    assert buf.stats.batches == 3 and buf.stats.written == 6
+
+    db = SessionLocal()
+    try:
+        R = models.ClickRollup
+        assert _count(db, models.ClickEvent, url_id, models.ClickEvent.weight) == 9
+        for code in ("m", "h", "d"):
+            clicks = db.execute(
+                select(func.sum(R.clicks)).where(R.url_id == url_id, R.granularity == code)
+            ).scalar_one()
+            assert clicks == 9, code
+    finally:
+        db.close()
+
+
+def test_failed_rollup_rolls_back_events(client, make_url, monkeypatch):
+    url_id = _url_id(make_url())
+    buf = click_events.ClickBuffer(100)
+    buf.push(url_id, None, "human", None)
+
+    def broken(db, events):
+        raise RuntimeError("rollup upsert failed")
+
+    monkeypatch.setattr(click_stats, "apply_batch", broken)
+    assert click_events.ClickEventWriter(buf).flush() == 0
+    assert buf.stats.write_errors == 1
+
+    # el insert de eventos iba en la misma transacción: no queda nada
+    db = SessionLocal()
+    try:
+        n = db.execute(select(func.count()).where(models.ClickEvent.url_id == url_id)).scalar_one()
+        assert n == 0
+    finally:
+        db.close()
@@ -0,0 +1,102 @@
+# tests/test_click_stats.py
+
+"""Rollups incrementales (upsert por bucket) y consultas de /stats sobre SQLite."""
+
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+import click_stats
+import models
+from database import SessionLocal
+
+
+def _url_id(key: str) -> int:
+    db = SessionLocal()
+    try:
+        return db.execute(select(models.URL.id).where(models.URL.key == key)).scalar_one()
+    finally:
+        db.close()
+
+
+def _ts(*args) -> float:
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def test_batches_for_same_bucket_add_up(client, make_url):
+    url_id = _url_id(make_url())
+    t = _ts(2023, 11, 14, 10, 17, 45)
+    db = SessionLocal()
+    try:
+        click_stats.apply_batch(db, [(url_id, t, "ES", "human", "a.example", 1), (url_id, t + 5, "FR", "human", None, 2)])
+        db.commit()
+        click_stats.apply_batch(db, [(url_id, t + 10, "ES", "human", "a.example", 4)])
+        db.commit()
+
+        R = models.ClickRollup
+        rows = db.execute(
+            select(R.granularity, R.bucket, R.clicks).where(R.url_id == url_id).order_by(R.granularity)
+        ).all()
+        # una fila por granularidad: el segundo lote suma en las mismas
+        assert rows == [
+            ("d", datetime(2023, 11, 14), 7),
+            ("h", datetime(2023, 11, 14, 10), 7),
+            ("m", datetime(2023, 11, 14, 10, 17), 7),
+        ]
+
+        D = models.ClickRollupDim
+        dims = db.execute(
+            select(D.dim, D.value, D.clicks).where(D.url_id == url_id).order_by(D.dim, D.value)
+        ).all()
+        assert dims == [
+            ("country", "ES", 5),
+            ("country", "FR", 2),
+            ("referrer", "", 2),
+            ("referrer", "a.example", 5),
+        ]
+    finally:
+        db.close()
+
+
+def test_get_stats_series_and_breakdown_range(client, make_url):
+    url_id = _url_id(make_url())
+    db = SessionLocal()
+    try:
+        click_stats.apply_batch(
+            db,
+            [
+                (url_id, _ts(2023, 11, 14, 9, 59), "ES", "human", None, 1),
+                (url_id, _ts(2023, 11, 14, 10, 5), "ES", "human", None, 2),
+                (url_id, _ts(2023, 11, 14, 12, 0), "FR", "human", None, 4),
+                (url_id, _ts(2023, 11, 15, 3, 0), "FR", "human", None, 10),
+            ],
+        )
+        db.commit()
+
+        stats = click_stats.get_stats(
+            db, url_id, granularity="hour", start=datetime(2023, 11, 14, 10, 30), end=datetime(2023, 11, 14, 13, 0)
+        )
+        # la serie empieza en el bucket que contiene start
+        assert stats["series"] == [
+            {"bucket": datetime(2023, 11, 14, 10), "clicks": 2},
+            {"bucket": datetime(2023, 11, 14, 12), "clicks": 4},
+        ]
+        assert stats["total"] == 6
+        # los desgloses cubren el día completo que toca el rango
+        assert stats["breakdown_start"] == datetime(2023, 11, 14)
+        assert stats["breakdown_end"] == datetime(2023, 11, 15)
+        assert stats["countries"] == [{"value": "FR", "clicks": 4}, {"value": "ES", "clicks": 3}]
+
+        # end a medianoche (y con tzinfo): no arrastra el día siguiente
+        stats = click_stats.get_stats(
+            db,
+            url_id,
+            granularity="day",
+            start=datetime(2023, 11, 14, 11, 0, tzinfo=timezone.utc),
+            end=datetime(2023, 11, 15, 0, 0, tzinfo=timezone.utc),
+        )
+        assert stats["breakdown_start"] == datetime(2023, 11, 14)
+        assert stats["breakdown_end"] == datetime(2023, 11, 15)
+        assert stats["series"] == [{"bucket": datetime(2023, 11, 14), "clicks": 7}]
+    finally:
+        db.close()
@@ -0,0 +1,101 @@
+# tests/test_client_gate.py
+
+"""ClientIPGateMiddleware contra la app_denylist de los tests (DENIED_NET)."""
+
+import asyncio
+import dataclasses
+
+from fastapi.testclient import TestClient
+
+import client_gate
+import target_validation
+from conftest import TRACE_TOKEN
+from config import settings
+
+
+DENIED_IP = "203.0.113.7"
+ALLOWED_IP = "198.51.100.7"
+
+
+async def _inner(scope, receive, send):
+    # app mínima: 200 para http, accept para websocket
+    if scope["type"] == "websocket":
+        await send({"type": "websocket.accept"})
+        return
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _call(app, scope_type: str, client_ip: str, headers=()) -> list[dict]:
+    scope = {
+        "type": scope_type,
+        "path": "/",
+        "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+        "client": (client_ip, 50000),
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "websocket.connect"} if scope_type == "websocket" else {"type": "http.request"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def _trusting_xff(monkeypatch):
+    # settings es inmutable: se sustituye en los módulos que lo leen
+    trusting = dataclasses.replace(settings, trust_x_forwarded_for=True, trusted_proxy_cidrs=())
+    monkeypatch.setattr(client_gate, "settings", trusting)
+    monkeypatch.setattr(target_validation, "settings", trusting)
+
+
+def test_denied_ip_gets_precomputed_403():
+    sent = _call(client_gate.ClientIPGateMiddleware(_inner), "http", DENIED_IP)
+    assert sent[0]["status"] == 403
+    assert dict(sent[0]["headers"])[b"content-type"] == b"application/json"
+    assert sent[1]["body"] == b'{"detail":"Forbidden"}'
+
+    sent = _call(client_gate.ClientIPGateMiddleware(_inner), "http", ALLOWED_IP)
+    assert sent[0]["status"] == 200
+
+
+def test_denied_websocket_is_closed_with_1008():
+    sent = _call(client_gate.ClientIPGateMiddleware(_inner), "websocket", DENIED_IP)
+    assert sent == [{"type": "websocket.close", "code": 1008}]
+
+    sent = _call(client_gate.ClientIPGateMiddleware(_inner), "websocket", ALLOWED_IP)
+    assert sent == [{"type": "websocket.accept"}]
+
+
+def test_x_forwarded_for_ignored_unless_trusted(monkeypatch):
+    headers = [("x-forwarded-for", f"{DENIED_IP}, 10.0.0.1")]
+    assert not settings.trust_x_forwarded_for
+    sent = _call(client_gate.ClientIPGateMiddleware(_inner), "http", ALLOWED_IP, headers)
+    assert sent[0]["status"] == 200
+
+    # un XFF falso no libra a una IP bloqueada
+    sent = _call(client_gate.ClientIPGateMiddleware(_inner), "http", DENIED_IP, [("x-forwarded-for", ALLOWED_IP)])
+    assert sent[0]["status"] == 403
+
+    _trusting_xff(monkeypatch)
+    sent = _call(client_gate.ClientIPGateMiddleware(_inner), "http", ALLOWED_IP, headers)
+    assert sent[0]["status"] == 403
+
+
+def test_gate_runs_before_other_middlewares(client):
+    import main
+
+    trace = {settings.trace_header: TRACE_TOKEN}
+    allowed = TestClient(main.app, client=(ALLOWED_IP, 50000))
+    r = allowed.get("/does-not-exist", headers=trace)
+    assert "server-timing" in r.headers
+
+    # el rechazo sale antes de tracing, métricas y contabilidad de consultas
+    denied = TestClient(main.app, client=(DENIED_IP, 50000))
+    r = denied.get("/does-not-exist", headers=trace)
+    assert r.status_code == 403
+    assert r.json() == {"detail": "Forbidden"}
+    assert "server-timing" not in r.headers
@@ -0,0 +1,137 @@
+# tests/test_hll.py
+
+"""Sketches HyperLogLog de visitantes únicos (hll.py)."""
+
+import random
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+import hll
+import metrics
+import models
+from database import SessionLocal
+
+
+def _hashes(n: int, seed: int) -> list[int]:
+    rnd = random.Random(seed)
+    return [rnd.getrandbits(64) for _ in range(n)]
+
+
+def _registers(hashes) -> bytearray:
+    regs = hll.new_registers()
+    for h in hashes:
+        hll.add_hash(regs, h)
+    return regs
+
+
+def test_hll_estimate_within_error():
+    for n in (50, 1000, 20000):
+        est = hll.estimate(_registers(_hashes(n, seed=n)))
+        # 4 desviaciones típicas
+        assert abs(est - n) <= max(2, 4 * hll.RELATIVE_ERROR * n), (n, est)
+
+
+def test_hll_repeats_do_not_count():
+    hashes = _hashes(1000, seed=1)
+    assert _registers(hashes * 3) == _registers(hashes)
+
+
+def test_hll_merge_is_union():
+    universe = _hashes(10000, seed=2)
+    a, b = universe[:6000], universe[4000:]
+    merged = _registers(a)
+    hll.merge_into(merged, _registers(b))
+    # el merge es exacto: igual que el sketch de la unión
+    assert merged == _registers(universe)
+    assert abs(hll.estimate(merged) - 10000) <= 4 * hll.RELATIVE_ERROR * 10000
+
+
+def test_hll_merge_idempotent_and_commutative():
+    ra, rb = _registers(_hashes(500, seed=3)), _registers(_hashes(700, seed=4))
+    ab = bytearray(ra)
+    hll.merge_into(ab, rb)
+    ba = bytearray(rb)
+    hll.merge_into(ba, ra)
+    assert ab == ba
+    again = bytearray(ab)
+    hll.merge_into(again, rb)
+    assert again == ab
+
+
+# -------------------------
+# SketchStore
+# -------------------------
+
+def _dropped(reason: str) -> float:
+    prefix = f'hll_dropped_total{{reason="{reason}"}} '
+    for line in metrics.render().splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0.0
+
+
+def test_store_persists_and_reads_back(client, make_url):
+    db = SessionLocal()
+    try:
+        url_id = db.execute(select(models.URL.id).where(models.URL.key == make_url())).scalar_one()
+        store = hll.SketchStore()
+        for i in range(300):
+            store.record(url_id, f"10.0.{i // 256}.{i % 256}", "ua")
+        assert store.persist() == 2
+        assert store._pending == {}
+        # otro worker (otro store) ve lo volcado
+        est = hll.SketchStore().estimates(db, url_id, [hll.ALL_TIME])[hll.ALL_TIME]
+        assert abs(est - 300) <= 4 * hll.RELATIVE_ERROR * 300
+    finally:
+        db.close()
+
+
+def test_store_caps_pending_sketches():
+    store = hll.SketchStore(max_pending=4)
+    before = _dropped("full")
+    for url_id in (1, 2, 3):
+        store.record(url_id, "10.0.0.1", "ua")
+    # dos sketches por link (total + día): el tercero no cabe
+    assert len(store._pending) == 4
+    assert {url_id for url_id, _ in store._pending} == {1, 2}
+    assert _dropped("full") - before == 2
+    # lleno a partir de la mitad: el volcado se adelanta
+    assert store._flush_now.is_set()
+    # los sketches que ya existen siguen sumando visitas
+    store.record(1, "10.0.0.2", "ua")
+    assert hll.estimate(store._pending[(1, hll.ALL_TIME)]) == 2
+
+
+class _DownSession:
+    """Sesión contra una BD caída; mientras tanto siguen llegando visitas."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def execute(self, *args, **kwargs):
+        for url_id in (10, 11, 12):
+            self.store.record(url_id, "10.0.0.1", "ua")
+        raise OperationalError("SELECT", {}, Exception("database is down"))
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_failed_persist_merges_back_within_cap():
+    store = hll.SketchStore(max_pending=4)
+    store.session_factory = lambda: _DownSession(store)
+    for url_id in (1, 2):
+        store.record(url_id, "10.0.0.1", "ua")
+    before = _dropped("persist_failed")
+
+    with pytest.raises(OperationalError):
+        store.persist()
+    # las visitas nuevas ocuparon el hueco: los 4 sketches del volcado
+    # fallido ya no caben, se descartan y se cuentan
+    assert {url_id for url_id, _ in store._pending} == {10, 11}
+    assert _dropped("persist_failed") - before == 4
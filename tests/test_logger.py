@@ -0,0 +1,37 @@
+# tests/test_logger.py
+
+"""Logging sin bloqueo: cola acotada con descartes y muestreo por evento."""
+
+import logging
+import queue
+
+import logger
+
+
+def _record(msg: str) -> logging.LogRecord:
+    return logging.LogRecord("shortener", logging.INFO, __file__, 1, msg, None, None)
+
+
+def test_full_queue_drops_and_counts():
+    handler = logger.DroppingQueueHandler(queue.Queue(maxsize=2))
+    for i in range(5):
+        handler.handle(_record(f"line {i}"))
+    # nunca bloquea: lo que no cabe se descarta
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    assert [handler.queue.get_nowait().msg for _ in range(2)] == ["line 0", "line 1"]
+
+
+def test_prepare_formats_message_in_caller_thread():
+    handler = logger.DroppingQueueHandler(queue.Queue(maxsize=1))
+    record = logging.LogRecord("shortener", logging.INFO, __file__, 1, "hola %s", ("mundo",), None)
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "hola mundo" and queued.args is None
+
+
+def test_sampled_out_events_are_counted(monkeypatch):
+    monkeypatch.setitem(logger._sample_rates, "test_event", 0.0)
+    before = logger.stats()["sampled_out"].get("test_event", 0)
+    logger.log_event("test_event", key="abc")
+    assert logger.stats()["sampled_out"]["test_event"] == before + 1
@@ -0,0 +1,51 @@
+# tests/test_metrics.py
+
+"""GET /metrics (nunca público) y suma de las particiones por hilo."""
+
+import threading
+
+import metrics
+from conftest import METRICS_TOKEN
+
+
+def _value(text: str, series: str) -> float:
+    for line in text.splitlines():
+        name, _, value = line.rpartition(" ")
+        if name == series:
+            return float(value)
+    return 0.0
+
+
+def test_metrics_requires_token(client):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"authorization": METRICS_TOKEN}).status_code == 401
+    assert client.get("/metrics", headers={"authorization": "Bearer wrong"}).status_code == 401
+
+
+def test_metrics_accepts_scraper_token_or_admin(client, admin_headers):
+    r = client.get("/metrics", headers={"authorization": f"Bearer {METRICS_TOKEN}"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert "# TYPE http_request_duration_seconds histogram" in r.text
+
+    assert client.get("/metrics", headers=admin_headers).status_code == 200
+
+
+def test_render_sums_thread_shards():
+    metric = metrics.counter("test_shards_total", "Test", ("kind",))
+    series = 'test_shards_total{kind="a"}'
+    before = _value(metrics.render(), series)
+
+    def work():
+        for _ in range(1000):
+            metrics.inc(metric, ("a",))
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    metrics.inc(metric, ("a",), 5)
+
+    # los hilos ya terminaron: sus particiones siguen sumando
+    assert _value(metrics.render(), series) == before + 4005
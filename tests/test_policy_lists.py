@@ -0,0 +1,24 @@
+# tests/test_policy_lists.py
+
+"""IPRangeSet: rangos fusionados y ordenados, lookup con bisect."""
+
+import pytest
+
+from policy_lists import IPRangeSet
+
+
+@pytest.mark.parametrize("typecode", [None, "Q"])
+def test_ranges_merge_overlapping_and_contiguous(typecode):
+    s = IPRangeSet([(20, 30), (0, 10), (11, 15), (25, 40), (50, 50)], typecode=typecode)
+    assert list(s.starts) == [0, 20, 50]
+    assert list(s.ends) == [15, 40, 50]
+    assert len(s) == 3
+
+
+@pytest.mark.parametrize("typecode", [None, "Q"])
+def test_contains_boundaries(typecode):
+    s = IPRangeSet([(10, 20), (30, 30)], typecode=typecode)
+    assert [s.contains(x) for x in (9, 10, 15, 20, 21, 29, 30, 31)] == [
+        False, True, True, True, False, False, True, False,
+    ]
+    assert not IPRangeSet(typecode=typecode).contains(0)
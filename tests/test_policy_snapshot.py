@@ -0,0 +1,54 @@
+# tests/test_policy_snapshot.py
+
+"""Snapshot mmap de las listas compiladas: mismas respuestas que _compile_file."""
+
+from policy_lists import _compile_file, ip_to_int
+from policy_snapshot import _U128View, build_snapshot, open_snapshot
+
+
+def _ip(ip: str) -> int:
+    return ip_to_int(ip)[1]
+
+
+def test_u128_view_combines_halves():
+    view = _U128View([0, 1, 2**64 - 1], [5, 0, 2**64 - 1])
+    assert len(view) == 3
+    assert [view[i] for i in range(3)] == [5, 2**64, 2**128 - 1]
+
+
+def test_snapshot_matches_compiled_lists(tmp_path):
+    lst = tmp_path / "deny.txt"
+    lst.write_text(
+        "\n".join(
+            [
+                "10.0.0.0/8",
+                "192.168.1.7",
+                "2001:db8::/32",
+                # /63: dos valores de la mitad alta de 64 bits
+                "2001:db9::/63",
+                "ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff",
+            ]
+        )
+    )
+    out = tmp_path / "policy.snap"
+    build_snapshot([str(lst)], str(out))
+    snap = open_snapshot(str(out)).get(str(lst))
+    compiled = _compile_file(str(lst))
+    assert isinstance(snap.ipv6.starts, _U128View)
+
+    probes = [
+        "9.255.255.255", "10.0.0.0", "10.255.255.255", "11.0.0.0",
+        "192.168.1.6", "192.168.1.7", "192.168.1.8",
+        "2001:db7:ffff:ffff:ffff:ffff:ffff:ffff", "2001:db8::", "2001:db8:ffff:ffff:ffff:ffff:ffff:ffff",
+        "2001:db9::", "2001:db9:0:0:ffff:ffff:ffff:ffff", "2001:db9:0:1::",
+        "2001:db9:0:1:ffff:ffff:ffff:ffff", "2001:db9:0:2::",
+        "ffff:ffff:ffff:ffff:ffff:ffff:ffff:fffe", "ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff", "::",
+    ]
+    for probe in probes:
+        version, value = ip_to_int(probe)
+        expected = compiled.ranges_for(version).contains(value)
+        assert snap.ranges_for(version).contains(value) == expected, probe
+
+    assert snap.ipv4.contains(_ip("10.1.2.3"))
+    assert snap.ipv6.contains(_ip("2001:db9:0:1:ffff:ffff:ffff:ffff"))
+    assert not snap.ipv6.contains(_ip("2001:db9:0:2::"))
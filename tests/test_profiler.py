@@ -0,0 +1,56 @@
+# tests/test_profiler.py
+
+"""Profiler bajo demanda: una captura a la vez y pilas etiquetadas por hilo."""
+
+import threading
+import time
+
+import pytest
+
+import profiler
+
+
+def _wait_until(cond, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_second_concurrent_capture_is_rejected(client, admin_headers):
+    first = threading.Thread(target=profiler.profile, args=([],), kwargs={"seconds": 0.5}, daemon=True)
+    first.start()
+    try:
+        _wait_until(profiler.is_running)
+        with pytest.raises(profiler.ProfilerBusy):
+            profiler.profile([], seconds=0.01)
+        r = client.post("/admin/profile?seconds=0.01", headers=admin_headers)
+        assert r.status_code == 409
+    finally:
+        first.join()
+
+    # terminada la primera, se puede volver a capturar
+    assert not profiler.is_running()
+    r = client.post("/admin/profile?seconds=0.05&format=json&include_idle=true", headers=admin_headers)
+    assert r.status_code == 200
+    assert r.json()["samples"] > 0
+
+
+def test_busy_thread_is_tagged_by_name():
+    stop = threading.Event()
+
+    def spin():
+        while not stop.is_set():
+            sum(range(100))
+
+    worker = threading.Thread(target=spin, name="test-spinner", daemon=True)
+    worker.start()
+    try:
+        capture, elapsed = profiler.profile([], seconds=0.1, interval_ms=1)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert elapsed >= 0.1
+    assert capture.by_route["thread:test-spinner"] > 0
+    assert any(line.startswith("thread:test-spinner;") for line in capture.collapsed().splitlines())
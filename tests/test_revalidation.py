@@ -0,0 +1,89 @@
+# tests/test_revalidation.py
+
+"""Barrido de revalidación: veredictos escritos en background, lease y DNS caído."""
+
+import crud
+import main
+import models
+import revalidation
+from database import SessionLocal
+from dns_cache import DNSUnavailable
+
+
+def _sweeper() -> revalidation.RevalidationSweeper:
+    # lotes pequeños para pasar por el keyset varias veces
+    return revalidation.RevalidationSweeper(batch_size=2, max_rows_per_second=0, dns_concurrency=2)
+
+
+def _row(key: str) -> models.URL:
+    db = SessionLocal()
+    try:
+        return db.query(models.URL).filter(models.URL.key == key).one()
+    finally:
+        db.close()
+
+
+def test_sweep_blocks_newly_denylisted_host(client, make_url, target_denylist, monkeypatch):
+    keys = [make_url(f"https://sweep-{i}.example/") for i in range(3)]
+    target_denylist("sweep-1.example")
+
+    stats = _sweeper().run_once(force=True)
+    assert stats.leader and not stats.running
+    assert stats.newly_blocked >= 1
+
+    # el keyset recorre todas las filas activas, lote a lote
+    assert stats.scanned == stats.total_estimate >= 3
+
+    blocked = _row(keys[1])
+    assert blocked.verdict_ok is False and blocked.blocked_at is not None
+    assert _row(keys[0]).verdict_ok is True
+
+    # el redirect sirve el 410 desde la fila, sin revalidar en línea
+    def no_inline_validation(*args, **kwargs):
+        raise AssertionError("redirect revalidated a verdict written by the sweep")
+
+    monkeypatch.setattr(main, "evaluate_target_url", no_inline_validation)
+    assert client.get(f"/{keys[1]}", follow_redirects=False).status_code == 410
+    assert client.get(f"/{keys[0]}", follow_redirects=False).status_code == 307
+
+
+def test_worker_without_lease_does_nothing(client, make_url, target_denylist):
+    key = make_url("https://not-swept.example/")
+    target_denylist("not-swept.example")
+
+    db = SessionLocal()
+    try:
+        assert crud.acquire_lease(db, revalidation.LEASE_NAME, "other-host:1", 60)
+        stats = _sweeper().run_once(force=True)
+        assert stats.leader is False
+        assert stats.scanned == 0
+        assert _row(key).verdict_ok is True and _row(key).blocked_at is None
+    finally:
+        crud.release_lease(db, revalidation.LEASE_NAME, "other-host:1")
+        db.close()
+
+    # libre el lease, el siguiente barrido sí entra
+    assert _sweeper().run_once(force=True).leader
+    assert _row(key).verdict_ok is False
+
+
+def test_dns_unavailable_keeps_verdict_and_counts_error(client, make_url, target_denylist, monkeypatch):
+    key = make_url("https://resolver-down.example/")
+    before = _row(key)
+    real = revalidation.evaluate_target_url
+
+    def flaky(target_url, **kwargs):
+        if "resolver-down.example" in target_url:
+            raise DNSUnavailable()
+        return real(target_url, **kwargs)
+
+    monkeypatch.setattr(revalidation, "evaluate_target_url", flaky)
+    # aunque la política lo bloquee, sin respuesta del resolver no hay veredicto nuevo
+    target_denylist("resolver-down.example")
+    stats = _sweeper().run_once(force=True)
+    assert stats.leader
+    assert stats.errors == 1
+
+    after = _row(key)
+    assert after.verdict_ok is True and after.blocked_at is None
+    assert after.verdict_generation == before.verdict_generation
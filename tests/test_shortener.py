@@ -1 +1,95 @@
+# tests/test_shortener.py
 
+"""
+Endpoints principales con QUERY_BUDGET_STRICT=true (conftest.py): cada request
+que se pasa del @query_stats.budget de su endpoint lanza QueryBudgetExceeded.
+"""
+
+import pytest
+from sqlalchemy import select
+
+import crud
+import hll
+import main
+import models
+import query_stats
+import security
+from database import SessionLocal
+
+
+def test_budget_is_enforced():
+    db = SessionLocal()
+    try:
+        with pytest.raises(query_stats.QueryBudgetExceeded):
+            with query_stats.expect_queries(1):
+                db.execute(select(models.Tenant.id)).all()
+                db.execute(select(models.URL.id)).all()
+    finally:
+        db.close()
+
+
+def test_redirect_within_budget(client, make_url):
+    key = make_url()
+    r = client.get(f"/{key}", follow_redirects=False)
+    assert r.status_code == 307
+    assert r.headers["location"] == "https://example.com/page"
+
+
+def test_list_urls_within_budget(client, api_headers, make_url):
+    # más links que consultas permitidas: una consulta por link no cabe
+    keys = {make_url(f"https://example.com/{i}") for i in range(12)}
+    r = client.get("/api/urls", headers=api_headers)
+    assert r.status_code == 200, r.text
+    items = r.json()["items"]
+    assert {item["url"].rsplit("/", 1)[1] for item in items} == keys
+
+
+def _list_page_queries(db, tenant_id: int) -> int:
+    # lo mismo que hace GET /api/urls para una página
+    with query_stats.expect_queries(100) as acc:
+        items = crud.list_urls_for_tenant(db, tenant_id)
+        uniques = hll.unique_visitors_many(db, [u.id for u in items])
+        for u in items:
+            main.get_admin_info(u, uniques.get(u.id))
+    return acc.queries
+
+
+def test_list_urls_queries_do_not_grow_with_page(client, api_headers, make_url):
+    make_url()
+    db = SessionLocal()
+    try:
+        tenant_id = security.get_current_tenant(api_headers["x-api-key"], db).id
+        one = _list_page_queries(db, tenant_id)
+        for i in range(9):
+            make_url(f"https://example.com/n{i}")
+        db.expire_all()
+        assert _list_page_queries(db, tenant_id) == one
+    finally:
+        db.close()
+
+
+def test_get_url_within_budget(client, api_headers, make_url):
+    key = make_url()
+    r = client.get(f"/api/urls/{key}", headers=api_headers)
+    assert r.status_code == 200, r.text
+    assert r.json()["target_url"] == "https://example.com/page"
+
+    r = client.get("/api/urls/does-not-exist", headers=api_headers)
+    assert r.status_code == 404
+
+
+def test_get_current_tenant_single_query(client, api_headers):
+    raw_key = api_headers["x-api-key"]
+    db = SessionLocal()
+    try:
+        # primer uso: key + tenant en un join, la escritura de last_used_at
+        # y la recarga del tenant que expiró el commit
+        with query_stats.expect_queries(3):
+            tenant = security.get_current_tenant(raw_key, db)
+            tenant_id = tenant.id
+        # dentro de API_KEY_TOUCH_INTERVAL_SECONDS: solo el join
+        with query_stats.expect_queries(1):
+            tenant = security.get_current_tenant(raw_key, db)
+            assert tenant.id == tenant_id
+    finally:
+        db.close()
@@ -0,0 +1,121 @@
+# tests/test_target_verdicts.py
+
+"""Veredictos persistidos (urls.verdict_*): cuándo se reutilizan y cuándo se revalida."""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import update
+
+import main
+import models
+from database import SessionLocal
+from dns_cache import DNSUnavailable
+from target_validation import current_target_generation, stored_target_verdict
+
+
+@pytest.fixture
+def evaluations(monkeypatch):
+    """Llamadas a main.evaluate_target_url (al crear el link y al revalidar)."""
+    calls = []
+    real = main.evaluate_target_url
+
+    def counting(target_url, **kwargs):
+        calls.append(target_url)
+        return real(target_url, **kwargs)
+
+    monkeypatch.setattr(main, "evaluate_target_url", counting)
+    return calls
+
+
+def _row(key: str) -> models.URL:
+    db = SessionLocal()
+    try:
+        return db.query(models.URL).filter(models.URL.key == key).one()
+    finally:
+        db.close()
+
+
+def _set(key: str, **values) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(update(models.URL).where(models.URL.key == key).values(**values))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_stored_verdict_rules():
+    gen = current_target_generation()
+    later = datetime.utcnow() + timedelta(hours=1)
+    earlier = datetime.utcnow() - timedelta(seconds=1)
+
+    def row(ok, generation=gen, expires_at=later):
+        return SimpleNamespace(verdict_ok=ok, verdict_generation=generation, verdict_expires_at=expires_at)
+
+    assert stored_target_verdict(row(True)) is True
+    assert stored_target_verdict(row(False)) is False
+    assert stored_target_verdict(row(True, expires_at=None)) is True
+    assert stored_target_verdict(row(None)) is None
+    assert stored_target_verdict(row(True, generation=gen + 1)) is None
+    assert stored_target_verdict(row(True, expires_at=earlier)) is None
+
+
+def test_create_stores_verdict_and_redirect_reuses_it(client, make_url, evaluations):
+    key = make_url()
+    assert len(evaluations) == 1
+    evaluations.clear()
+    row = _row(key)
+    assert row.verdict_ok is True
+    assert row.verdict_generation == current_target_generation()
+
+    for _ in range(2):
+        assert client.get(f"/{key}", follow_redirects=False).status_code == 307
+    assert evaluations == []
+
+
+def test_policy_change_forces_revalidation(client, make_url, evaluations, target_denylist):
+    key = make_url("https://soon-blocked.example/x")
+    evaluations.clear()
+    assert client.get(f"/{key}", follow_redirects=False).status_code == 307
+    assert evaluations == []
+
+    target_denylist("soon-blocked.example")
+    r = client.get(f"/{key}", follow_redirects=False)
+    assert r.status_code == 410
+    assert evaluations == ["https://soon-blocked.example/x"]
+    row = _row(key)
+    assert row.verdict_ok is False and row.blocked_at is not None
+
+    # el veredicto nuevo vale para los siguientes
+    assert client.get(f"/{key}", follow_redirects=False).status_code == 410
+    assert len(evaluations) == 1
+
+
+def test_expired_verdict_forces_revalidation(client, make_url, evaluations):
+    key = make_url()
+    evaluations.clear()
+    _set(key, verdict_expires_at=datetime.utcnow() - timedelta(seconds=1))
+    assert client.get(f"/{key}", follow_redirects=False).status_code == 307
+    assert len(evaluations) == 1
+    assert client.get(f"/{key}", follow_redirects=False).status_code == 307
+    assert len(evaluations) == 1
+
+
+def test_dns_unavailable_keeps_last_verdict(client, make_url, monkeypatch):
+    def unavailable(target_url, **kwargs):
+        raise DNSUnavailable()
+
+    ok_key, blocked_key, unknown_key = make_url(), make_url(), make_url()
+    monkeypatch.setattr(main, "evaluate_target_url", unavailable)
+    # todos caducados: hay que revalidar y el resolver no contesta
+    _set(ok_key, verdict_generation=0)
+    _set(blocked_key, verdict_generation=0, verdict_ok=False)
+    _set(unknown_key, verdict_ok=None)
+
+    assert client.get(f"/{ok_key}", follow_redirects=False).status_code == 307
+    assert client.get(f"/{blocked_key}", follow_redirects=False).status_code == 410
+    # sin veredicto previo no hay nada que conservar
+    assert client.get(f"/{unknown_key}", follow_redirects=False).status_code == 503
+    assert _row(ok_key).verdict_generation == 0
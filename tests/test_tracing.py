@@ -0,0 +1,30 @@
+# tests/test_tracing.py
+
+"""Server-Timing solo para quien manda TRACE_TOKEN; sin traza, stage() es inerte."""
+
+import tracing
+from conftest import TRACE_TOKEN
+from config import settings
+
+
+def test_server_timing_only_with_trace_token(client, make_url):
+    key = make_url()
+
+    r = client.get(f"/{key}", headers={settings.trace_header: TRACE_TOKEN}, follow_redirects=False)
+    assert r.status_code == 307
+    timing = r.headers["server-timing"]
+    stages = [part.split(";")[0] for part in timing.split(", ")]
+    assert "db" in stages and stages[-1] == "total"
+
+    # token incorrecto o sin cabecera: no se exponen tiempos internos
+    for headers in ({settings.trace_header: "wrong"}, {settings.trace_header: TRACE_TOKEN + "x"}, {}):
+        r = client.get(f"/{key}", headers=headers, follow_redirects=False)
+        assert r.status_code == 307
+        assert "server-timing" not in r.headers
+
+
+def test_stage_without_trace_is_noop():
+    assert tracing.current() is None
+    with tracing.stage("db") as s:
+        pass
+    assert s is tracing._NOOP
@@ -0,0 +1,56 @@
+# tests/test_trending.py
+
+"""Resúmenes Space-Saving y su merge (trending.py)."""
+
+import random
+from collections import Counter
+
+import trending
+
+
+def _stream(n: int, seed: int) -> list[str]:
+    rnd = random.Random(seed)
+    # sesgado: unos pocos links con la mayoría de los clicks
+    return [f"k{min(int(rnd.paretovariate(1.2)), 500)}" for _ in range(n)]
+
+
+def _summary(stream, capacity: int) -> trending.SpaceSaving:
+    s = trending.SpaceSaving(capacity)
+    for key in stream:
+        s.add(key)
+    return s
+
+
+def test_space_saving_merge_bounds():
+    streams = [_stream(5000, seed) for seed in (6, 7, 8)]
+    truth = Counter(key for stream in streams for key in stream)
+    summaries = [trending._snapshot(_summary(stream, 20)) for stream in streams]
+    merged, floor = trending.merge(summaries, 20)
+
+    assert len(merged) == 20
+    for key, (count, error) in merged.items():
+        # count es cota superior y count - error cota inferior
+        assert count - error <= truth[key] <= count, key
+    # lo descartado no pudo superar el floor
+    for key, true_count in truth.items():
+        if key not in merged:
+            assert true_count <= floor, key
+    # las claves de verdad más frecuentes sobreviven
+    for key, _ in truth.most_common(3):
+        assert key in merged
+
+
+def test_space_saving_merge_floor_when_truncated():
+    a = ({"x": [10, 0], "y": [8, 0], "z": [3, 0]}, 0)
+    b = ({"w": [7, 0], "z": [2, 0]}, 0)
+    merged, floor = trending.merge([a, b], 2)
+    assert merged == {"x": [10, 0], "y": [8, 0]}
+    # z (5) y w (7) se recortaron: el floor es el menor count retenido
+    assert floor == 8
+
+
+def test_space_saving_merge_reapplies_floor():
+    merged, floor = trending.merge([({"x": [10, 0]}, 4), ({"y": [6, 1]}, 2)], 10)
+    # x pudo tener hasta 2 en el segundo resumen y y hasta 4 en el primero
+    assert merged == {"x": [12, 2], "y": [10, 5]}
+    assert floor == 6
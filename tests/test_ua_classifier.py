@@ -0,0 +1,60 @@
+# tests/test_ua_classifier.py
+
+"""Clasificación de user-agents y clicks que no cuentan (bots, previews)."""
+
+from sqlalchemy import select
+
+import models
+import ua_classifier
+from database import SessionLocal
+
+CHROME_DESKTOP = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36"
+)
+SAFARI_IPHONE = (
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148"
+)
+
+
+def test_preview_is_detected_before_bot():
+    # contienen "bot", pero generan la vista previa del link
+    for ua in ("Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)", "TelegramBot (like TwitterBot)"):
+        info = ua_classifier.classify(ua)
+        assert info.kind == ua_classifier.PREVIEW, ua
+        assert info.label == "preview" and not info.is_human
+
+
+def test_bots_and_missing_ua():
+    for ua in ("Googlebot/2.1 (+http://www.google.com/bot.html)", "curl/8.5.0", "python-requests/2.32"):
+        assert ua_classifier.classify(ua).kind == ua_classifier.BOT, ua
+    # sin UA nunca es un navegador
+    for ua in (None, ""):
+        info = ua_classifier.classify(ua)
+        assert info.kind == ua_classifier.BOT and not info.is_human
+
+
+def test_humans_by_device():
+    assert ua_classifier.classify(CHROME_DESKTOP).label == "desktop"
+    assert ua_classifier.classify(SAFARI_IPHONE).label == "mobile"
+    assert ua_classifier.classify(SAFARI_IPHONE).is_human
+
+
+def test_long_user_agents_share_a_cache_entry():
+    base = CHROME_DESKTOP + " x" * 400
+    ua_classifier.classify(base + " first")
+    hits = ua_classifier._cache.hits
+    # solo cuentan los primeros 512 caracteres
+    assert ua_classifier.classify(base + " second").label == "desktop"
+    assert ua_classifier._cache.hits == hits + 1
+
+
+def test_bot_clicks_are_not_counted(client, make_url):
+    key = make_url()
+    for ua in ("curl/8.5.0", "Slackbot-LinkExpanding 1.0", CHROME_DESKTOP):
+        assert client.get(f"/{key}", headers={"user-agent": ua}, follow_redirects=False).status_code == 307
+
+    db = SessionLocal()
+    try:
+        assert db.execute(select(models.URL.clicks).where(models.URL.key == key)).scalar_one() == 1
+    finally:
+        db.close()
@@ -0,0 +1,178 @@
+# tracing.py
+
+"""
+Trazas por request: cuánto tiempo se fue en cada etapa (BD, veredicto, DNS,
+GeoIP, auth...), en la cabecera Server-Timing y en una línea {"event":"trace"}.
+
+Se activa por request:
+- cabecera TRACE_HEADER con el valor de TRACE_TOKEN (para depurar en producción
+  sin exponer tiempos internos a cualquiera), o
+- muestreo aleatorio con TRACE_SAMPLE_RATE (0..1).
+
+Sin traza activa, stage() devuelve siempre el mismo objeto inerte y @traced
+llama directamente a la función: una lectura del contextvar y nada más.
+
+Uso:
+    with tracing.stage("db"):
+        ...
+
+    @tracing.traced("dns")
+    def resolve_host(...): ...
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import hmac
+import random
+import time
+from typing import Optional
+
+from config import settings
+from logger import log_event
+
+
+class Trace:
+    __slots__ = ("started", "stages")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # etapa -> [segundos acumulados, veces]
+        self.stages: dict[str, list] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        acc = self.stages.get(name)
+        if acc is None:
+            self.stages[name] = [seconds, 1]
+        else:
+            acc[0] += seconds
+            acc[1] += 1
+
+    def server_timing(self, total: float) -> str:
+        parts = [f"{name};dur={acc[0] * 1000:.2f}" for name, acc in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+    def as_fields(self) -> dict:
+        return {name: {"ms": round(acc[0] * 1000, 3), "n": acc[1]} for name, acc in self.stages.items()}
+
+
+# traza del request en curso; el contexto se copia al threadpool de Starlette
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+class _Stage:
+    __slots__ = ("trace", "name", "t0")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopStage()
+
+
+def stage(name: str):
+    """Context manager que mide una etapa si el request se está trazando."""
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return _Stage(trace, name)
+
+
+def traced(name: str):
+    """Decorador: mide cada llamada a la función como la etapa `name`."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                trace.add(name, time.perf_counter() - t0)
+
+        return wrapper
+
+    return decorator
+
+
+# -------------------------
+# Middleware
+# -------------------------
+
+def _wants_trace(scope) -> bool:
+    token = settings.trace_token
+    if token:
+        header = settings.trace_header.lower().encode("latin-1")
+        for name, value in scope.get("headers") or ():
+            if name == header:
+                # tiempo constante: la cabecera la controla el cliente
+                return hmac.compare_digest(value, token.encode("utf-8"))
+    rate = settings.trace_sample_rate
+    return rate > 0 and random.random() < rate
+
+
+class TracingMiddleware:
+    """ASGI puro: abre la traza, añade Server-Timing y registra el evento."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_trace(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _current.set(trace)
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+                total = time.perf_counter() - trace.started
+                headers = list(message.get("headers") or [])
+                headers.append((b"server-timing", trace.server_timing(total).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            log_event(
+                "trace",
+                method=scope.get("method", ""),
+                route=getattr(route, "path", None) or scope.get("path", ""),
+                status=status_holder[0],
+                total_ms=round((time.perf_counter() - trace.started) * 1000, 3),
+                stages=trace.as_fields(),
+            )
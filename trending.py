@@ -0,0 +1,230 @@
+# trending.py
+
+"""
+Links en tendencia (top-K) con un sketch Space-Saving por ventana de tiempo.
+
+ORDER BY clicks sobre urls es caro y solo da el acumulado histórico. Aquí el
+redirect alimenta, en memoria y por worker, resúmenes Space-Saving de capacidad
+fija: como mucho TRENDING_CAPACITY claves por bucket, tenga el sistema 1k o
+10M links.
+
+- Global y por tenant (los tenants en una LRU de TRENDING_MAX_TENANTS).
+- Ventanas deslizantes: 1m (buckets de 10 s), 15m y 1h (buckets de 1 min).
+- count es una cota superior; count - error es una cota inferior garantizada.
+
+Consultar una ventana fusiona los buckets ya cerrados una sola vez (se cachea
+hasta que rota el bucket) con el bucket en curso: O(capacidad) por consulta,
+independiente del número de links.
+"""
+
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+from typing import Hashable, Optional
+
+from caches import LRUCache
+from config import settings
+
+
+class SpaceSaving:
+    """Resumen Space-Saving (Metwally et al.): k contadores para los heavy hitters."""
+
+    __slots__ = ("capacity", "counts", "_heap")
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self.counts: dict[Hashable, list[int]] = {}  # clave -> [count, error]
+        # min-heap perezoso de (count, clave); las entradas obsoletas se
+        # descartan al desalojar y el heap se reconstruye si crece demasiado
+        self._heap: list[tuple[int, Hashable]] = []
+
+    def add(self, key: Hashable, weight: int = 1) -> None:
+        entry = self.counts.get(key)
+        if entry is not None:
+            entry[0] += weight
+            self._push(entry[0], key)
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = [weight, 0]
+            self._push(weight, key)
+            return
+        # lleno: la clave nueva hereda el contador mínimo (y lo anota como error)
+        min_count, min_key = self._pop_min()
+        del self.counts[min_key]
+        self.counts[key] = [min_count + weight, min_count]
+        self._push(min_count + weight, key)
+
+    def min_count(self) -> int:
+        if len(self.counts) < self.capacity:
+            return 0
+        count, key = self._peek_min()
+        return count
+
+    def _push(self, count: int, key: Hashable) -> None:
+        heapq.heappush(self._heap, (count, key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(entry[0], k) for k, entry in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _peek_min(self) -> tuple[int, Hashable]:
+        heap = self._heap
+        while True:
+            count, key = heap[0]
+            entry = self.counts.get(key)
+            if entry is not None and entry[0] == count:
+                return count, key
+            heapq.heappop(heap)
+
+    def _pop_min(self) -> tuple[int, Hashable]:
+        item = self._peek_min()
+        heapq.heappop(self._heap)
+        return item
+
+
+def merge(summaries, capacity: int) -> tuple[dict[Hashable, list[int]], int]:
+    """
+    Fusiona resúmenes (counts, floor) en {clave: [count, error]} recortado a
+    `capacity`, y devuelve también el floor del resultado.
+
+    Una clave ausente de un resumen lleno pudo tener hasta su mínimo ahí:
+    ese mínimo se suma al error (count sigue siendo cota superior). Si se
+    recorta, las claves descartadas pudieron tener hasta el menor count
+    retenido: ese es el floor con el que hay que volver a fusionar el resultado.
+    """
+    summaries = [s for s in summaries if s]
+    total_floor = sum(floor for _, floor in summaries)
+    merged: dict[Hashable, list[int]] = {}
+    seen_floor: dict[Hashable, int] = {}
+    for counts, floor in summaries:
+        for key, (count, error) in counts.items():
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = [count, error]
+                seen_floor[key] = floor
+            else:
+                entry[0] += count
+                entry[1] += error
+                seen_floor[key] += floor
+    if total_floor:
+        for key, entry in merged.items():
+            missing = total_floor - seen_floor[key]
+            entry[0] += missing
+            entry[1] += missing
+    floor = total_floor
+    if len(merged) > capacity:
+        merged = dict(heapq.nlargest(capacity, merged.items(), key=lambda kv: kv[1][0]))
+        floor = max(floor, min(entry[0] for entry in merged.values()))
+    return merged, floor
+
+
+def _snapshot(summary: SpaceSaving) -> tuple[dict, int]:
+    # merge() no modifica sus entradas: no hace falta copiar
+    return summary.counts, summary.min_count()
+
+
+class WindowedTopK:
+    """Anillo de `slots` buckets de `slot_seconds`, cada uno un SpaceSaving."""
+
+    def __init__(self, capacity: int, slot_seconds: int, slots: int):
+        self.capacity = capacity
+        self.slot_seconds = slot_seconds
+        self.slots = slots
+        self._ring: list[Optional[tuple[int, SpaceSaving]]] = [None] * slots
+        # (bucket actual, nº de buckets) -> (fusión de los buckets ya cerrados, floor)
+        self._closed: dict[tuple[int, int], tuple[dict, int]] = {}
+
+    def add(self, key: Hashable, now: float) -> None:
+        idx = int(now // self.slot_seconds)
+        pos = idx % self.slots
+        slot = self._ring[pos]
+        if slot is None or slot[0] != idx:
+            slot = self._ring[pos] = (idx, SpaceSaving(self.capacity))
+            self._closed.clear()
+        slot[1].add(key)
+
+    def window(self, n_slots: int, now: float) -> dict[Hashable, list[int]]:
+        cur = int(now // self.slot_seconds)
+        closed = self._closed.get((cur, n_slots))
+        if closed is None:
+            closed = merge(
+                (
+                    _snapshot(slot[1])
+                    for slot in self._ring
+                    if slot is not None and cur - n_slots < slot[0] < cur
+                ),
+                self.capacity,
+            )
+            self._closed[(cur, n_slots)] = closed
+        current = self._ring[cur % self.slots]
+        if current is None or current[0] != cur:
+            return closed[0]
+        return merge([closed, _snapshot(current[1])], self.capacity)[0]
+
+
+# ventana -> (anillo, nº de buckets)
+WINDOWS = {"1m": ("fine", 6), "15m": ("coarse", 15), "1h": ("coarse", 60)}
+
+
+class _Rings:
+    __slots__ = ("fine", "coarse")
+
+    def __init__(self, capacity: int):
+        self.fine = WindowedTopK(capacity, 10, 6)
+        self.coarse = WindowedTopK(capacity, 60, 60)
+
+    def add(self, key: Hashable, now: float) -> None:
+        self.fine.add(key, now)
+        self.coarse.add(key, now)
+
+
+class TrendingTracker:
+    def __init__(self, *, capacity: int, tenant_capacity: int, max_tenants: int):
+        self.capacity = capacity
+        self.tenant_capacity = tenant_capacity
+        self._global = _Rings(capacity)
+        self._tenants = LRUCache(max_tenants)
+        self._lock = threading.Lock()
+
+    def record(self, url_key: str, tenant_id: Optional[int], now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._global.add(url_key, now)
+            if tenant_id is not None:
+                rings = self._tenants.get(tenant_id)
+                if rings is None:
+                    rings = _Rings(self.tenant_capacity)
+                    self._tenants.set(tenant_id, rings)
+                rings.add(url_key, now)
+
+    def top(self, window: str, k: int, *, tenant_id: Optional[int] = None, now: Optional[float] = None) -> list[dict]:
+        ring_name, n_slots = WINDOWS[window]
+        now = time.time() if now is None else now
+        with self._lock:
+            if tenant_id is None:
+                rings = self._global
+            else:
+                rings = self._tenants.get(tenant_id)
+                if rings is None:
+                    return []
+            counts = getattr(rings, ring_name).window(n_slots, now)
+            best = heapq.nlargest(k, counts.items(), key=lambda kv: kv[1][0])
+        return [{"key": key, "count": count, "error": error} for key, (count, error) in best]
+
+
+tracker = TrendingTracker(
+    capacity=settings.trending_capacity,
+    tenant_capacity=settings.trending_tenant_capacity,
+    max_tenants=settings.trending_max_tenants,
+)
+
+
+def record(url_key: str, tenant_id: Optional[int]) -> None:
+    """Hot path del redirect."""
+    if settings.trending_enabled:
+        tracker.record(url_key, tenant_id)
+
+
+def top(window: str = "1m", k: int = 20, *, tenant_id: Optional[int] = None) -> list[dict]:
+    return tracker.top(window, k, tenant_id=tenant_id)
@@ -0,0 +1,101 @@
+# ua_classifier.py
+
+"""
+Clasificación del user-agent: persona, bot/crawler o "preview fetcher" (los
+que generan la vista previa de un link en chats y redes sociales).
+
+Los mismos UAs se repiten muchísimo (cada app de chat, cada navegador), así
+que el resultado se guarda en una LRU acotada por UA (UA_CACHE_SIZE): un UA ya
+visto cuesta un lookup en un dict. Un UA nuevo, una sola búsqueda con una
+expresión regular por categoría sobre el UA en minúsculas.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+from caches import MISSING, LRUCache, LRUHandle, register
+from config import settings
+
+
+HUMAN = "human"
+BOT = "bot"
+PREVIEW = "preview"
+
+# Generan la vista previa del link (Open Graph): piden la URL una vez por
+# conversación / publicación, no son visitas
+_PREVIEW_MARKERS = (
+    "facebookexternalhit", "facebookcatalog", "meta-externalagent", "twitterbot",
+    "slackbot", "slack-imgproxy", "discordbot", "telegrambot", "whatsapp",
+    "linkedinbot", "skypeuripreview", "microsoft preview", "pinterestbot",
+    "redditbot", "vkshare", "iframely", "embedly", "mastodon", "bluesky",
+    "google-pagerenderer",
+)
+_BOT_MARKERS = (
+    "bot", "crawler", "spider", "slurp", "curl", "wget", "python-requests",
+    "python-urllib", "aiohttp", "httpx", "go-http", "okhttp", "java/", "libwww",
+    "scrapy", "axios", "node-fetch", "headless", "lighthouse", "phantomjs",
+    "monitor", "uptime", "pingdom", "checker", "feedfetcher",
+)
+_MOBILE_MARKERS = ("mobile", "android", "iphone", "ipad")
+
+_PREVIEW_RE = re.compile("|".join(map(re.escape, _PREVIEW_MARKERS)))
+_BOT_RE = re.compile("|".join(map(re.escape, _BOT_MARKERS)))
+_MOBILE_RE = re.compile("|".join(map(re.escape, _MOBILE_MARKERS)))
+
+# UAs más largos no aportan nada a la clasificación y no deben inflar la caché
+_MAX_UA_LEN = 512
+
+
+@dataclass(frozen=True)
+class UAInfo:
+    kind: str  # human | bot | preview
+    device: Optional[str] = None  # mobile | desktop (solo personas)
+
+    @property
+    def is_human(self) -> bool:
+        return self.kind == HUMAN
+
+    @property
+    def label(self) -> str:
+        """Valor de click_events.ua_class: bot | preview | mobile | desktop."""
+        return self.device if self.kind == HUMAN else self.kind
+
+
+_NO_UA = UAInfo(BOT)
+
+
+def _classify(u: str) -> UAInfo:
+    # preview antes que bot: "Slackbot-LinkExpanding" es una vista previa
+    if _PREVIEW_RE.search(u):
+        return UAInfo(PREVIEW)
+    if _BOT_RE.search(u):
+        return UAInfo(BOT)
+    return UAInfo(HUMAN, "mobile" if _MOBILE_RE.search(u) else "desktop")
+
+
+_cache = LRUCache(settings.ua_cache_size)
+register(LRUHandle("user_agents", _cache, "user-agent -> clase (persona / bot / preview)"))
+_seen: Counter = Counter()
+
+
+def classify(ua: Optional[str]) -> UAInfo:
+    # sin UA: scripts y clientes HTTP a pelo, nunca un navegador
+    if not ua:
+        info = _NO_UA
+    else:
+        ua = ua[:_MAX_UA_LEN]
+        info = _cache.get(ua, MISSING)
+        if info is MISSING:
+            info = _classify(ua.lower())
+            _cache.set(ua, info)
+    # contador aproximado (sin lock): solo informativo
+    _seen[info.kind] += 1
+    return info
+
+
+def stats() -> dict:
+    return {"by_kind": dict(_seen), "cache": _cache.stats()}
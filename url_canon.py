@@ -0,0 +1,103 @@
+# url_canon.py
+
+"""
+Canonicalizador único de target_url.
+
+Antes, crear un link parseaba el destino varias veces (AnyUrl en schemas,
+str(), urlsplit en target_validation) y normalizaba el host a IDNA en tres
+sitios distintos. Aquí se hace UNA pasada que devuelve todo lo que necesitan
+schemas, target_validation, crud y policy_impact:
+
+    (scheme, host_ascii, ip_literal, url canónica)
+
+- Resultado cacheado por URL (LRU): el redirect y la revalidación vuelven a
+  ver las mismas URLs guardadas una y otra vez.
+- La normalización IDNA del host es policy_lists.normalize_host (también LRU),
+  compartida con la compilación y el matching de las listas.
+
+Los errores son ValueError con el mismo mensaje que devolvía validate_target_url
+("target_url ..."), para poder convertirlos directamente en un 400.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urlsplit
+
+from caches import FunctionCacheHandle, register
+from config import settings
+from policy_lists import ip_to_int, normalize_host
+
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_WHITESPACE = (" ", "\t", "\n", "\r")
+
+
+@dataclass(frozen=True)
+class CanonicalURL:
+    scheme: str
+    host_ascii: str
+    # (version, entero) si el host es una IP literal
+    ip_literal: Optional[tuple[int, int]]
+    # scheme://host[:puerto]/ruta?query#fragment, host en IDNA minúsculas
+    url: str
+
+
+def canonicalize(raw_url: str) -> CanonicalURL:
+    """Parsea y normaliza raw_url en una sola pasada (cacheado)."""
+    return _canonicalize(str(raw_url).strip())
+
+
+@lru_cache(maxsize=16384)
+def _canonicalize(s: str) -> CanonicalURL:
+    if not s:
+        raise ValueError("target_url is empty")
+    if len(s) > settings.max_target_url_length:
+        raise ValueError("target_url too long")
+    if any(c in s for c in _WHITESPACE):
+        raise ValueError("target_url contains whitespace")
+
+    parts = urlsplit(s)
+
+    if parts.scheme not in _DEFAULT_PORTS:
+        raise ValueError("target_url scheme must be http or https")
+    if not parts.hostname:
+        raise ValueError("target_url must include a host")
+    if parts.username is not None or parts.password is not None:
+        raise ValueError("target_url must not contain credentials")
+    try:
+        port = parts.port
+    except ValueError:
+        raise ValueError("target_url port is invalid") from None
+
+    host_ascii = normalize_host(parts.hostname)
+    ip_literal = ip_to_int(host_ascii)
+
+    netloc = f"[{host_ascii}]" if ip_literal is not None and ip_literal[0] == 6 else host_ascii
+    if port is not None and port != _DEFAULT_PORTS[parts.scheme]:
+        netloc = f"{netloc}:{port}"
+
+    url = f"{parts.scheme}://{netloc}{parts.path or '/'}"
+    if parts.query:
+        url = f"{url}?{parts.query}"
+    if parts.fragment:
+        url = f"{url}#{parts.fragment}"
+
+    return CanonicalURL(parts.scheme, host_ascii, ip_literal, url)
+
+
+def host_of(raw_url: str) -> Optional[str]:
+    """host_ascii de raw_url, o None si no es una target_url válida."""
+    try:
+        return canonicalize(raw_url).host_ascii
+    except ValueError:
+        return None
+
+
+def cache_info():
+    return _canonicalize.cache_info()
+
+
+register(FunctionCacheHandle("url_canon", _canonicalize, "target_url -> URL canónica"))